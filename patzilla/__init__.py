@@ -107,7 +107,14 @@ def web(global_config, **settings):
 
     # Register application addons.
     config.include("patzilla.util.web.pyramid")
+    config.include("patzilla.util.database.beaker_mongodb")
     config.include("patzilla.util.database.beaker_mongodb_gridfs")
+    config.include("patzilla.util.cache.memory")
+    config.include("patzilla.util.cache.compression")
+    config.include("patzilla.util.cache.serializer")
+    config.include("patzilla.util.cache.local")
+    config.include("patzilla.util.cache.blobstore")
+    config.include("patzilla.util.image.convert")
 
     # Register application components.
     config.include("patzilla.util.web.identity")
@@ -32,4 +32,5 @@ def includeme(config):
         config.include("patzilla.access.sip.clientpool")
     """
 
+    config.include(".generic.pdf")
     config.include('.office')
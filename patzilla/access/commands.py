@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+About
+=====
+Manage the cache of the data source adapters from the command line.
+
+Synopsis
+========
+Prefetch artifacts of documents listed within a file, separated by commas or newlines::
+
+    export PATZILLA_CONFIG=/etc/patzilla/production.ini
+    patzilla cache warm --numbers=numbers.txt
+
+Prefetch selected artifacts of the results of OPS CQL query expressions, one per line::
+
+    patzilla cache warm --queries=queries.txt --artifact=biblio --artifact=drawing
+
+Convert cache entries written by previous versions, so the MongoDB cache backend will expire them::
+
+    patzilla cache migrate
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import click
+
+from patzilla.access.drawing import get_drawing_png
+from patzilla.access.epo.ops.api import get_ops_biblio_data, get_ops_biblio_data_many, get_ops_client, \
+    inquire_images, ops_claims, ops_description, ops_document_kindcodes, ops_document_kindcodes_many, \
+    ops_published_data_crawl
+from patzilla.access.generic.pdf import pdf_universal
+from patzilla.boot.config import BootConfiguration
+from patzilla.boot.framework import pyramid_setup
+from patzilla.navigator.services import cql_prepare_query
+from patzilla.util.config import get_configfile_from_commandline
+from patzilla.util.data.container import jd, jpath
+from patzilla.util.database.beaker_mongodb import migrate_regions
+from patzilla.util.numbers.numberlists import normalize_numbers, parse_numberlist
+from patzilla.util.python.concurrency import concurrent_map
+
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch_pdf(document):
+    response = pdf_universal(document)
+    if not response.success:
+        raise KeyError('No PDF document for {}'.format(document))
+
+
+# Prefetch artifacts like the corresponding web services request them, so they will share cache entries.
+PREFETCHERS = OrderedDict([
+    ('biblio', lambda document: get_ops_biblio_data('publication', document)),
+    ('kindcodes', ops_document_kindcodes),
+    ('images', inquire_images),
+    ('drawing', lambda document: get_drawing_png(document, 1, 'FullDocumentDrawing')),
+    ('claims', ops_claims),
+    ('description', ops_description),
+    ('pdf', prefetch_pdf),
+])
+
+# The number of documents to prefetch per query expression.
+QUERY_LIMIT_DEFAULT = 500
+
+
+def read_numbers(text):
+    """
+    Read document numbers separated by commas or newlines, skipping invalid ones.
+    """
+    numbers = normalize_numbers([entry for entry in parse_numberlist(text) if entry])
+    for entry in numbers['invalid']:
+        logger.warning('Skipping invalid document number "{}"'.format(entry))
+    return numbers['valid']
+
+
+def read_queries(text):
+    """
+    Read query expressions, one per line, skipping empty lines and comments.
+    """
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+
+
+def query_numbers(expression, limit=QUERY_LIMIT_DEFAULT):
+    """
+    Crawl the publication numbers of the results of an OPS CQL query expression.
+    """
+    search = cql_prepare_query(expression)
+    result = ops_published_data_crawl('pub-number', search.expression, 100, limit=limit)
+    numbers = jpath('/ops:world-patent-data/ops:biblio-search/ops:search-result/publication-numbers', result)
+    return list(numbers or [])
+
+
+def warm_cache(numbers, artifacts=None, max_workers=None, progress=None):
+    """
+    Prefetch artifacts of documents into the cache.
+
+    Requests are submitted concurrently, using ``max_workers`` threads,
+    which defaults to the concurrency configured for the OPS client. Its
+    request scheduler will meter the requests according to the throttling
+    information announced by OPS.
+
+    ``progress`` will be invoked with the document number, the artifact name
+    and whether prefetching succeeded, after each artifact. Returns the
+    number of successful and failed prefetches per artifact.
+    """
+    artifacts = list(artifacts or PREFETCHERS)
+    if max_workers is None:
+        max_workers = get_ops_client().max_concurrency
+
+    # Acquire bibliographic data and kind codes in bulk, warming the cache for the individual requests.
+    if 'biblio' in artifacts or 'kindcodes' in artifacts:
+        try:
+            if 'kindcodes' in artifacts:
+                ops_document_kindcodes_many(numbers)
+            else:
+                get_ops_biblio_data_many('publication', numbers)
+        except Exception as ex:
+            logger.warning('Prefetching bibliographic data in bulk failed: {}'.format(ex))
+
+    lock = threading.Lock()
+
+    def prefetch(task):
+        document, artifact = task
+        try:
+            PREFETCHERS[artifact](document)
+            success = True
+        except Exception as ex:
+            logger.warning('Prefetching "{}" of document {} failed: {}'.format(artifact, document, ex))
+            success = False
+        if progress is not None:
+            with lock:
+                progress(document, artifact, success)
+        return success
+
+    tasks = [(document, artifact) for document in numbers for artifact in artifacts]
+    outcomes = concurrent_map(prefetch, tasks, max_workers=max_workers)
+
+    report = OrderedDict((artifact, {'success': 0, 'failed': 0}) for artifact in artifacts)
+    for (document, artifact), success in zip(tasks, outcomes):
+        report[artifact]['success' if success else 'failed'] += 1
+    return report
+
+
+@click.group(name="cache")
+@click.pass_context
+def cache_cli(ctx):
+    """
+    Manage the cache of the data source adapters.
+    """
+
+    # Create a Pyramid runtime environment.
+    env = pyramid_setup(
+        configfile=get_configfile_from_commandline(),
+        bootconfiguration=BootConfiguration(datasources=["ops"]),
+    )
+
+    # Propagate reference to the environment to the Click context.
+    ctx.meta["pyramid_env"] = env
+
+
+@click.command(name="warm")
+@click.option("--numbers", "numbers_file", type=click.File("r"), required=False,
+              help="File with document numbers, separated by commas or newlines")
+@click.option("--queries", "queries_file", type=click.File("r"), required=False,
+              help="File with OPS CQL query expressions, one per line")
+@click.option("--artifact", "artifacts", type=click.Choice(list(PREFETCHERS)), multiple=True,
+              help="Which artifact to prefetch, can be used multiple times. Default: all")
+@click.option("--limit", type=int, default=QUERY_LIMIT_DEFAULT,
+              help="Number of documents to prefetch per query expression")
+@click.option("--concurrency", type=int, required=False,
+              help="Number of concurrent requests. Default: The concurrency of the OPS client")
+@click.pass_context
+def warm(ctx, numbers_file, queries_file, artifacts, limit, concurrency):
+    """
+    Prefetch biblio data, kind codes, image information, first drawings,
+    claims, descriptions and PDF documents into the cache.
+    """
+    if not numbers_file and not queries_file:
+        raise click.UsageError("Use --numbers or --queries")
+
+    numbers = []
+    if numbers_file:
+        numbers += read_numbers(numbers_file.read())
+    if queries_file:
+        for expression in read_queries(queries_file.read()):
+            logger.info('Crawling results of query "{}"'.format(expression))
+            numbers += query_numbers(expression, limit=limit)
+    numbers = list(OrderedDict.fromkeys(numbers))
+
+    artifacts = list(artifacts or PREFETCHERS)
+    logger.info('Prefetching {} of {} documents'.format(', '.join(artifacts), len(numbers)))
+    with click.progressbar(length=len(numbers) * len(artifacts), label="Warming cache", file=click.get_text_stream("stderr")) as bar:
+        report = warm_cache(
+            numbers, artifacts=artifacts, max_workers=concurrency,
+            progress=lambda document, artifact, success: bar.update(1))
+
+    print(jd(report))
+
+
+@click.command(name="migrate")
+@click.pass_context
+def migrate(ctx):
+    """
+    Convert the expiration time of cache entries written by
+    previous versions, so the MongoDB cache backend will expire them.
+    """
+    print(jd(migrate_regions()))
+
+
+cache_cli.add_command(cmd=warm)
+cache_cli.add_command(cmd=migrate)
@@ -8,8 +8,8 @@ import json
 import timeit
 import logging
 import requests
-from beaker.cache import cache_region
 from requests import RequestException
+from patzilla.util.cache.instrumentation import cache_region
 from patzilla.access.depatech import get_depatech_client
 from patzilla.access.generic.exceptions import NoResultsException, GenericAdapterException, SearchException
 from patzilla.access.generic.search import GenericSearchResponse, GenericSearchClient
@@ -10,8 +10,10 @@ from configparser import NoOptionError
 from lxml import etree as ET
 from lxml.builder import E
 from cornice.util import to_list
-from beaker.cache import cache_region, region_invalidate
+from beaker.cache import region_invalidate
 from pyramid.httpexceptions import HTTPNotFound
+from patzilla.util.cache.blobstore import blob_cache
+from patzilla.util.cache.instrumentation import cache_region
 from patzilla.util.network.requests_xmlrpclib import RequestsTransport
 from patzilla.util.numbers.normalize import normalize_patent, depatisconnect_alternatives
 from patzilla.util.web.util.xmlrpclib import XmlRpcTimeoutServer
@@ -88,6 +90,7 @@ def fetch_xml(number):
 def fetch_pdf(number, attempt=1):
     return fetch_pdf_real(number)
 
+@blob_cache('pdf-dpma', content_type='application/pdf')
 @cache_region('static')
 def fetch_pdf_real(number):
 
@@ -10,7 +10,6 @@ import time
 import logging
 import operator
 import mechanicalsoup
-from beaker.cache import cache_region
 from munch import munchify
 from docopt import docopt
 from pprint import pformat
@@ -18,6 +17,7 @@ from jsonpointer import JsonPointer, JsonPointerException
 from xml.etree.ElementTree import fromstring
 from bs4 import BeautifulSoup
 from collections import namedtuple, OrderedDict
+from patzilla.util.cache.instrumentation import cache_region
 from patzilla.access.dpma.util import dpma_file_number
 from patzilla.boot.cache import configure_cache_backend
 from patzilla.util.config import to_list
@@ -2,12 +2,15 @@
 # (c) 2013-2018 Andreas Motl <andreas.motl@ip-tools.org>
 import logging
 from six import BytesIO
-from beaker.cache import cache_region
 from pyramid.httpexceptions import HTTPNotFound
 
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.cache.blobstore import blob_cache
+from patzilla.util.cache.negative import negative_cache
+from patzilla.util.cache.singleflight import single_flight
 from patzilla.util.numbers.common import split_patent_number
 from patzilla.util.numbers.normalize import normalize_patent
-from patzilla.util.image.convert import to_png
+from patzilla.util.image.convert import to_image, to_png
 from patzilla.access.epo.ops.api import get_ops_image
 from patzilla.access.uspto.image import fetch_first_drawing as get_uspto_image
 from patzilla.access.cipo.drawing import fetch_first_drawing as get_cipo_image
@@ -16,8 +19,54 @@ log = logging.getLogger(__name__)
 
 # TODO: Refactor to patzilla.access.composite.drawing
 
+# Widths of drawing derivatives. Requested widths are rounded up to the next
+# available one, in order to limit the number of variants within the cache.
+DRAWING_WIDTHS = [150, 300, 600, 1200]
+
+# Image formats of drawing derivatives.
+DRAWING_FORMATS = ['png', 'webp', 'jpeg']
+
+
+@single_flight
+@blob_cache('drawing', content_type='image/png')
 @cache_region('longer')
 def get_drawing_png(document, page, kind):
+    return to_png(BytesIO(get_drawing_source(document, page, kind)))
+
+
+@single_flight
+@blob_cache('drawing')
+@cache_region('longer')
+def get_drawing_variant(document, page, kind, width, format):
+    """
+    Derive a drawing in the designated image format and width from its original TIFF image.
+    Each variant will be cached separately.
+    """
+    return to_image(get_drawing_source(document, page, kind), format=format, width=width)
+
+
+def drawing_width(width):
+    """
+    Round up a requested width to the next width of ``DRAWING_WIDTHS``.
+
+    >>> drawing_width(200)
+    300
+    >>> drawing_width(5000)
+    1200
+    """
+    for candidate in DRAWING_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return DRAWING_WIDTHS[-1]
+
+
+@negative_cache(HTTPNotFound)
+@single_flight
+@cache_region('longer')
+def get_drawing_source(document, page, kind):
+    """
+    Acquire the original drawing image, usually a TIFF image.
+    """
 
     # 2. Try to fetch drawing from OPS, fall back to other patent offices
     try:
@@ -51,14 +100,12 @@ def get_drawing_png(document, page, kind):
         log.warn(msg)
         raise HTTPNotFound(msg)
 
-    # 4. Convert image from TIFF to PNG format
-    payload = to_png(BytesIO(payload))
-
     return payload
 
 class PayloadEmpty(Exception):
     pass
 
+@negative_cache(PayloadEmpty)
 @cache_region('longer')
 def get_uspto_image_cached(document_id):
     payload = get_uspto_image(document_id)
@@ -67,6 +114,7 @@ def get_uspto_image_cached(document_id):
     else:
         raise PayloadEmpty('No payload')
 
+@negative_cache(PayloadEmpty)
 @cache_region('longer')
 def get_cipo_image_cached(document_id):
     payload = get_cipo_image(document_id)
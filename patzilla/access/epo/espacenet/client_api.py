@@ -7,7 +7,7 @@ https://worldwide.espacenet.com/
 import logging
 
 import requests
-from beaker.cache import cache_region
+from patzilla.util.cache.instrumentation import cache_region
 
 from patzilla.util.config import to_list
 from patzilla.util.data.container import jpath
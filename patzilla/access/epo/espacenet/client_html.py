@@ -7,9 +7,9 @@ https://worldwide.espacenet.com/
 import logging
 
 import requests
-from beaker.cache import cache_region
 from bs4 import BeautifulSoup
 
+from patzilla.util.cache.instrumentation import cache_region
 from patzilla.util.network.browser import regular_user_agent
 from patzilla.util.numbers.normalize import normalize_patent
 
@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
 # (c) 2013-2022 Andreas Motl <andreas.motl@ip-tools.org>
 import operator
-import time
 import logging
+import threading
 from collections import OrderedDict
+from copy import deepcopy
 from pprint import pformat
 from contextlib import contextmanager
 
 import epo_ops
 from cornice.util import json_error, to_list
-from beaker.cache import cache_region
+from lxml import etree
 from simplejson.scanner import JSONDecodeError
 from jsonpointer import JsonPointer, resolve_pointer, set_pointer, JsonPointerException
 from pyramid.threadlocal import get_current_request
@@ -18,11 +19,19 @@ from pyramid.httpexceptions import HTTPNotFound, HTTPError, HTTPBadRequest, HTTP
 from patzilla.access.epo.ops.model import OpsFamilyAwareSearchResult
 from patzilla.navigator.util import object_attributes_to_dict
 from patzilla.util.data.container import jpath
-from patzilla.util.image.convert import pdf_join, pdf_set_metadata, pdf_make_metadata
+from patzilla.util.image.convert import pdf_assemble
 from patzilla.access.generic.exceptions import NoResultsException
 from patzilla.util.numbers.common import decode_patent_number, split_patent_number
 from patzilla.util.numbers.common import encode_epodoc_number, encode_docdb_number
 from patzilla.util.numbers.normalize import normalize_patent
+from patzilla.util.cache.blobstore import blob_cache
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.cache.keys import canonical_cache_region
+from patzilla.util.cache.negative import negative_cache
+from patzilla.util.cache.region import region_enabled, region_get, region_put
+from patzilla.util.cache.singleflight import single_flight
+from patzilla.util.cache.stale import stale_while_revalidate
+from patzilla.util.python.concurrency import concurrent_map
 
 log = logging.getLogger(__name__)
 
@@ -32,6 +41,12 @@ OPS_API_URI         = 'https://ops.epo.org/3.2/rest-services'
 OPS_AUTH_URI        = 'https://ops.epo.org/3.2/auth'
 OPS_DEVELOPERS_URI  = 'https://ops.epo.org/3.2/developers'
 
+# XML namespace of bibliographic data documents.
+OPS_EXCHANGE_NAMESPACE = 'http://www.epo.org/exchange'
+
+# Maximum number of documents to request per bulk retrieval of bibliographic data.
+OPS_BIBLIO_BATCH_SIZE = 100
+
 # values of these indexes will be considered keywords
 ops_keyword_fields = [
 
@@ -73,24 +88,20 @@ def get_ops_client():
 
 @contextmanager
 def ops_client(xml=False):
-
-    # FIXME: Better use "accept_type" on a per-request basis supported by ``python-epo-ops-client``.
-
-    # Acquire OPS client instance.
+    """
+    Acquire OPS client instance, accepting XML or JSON
+    for all requests submitted within this context.
+    """
     ops = get_ops_client()
-
-    try:
-        # Conditionally switch to XML.
-        if xml:
-            ops.accept_type = 'application/xml'
+    accept_type = 'application/xml' if xml else 'application/json'
+    with ops.accept(accept_type):
         yield ops
 
-    # Reset to default content type.
-    finally:
-        ops.accept_type = 'application/json'
 
-
-@cache_region('search', 'ops_search')
+@negative_cache(NoResultsException, HTTPError)
+@stale_while_revalidate
+@single_flight
+@canonical_cache_region('search', 'ops_search')
 def ops_published_data_search_swap_family(constituents, query, range):
     """
     Run a search on EPO OPS, with adjustments to the selection of
@@ -144,6 +155,7 @@ def results_swap_family_members(response):
 
     # A.1 compute distinct list with unique families
     chunks = to_list(pointer_results.resolve(response))
+    candidates = []
     for chunk in chunks:
 
         #print 'chunk:', chunk
@@ -170,15 +182,37 @@ def results_swap_family_members(response):
         #print( 'representation_pubref_epodoc:', representation_pubref_epodoc)
         #print 'representation_pubrefs_docdb:', representation_pubrefs_docdb
 
-        # Fetch family members. When failing, use first cycle as representation.
+        family_id = representation.get('@family-id')
+        candidates.append((chunk, representation, representation_pubref_epodoc, representation_pubrefs_docdb, family_id))
+
+    # A.2 Fetch family members of all documents at once. Documents of the same family
+    # will share a single lookup, which is also remembered across result pages.
+    lookups = OrderedDict()
+    for chunk, representation, representation_pubref_epodoc, _, family_id in candidates:
+        lookups.setdefault(family_id or representation_pubref_epodoc, (family_id, representation_pubref_epodoc))
+
+    def fetch_family(lookup):
+        family_id, document_number = lookup
         try:
-            family_info = ops_family_members(representation_pubref_epodoc)
-            #print "family_info:", family_info
+            return ops_family_members_by_family_id(family_id, document_number)
         except:
-            log.warning('Failed to fetch family information for %s', representation_pubref_epodoc)
+            log.warning('Failed to fetch family information for %s', document_number)
+
+    family_infos = dict(zip(lookups.keys(), concurrent_map(
+        fetch_family, lookups.values(), max_workers=get_ops_client().max_concurrency)))
+
+    # Fetching family members failed for some documents, the errors have been logged.
+    if None in family_infos.values():
+        request = get_current_request()
+        del request.errors[:]
+
+    # A.3 Choose representative documents
+    for chunk, representation, representation_pubref_epodoc, representation_pubrefs_docdb, family_id in candidates:
+
+        # When fetching family members failed, use first cycle as representation.
+        family_info = family_infos[family_id or representation_pubref_epodoc]
+        if family_info is None:
             chunk['exchange-document'] = representation
-            request = get_current_request()
-            del request.errors[:]
             continue
 
         #members = family_info.publications_by_country(countries=[])
@@ -293,7 +327,10 @@ def results_swap_family_members(response):
     )
 
 
-@cache_region('search', 'ops_search')
+@negative_cache(NoResultsException, HTTPError)
+@stale_while_revalidate
+@single_flight
+@canonical_cache_region('search', 'ops_search')
 def ops_published_data_search(constituents, query, range):
     """
     Run a search on EPO OPS, with caching.
@@ -334,8 +371,19 @@ def ops_published_data_search_real(constituents, query, range):
         return payload
 
 
-@cache_region('search')
-def ops_published_data_crawl(constituents, query, chunksize):
+@negative_cache(NoResultsException, HTTPError)
+@stale_while_revalidate
+@canonical_cache_region('search')
+def ops_published_data_crawl(constituents, query, chunksize, limit=None):
+    """
+    Crawl all publication numbers for a search expression on EPO OPS,
+    or the first ``limit`` ones.
+
+    The remaining chunks after the first one are acquired concurrently,
+    bounded by the concurrency limit of the OPS client and metered by its
+    request scheduler. Each chunk is reduced to its publication numbers
+    as soon as it arrives, so the raw chunks will not pile up in memory.
+    """
 
     if constituents != 'pub-number':
         raise ValueError('Only constituent "pub-number" permitted here')
@@ -344,6 +392,9 @@ def ops_published_data_crawl(constituents, query, chunksize):
     if constituents == 'pub-number':
         constituents = ''
 
+    if limit is not None:
+        chunksize = min(chunksize, limit)
+
     # fetch first chunk (1-chunksize) from upstream
     first_chunk = ops_published_data_search(constituents, query, '1-{0}'.format(chunksize))
     #print first_chunk
@@ -354,28 +405,64 @@ def ops_published_data_crawl(constituents, query, chunksize):
 
     # The first 2000 hits are accessible from OPS.
     total_count = min(total_count, 2000)
+    if limit is not None:
+        total_count = min(total_count, limit)
+
+    # Countermeasures to robot flagging are taken by the request scheduler of the OPS client,
+    # which meters requests according to the throttling information announced by OPS.
+    # <code>CLIENT.RobotDetected</code>
+    # <message>Recent behaviour implies you are a robot. The server is at the moment busy to serve robots. Please try again later</message>
+    def crawl_chunk(range_begin):
+        range_end = range_begin + chunksize - 1
+        range_string = '{0}-{1}'.format(range_begin, range_end)
+        log.info('ops_published_data_crawl range: ' + range_string)
+
+        # The crawl result will be cached as a whole, so don't cache each single chunk.
+        chunk = ops_published_data_search_real(constituents, query, range_string)
+        return _crawl_publication_numbers(chunk)
 
     # collect upstream results
     begin_second_chunk = chunksize + 1
-    chunks = [first_chunk]
-    for range_begin in range(begin_second_chunk, total_count + 1, chunksize):
+    publication_numbers = _crawl_publication_numbers(first_chunk)
+    chunk_results = concurrent_map(
+        crawl_chunk, range(begin_second_chunk, total_count + 1, chunksize),
+        max_workers=get_ops_client().max_concurrency)
+    for chunk_numbers in chunk_results:
+        publication_numbers += chunk_numbers
+    if limit is not None:
+        publication_numbers = publication_numbers[:limit]
 
-        # countermeasure to robot flagging
-        # <code>CLIENT.RobotDetected</code>
-        # <message>Recent behaviour implies you are a robot. The server is at the moment busy to serve robots. Please try again later</message>
-        time.sleep(5)
+    response = None
+    if real_constituents == 'pub-number':
 
-        range_end = range_begin + chunksize - 1
-        range_string = '{0}-{1}'.format(range_begin, range_end)
-        log.info('ops_published_data_crawl range: ' + range_string)
-        chunk = ops_published_data_search(constituents, query, range_string)
-        #print 'chunk:', chunk
-        chunks.append(chunk)
+        # Don't modify the cached first chunk.
+        response = deepcopy(first_chunk)
 
-    #return chunks
+        # delete upstream data
+        del resolve_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:search-result')['ops:publication-reference']
+
+        # add own representation
+        set_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:search-result/publication-numbers', publication_numbers, inplace=True)
+
+        # amend metadata
+        new_total_count = str(len(publication_numbers))
+        pointer_total_count.set(response, new_total_count)
+        set_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:range', {'@begin': '1', '@end': new_total_count})
 
-    # merge chunks into single result
+    # TODO: Maybe this code will never get reached anymore because the case
+    #       when there are zero results will always croak with 404, so it
+    #       will already be handled by `handle_response` beforehand, probably.
+    #       It might have been different in earlier versions of EPO/OPS.
+    if not response:  # pragma: nocover
+        raise NoResultsException('No results when crawling data for query: {}'.format(query))
+
+    return response
+
+
+def _crawl_publication_numbers(chunk):
     """
+    Reduce a chunk of search results to the list of publication numbers in DOCDB format.
+
     <empty>:    "ops:search-result" { » "ops:publication-reference": [
     biblio:     "ops:search-result" { » "exchange-documents": [ » "exchange-document": {
     abstract:   "ops:search-result" { » "exchange-documents": [ » "exchange-document": {
@@ -397,57 +484,19 @@ def ops_published_data_crawl(constituents, query, chunksize):
                                 }
                             }
                         },
+
+    FIXME: Implement other constituents.
     """
     pointer_results = JsonPointer('/ops:world-patent-data/ops:biblio-search/ops:search-result/ops:publication-reference')
-    #pointer_time_elapsed = JsonPointer('/ops:world-patent-data/ops:meta/@value')
-    all_results = []
-    #time_elapsed = int(pointer_time_elapsed.resolve(first_chunk))
-    for chunk in chunks:
-
-        # FIXME: use this for "real_constituents == 'pub-number'" only
-        chunk_results = to_list(pointer_results.resolve(chunk))
-
-        # FIXME: implement other constituents
-
-        #print 'chunk_results:', chunk_results
-        all_results += chunk_results
-
-        #time_elapsed += int(pointer_time_elapsed.resolve(chunk))
-
-    response = None
-    if real_constituents == 'pub-number':
-
-        response = first_chunk
+    pointer_document_id = JsonPointer('/document-id')
 
-        # delete upstream data
-        del resolve_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:search-result')['ops:publication-reference']
-
-        # compute own representation
-        publication_numbers = []
-        pointer_document_id = JsonPointer('/document-id')
-        for entry in all_results:
-            pubref = pointer_document_id.resolve(entry)
-            #print entry, pubref
-            pubref_number, pubref_date = _get_document_number_date(pubref, 'docdb')
-            publication_numbers.append(pubref_number)
-
-        # add own representation
-        set_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:search-result/publication-numbers', publication_numbers, inplace=True)
-
-        # amend metadata
-        new_total_count = str(len(publication_numbers))
-        pointer_total_count.set(response, new_total_count)
-        set_pointer(response, '/ops:world-patent-data/ops:biblio-search/ops:range', {'@begin': '1', '@end': new_total_count})
-        #pointer_time_elapsed.set(response, str(time_elapsed))
-
-    # TODO: Maybe this code will never get reached anymore because the case
-    #       when there are zero results will always croak with 404, so it
-    #       will already be handled by `handle_response` beforehand, probably.
-    #       It might have been different in earlier versions of EPO/OPS.
-    if not response:  # pragma: nocover
-        raise NoResultsException('No results when crawling data for query: {}'.format(query))
+    publication_numbers = []
+    for entry in to_list(pointer_results.resolve(chunk)):
+        pubref = pointer_document_id.resolve(entry)
+        pubref_number, pubref_date = _get_document_number_date(pubref, 'docdb')
+        publication_numbers.append(pubref_number)
 
-    return response
+    return publication_numbers
 
 
 def image_representative_from_family(patent, countries, func_filter=None):
@@ -491,6 +540,9 @@ def image_representative(patent):
         return image_representative_from_family(patent, ['EP', 'WO'])
 
 
+@negative_cache(HTTPError)
+@stale_while_revalidate
+@single_flight
 @cache_region('medium')
 def inquire_images(document):
 
@@ -641,12 +693,14 @@ def enrich_image_inquiry_info(info):
     return enriched
 
 
+@single_flight
 @cache_region('static')
 def get_ops_image_pdf(document, page):
     payload = get_ops_image(document, page, 'FullDocument', 'pdf')
     return payload
 
 
+@single_flight
 def get_ops_image(document, page, kind, format=None):
 
     # http://ops.epo.org/3.1/rest-services/published-data/images/EP/1000000/PA/firstpage.png?Range=1
@@ -722,6 +776,7 @@ def get_ops_image(document, page, kind, format=None):
     """
 
 
+@negative_cache(HTTPError)
 @cache_region('static')
 def ops_description(document_number, xml=False):
 
@@ -743,6 +798,7 @@ def ops_description(document_number, xml=False):
         return handle_response(response, 'ops-description')
 
 
+@negative_cache(HTTPError)
 @cache_region('static')
 def ops_claims(document_number, xml=False):
 
@@ -762,6 +818,7 @@ def ops_claims(document_number, xml=False):
         return handle_response(response, 'ops-claims')
 
 
+@stale_while_revalidate
 @cache_region('search')
 def ops_family_inpadoc(reference_type, document_number, constituents, xml=False):
     """
@@ -809,16 +866,12 @@ def ops_family_publication_docdb_xml(reference_type, document_number, constituen
     ops_id = epo_ops.models.Docdb(document_id.number, document_id.country, document_id.kind)
 
     # Acquire family information from OPS.
-    ops = get_ops_client()
-
-    # FIXME: Better use "accept_type" on a per-request basis supported by ``python-epo-ops-client``.
-    ops.accept_type = 'application/xml'
-    response = ops.family(reference_type, ops_id, constituents=to_list(constituents))
-    ops.accept_type = 'application/json'
-
-    return handle_response(response, 'ops-family')
+    with ops_client(xml=True) as ops:
+        response = ops.family(reference_type, ops_id, constituents=to_list(constituents))
+        return handle_response(response, 'ops-family')
 
 
+@stale_while_revalidate
 @cache_region('search')
 def ops_register(reference_type, document_number, constituents=None, xml=False):
     """
@@ -943,10 +996,38 @@ def handle_error(response, location):
     return response_json
 
 
+class PdfBuildCancelled(Exception):
+    """
+    Raised when assembling a PDF document from OPS has been cancelled.
+    """
+
+
+# The cancellation events for assembling PDF documents, per thread.
+pdf_build_state = threading.local()
+
+
+@contextmanager
+def pdf_build_cancellation(cancelled):
+    """
+    Stop fetching pages when ``cancelled``, a ``threading.Event``, gets set
+    while assembling a PDF document on the current thread using ``pdf_document_build``.
+
+    The event is not passed as an argument, as it must not become part of the cache key.
+    """
+    previous = getattr(pdf_build_state, 'cancelled', None)
+    pdf_build_state.cancelled = cancelled
+    try:
+        yield
+    finally:
+        pdf_build_state.cancelled = previous
+
+
+@blob_cache('pdf-ops', content_type='application/pdf')
 @cache_region('static')
 def pdf_document_build(patent):
 
     log.info('PDF {}: OPS attempt'.format(patent))
+    cancelled = getattr(pdf_build_state, 'cancelled', None)
 
     # 1. collect all single pdf pages
     image_info = inquire_images(patent)
@@ -960,24 +1041,22 @@ def pdf_document_build(patent):
         msg = 'No image information for document={0}, type=FullDocument'.format(patent)
         raise HTTPNotFound(msg)
 
+    # Fetch pages concurrently, bounded by the concurrency limit of the OPS client.
+    # Each single page is cached on its own, see ``get_ops_image_pdf``.
     page_count = int(resource_info['@number-of-pages'])
-    log.info('OPS PDF builder will collect {0} pages for document {1}'.format(page_count, patent))
-    pdf_pages = []
-    for page_number in range(1, page_count + 1):
-        page = get_ops_image_pdf(patent, page_number)
-        pdf_pages.append(page)
+    max_workers = get_ops_client().max_concurrency
+    log.info('OPS PDF builder will collect {0} pages for document {1} using {2} workers'.format(
+        page_count, patent, max_workers))
+    def fetch_page(page_number):
+        if cancelled is not None and cancelled.is_set():
+            raise PdfBuildCancelled('PDF {}: OPS attempt cancelled'.format(patent))
+        return get_ops_image_pdf(patent, page_number)
 
-    # 2. join single pdf pages
-    pdf_document = pdf_join(pages=pdf_pages)
+    pdf_pages = concurrent_map(fetch_page, range(1, page_count + 1), max_workers=max_workers)
 
-    # 3. add pdf metadata
-    page_sections = None
-    if 'ops:document-section' in resource_info:
-        page_sections = resource_info['ops:document-section']
-        #pprint(page_sections)
-
-    metadata = pdf_make_metadata(patent, 'ip-navigator:digi42', page_count, page_sections)
-    pdf_document = pdf_set_metadata(pdf_document, metadata)
+    # 2. join single pdf pages, add pdf metadata and bookmarks for document sections
+    page_sections = resource_info.get('ops:document-section')
+    pdf_document = pdf_assemble(pdf_pages, patent, 'ip-navigator:digi42', page_sections)
 
     # TODO: 4. add attachments (e.g. xml)
 
@@ -993,6 +1072,7 @@ def ops_biblio_documents(patent):
     return documents
 
 
+@stale_while_revalidate
 @cache_region('medium')
 def get_ops_biblio_data(reference_type, patent, xml=False):
     """
@@ -1013,16 +1093,164 @@ def get_ops_biblio_data(reference_type, patent, xml=False):
         return handle_response(response, 'ops-biblio')
 
 
+def get_ops_biblio_data_many(reference_type, patents, xml=False):
+    """
+    Acquire bibliographic information for many documents at once,
+    in JSON or XML format.
+
+    Documents are requested in batches of ``OPS_BIBLIO_BATCH_SIZE`` and
+    the payload of each document is stored into the cache of
+    ``get_ops_biblio_data``. Returns an ordered dictionary mapping each
+    document number to its payload. Documents which could not be acquired
+    in bulk are omitted, so the caller can resort to ``get_ops_biblio_data``.
+    """
+
+    results = OrderedDict()
+
+    # Serve documents from cache and compute document identifiers for all others.
+    # A single request can only use one input format.
+    pending = OrderedDict([('docdb', []), ('epodoc', [])])
+    for patent in patents:
+        cache_args = _biblio_cache_args(reference_type, patent, xml)
+        try:
+            results[patent] = region_get(get_ops_biblio_data, cache_args)
+            continue
+        except KeyError:
+            pass
+
+        document_id = decode_patent_number(patent)
+        if not document_id:
+            continue
+        if document_id.kind:
+            ops_id = epo_ops.models.Docdb(document_id.number, document_id.country, document_id.kind)
+            pending['docdb'].append((patent, document_id, ops_id))
+        else:
+            ops_id = epo_ops.models.Epodoc(document_id.country + document_id.number, document_id.kind)
+            pending['epodoc'].append((patent, document_id, ops_id))
+
+    # Acquire bibliographic data from OPS, in batches.
+    for items in pending.values():
+        for index in range(0, len(items), OPS_BIBLIO_BATCH_SIZE):
+            batch = items[index:index + OPS_BIBLIO_BATCH_SIZE]
+            log.info('Retrieving bibliographic data for {} documents'.format(len(batch)))
+
+            try:
+                with ops_client(xml=xml) as ops:
+                    response = ops.published_data(reference_type, [item[2] for item in batch], constituents=['full-cycle'])
+                    payload = handle_response(response, 'ops-biblio')
+            except Exception as ex:
+                log.warning('Retrieving bibliographic data in bulk failed: {}'.format(ex))
+                request = get_current_request()
+                if request is not None and hasattr(request, 'errors'):
+                    del request.errors[:]
+                continue
+
+            # Dispatch documents of the response to the numbers they have been requested with.
+            envelope, documents = _biblio_split(payload, xml)
+            index = {}
+            for docref, document in documents:
+                index.setdefault(docref[:2], []).append((docref, document))
+            for patent, document_id, ops_id in batch:
+                matches = [
+                    document for docref, document in index.get((document_id.country, document_id.number), [])
+                    if not document_id.kind or docref[2] == document_id.kind]
+                if not matches:
+                    continue
+                results[patent] = _biblio_assemble(envelope, matches, xml)
+                region_put(get_ops_biblio_data, _biblio_cache_args(reference_type, patent, xml), results[patent])
+
+    return OrderedDict([(patent, results[patent]) for patent in patents if patent in results])
+
+
+def _biblio_cache_args(reference_type, patent, xml):
+    # Mimic the arguments ``get_ops_biblio_data`` is invoked with.
+    if xml:
+        return reference_type, patent, xml
+    return reference_type, patent
+
+
+def _biblio_split(payload, xml):
+    """
+    Decode a bibliographic data response into its envelope, the parsed
+    root element or the JSON payload, and a list of
+    ``((country, doc-number, kind), document)`` tuples.
+    """
+    documents = []
+    if xml:
+        envelope = etree.fromstring(payload)
+        for document in envelope.iter('{%s}exchange-document' % OPS_EXCHANGE_NAMESPACE):
+            docref = (document.get('country'), document.get('doc-number'), document.get('kind'))
+            documents.append((docref, document))
+    else:
+        envelope = payload
+        for container in to_list(payload['ops:world-patent-data']['exchange-documents']):
+            for document in to_list(container['exchange-document']):
+                docref = (document.get('@country'), document.get('@doc-number'), document.get('@kind'))
+                documents.append((docref, document))
+    return envelope, documents
+
+
+def _biblio_assemble(envelope, documents, xml):
+    """
+    Build a bibliographic data response for a subset of the documents
+    within the envelope returned by ``_biblio_split``, mimicking a
+    response for a single document. The envelope is not modified.
+    """
+    if xml:
+        root = etree.Element(envelope.tag, attrib=envelope.attrib, nsmap=envelope.nsmap)
+        container = etree.SubElement(root, '{%s}exchange-documents' % OPS_EXCHANGE_NAMESPACE)
+        for document in documents:
+            container.append(deepcopy(document))
+        return etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+    else:
+        if len(documents) == 1:
+            documents = documents[0]
+        data = dict(envelope)
+        data['ops:world-patent-data'] = dict(envelope['ops:world-patent-data'])
+        data['ops:world-patent-data']['exchange-documents'] = {'exchange-document': documents}
+        return data
+
+
+@stale_while_revalidate
 @cache_region('medium')
 def ops_document_kindcodes(patent):
     """
     Acquire all possible kind codes for a specific document.
     """
 
-    error_msg_access = 'No bibliographic information for document={0}'.format(patent)
-
     log.info('Retrieving kindcodes for document {document}'.format(document=patent))
     documents = ops_biblio_documents(patent)
+    return _kindcodes_from_documents(patent, documents)
+
+
+def ops_document_kindcodes_many(patents):
+    """
+    Acquire all possible kind codes for many documents at once, warming the
+    cache of ``ops_document_kindcodes``. Returns an ordered dictionary mapping
+    each document number to its kind codes. Documents without bibliographic
+    information are omitted.
+    """
+
+    log.info('Retrieving kindcodes for {} documents'.format(len(patents)))
+    payloads = get_ops_biblio_data_many('publication', patents)
+
+    results = OrderedDict()
+    for patent in patents:
+        if patent not in payloads:
+            continue
+        documents = to_list(payloads[patent]['ops:world-patent-data']['exchange-documents']['exchange-document'])
+        try:
+            kindcodes = _kindcodes_from_documents(patent, documents)
+        except HTTPNotFound:
+            continue
+        region_put(ops_document_kindcodes, (patent,), kindcodes)
+        results[patent] = kindcodes
+    return results
+
+
+def _kindcodes_from_documents(patent, documents):
+
+    error_msg_access = 'No bibliographic information for document={0}'.format(patent)
 
     kindcodes = []
     for document in documents:
@@ -1239,6 +1467,36 @@ def ops_family_members(document_number):
     return family_members
 
 
+def ops_family_members_by_family_id(family_id, document_number):
+    """
+    Acquire all family members for a specific document, remembering them by family id.
+
+    In this manner, the family information will be reused for other documents
+    of the same family, e.g. when they appear on subsequent result pages.
+    """
+
+    if not family_id or not region_enabled(ops_family_members_of_family._arg_region):
+        return ops_family_members(document_number)
+
+    try:
+        return region_get(ops_family_members_of_family, (str(family_id),))
+    except KeyError:
+        pass
+
+    family_members = ops_family_members(document_number)
+    region_put(ops_family_members_of_family, (str(family_id),), family_members)
+    return family_members
+
+
+@cache_region('search')
+def ops_family_members_of_family(family_id):
+    """
+    Family members remembered by family id. The cache entries are populated
+    by ``ops_family_members_by_family_id``, as OPS can not look up families by id.
+    """
+    raise KeyError(family_id)
+
+
 class OPSFamilyMembers(object):
 
     def __init__(self):
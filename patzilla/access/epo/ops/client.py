@@ -2,8 +2,12 @@
 # (c) 2014-2022 Andreas Motl <andreas.motl@ip-tools.org>
 import logging
 import os
+import threading
+from contextlib import contextmanager
 
 import epo_ops
+import requests
+from epo_ops.models import Request
 from mock import mock
 from pyramid.httpexceptions import HTTPUnauthorized
 from pyramid.threadlocal import get_current_registry
@@ -11,14 +15,31 @@ from zope.interface import implementer
 from zope.interface.interface import Interface
 from zope.interface.interfaces import ComponentLookupError
 
+from patzilla.access.epo.ops.scheduler import OpsRequestScheduler
 from patzilla.access.generic.credentials import AbstractCredentialsGetter, DatasourceCredentialsManager
+from patzilla.util.config import asbool
 from patzilla.util.web.identity.store import IUserMetricsManager
 
 logger = logging.getLogger(__name__)
 
 
+# Default number of concurrent requests to OPS per set of credentials.
+OPS_MAX_CONCURRENCY = 4
+
+# Default number of connections to keep in the HTTP connection pool per set of credentials.
+OPS_HTTP_POOL_SIZE = 10
+
+
 def includeme(config):
-    config.registry.registerUtility(OpsClientPool())
+
+    # Acquire settings for EPO/OPS.
+    ops_settings = config.registry.datasource_settings.datasource.get('ops', {})
+    max_concurrency = int(ops_settings.get('max_concurrency', OPS_MAX_CONCURRENCY))
+    http_pool_size = int(ops_settings.get('http_pool_size', OPS_HTTP_POOL_SIZE))
+    http_keep_alive = asbool(ops_settings.get('http_keep_alive', True))
+
+    config.registry.registerUtility(OpsClientPool(
+        max_concurrency=max_concurrency, http_pool_size=http_pool_size, http_keep_alive=http_keep_alive))
     config.add_subscriber(attach_ops_client, "pyramid.events.ContextFound")
 
 
@@ -80,27 +101,42 @@ class OpsClientPool(object):
     EPO/OPS client pool as Pyramid utility implementation.
     """
 
-    def __init__(self):
-        logger.info("Creating upstream client pool for EPO/OPS")
+    def __init__(self, max_concurrency=OPS_MAX_CONCURRENCY, http_pool_size=OPS_HTTP_POOL_SIZE, http_keep_alive=True):
+        logger.info("Creating upstream client pool for EPO/OPS. max_concurrency={}, http_pool_size={}, "
+                    "http_keep_alive={}".format(max_concurrency, http_pool_size, http_keep_alive))
+        self.max_concurrency = max_concurrency
+        self.http_pool_size = http_pool_size
+        self.http_keep_alive = http_keep_alive
         self.clients = {}
+        self.lock = threading.Lock()
 
     def get(self, identifier, credentials=None):
-        if identifier not in self.clients:
-            if credentials is None:
-                raise HTTPUnauthorized("Unable to discover credentials for EPO OPS. identifier={}".format(identifier))
-            logger.info("Creating upstream client for EPO/OPS. identifier={}".format(identifier))
-            self.clients[identifier] = ops_client_factory(key=credentials['consumer_key'], secret=credentials['consumer_secret'])
+        with self.lock:
+            if identifier not in self.clients:
+                if credentials is None:
+                    raise HTTPUnauthorized("Unable to discover credentials for EPO OPS. identifier={}".format(identifier))
+                logger.info("Creating upstream client for EPO/OPS. identifier={}".format(identifier))
+                self.clients[identifier] = ops_client_factory(
+                    key=credentials['consumer_key'], secret=credentials['consumer_secret'],
+                    max_concurrency=self.max_concurrency,
+                    http_pool_size=self.http_pool_size, http_keep_alive=self.http_keep_alive)
+
+            return self.clients.get(identifier)
 
-        return self.clients.get(identifier)
 
+def ops_client_factory(key, secret, max_concurrency=OPS_MAX_CONCURRENCY,
+                       http_pool_size=OPS_HTTP_POOL_SIZE, http_keep_alive=True):
 
-def ops_client_factory(key, secret):
+    # Meter all outbound requests according to the throttling
+    # information announced by OPS, per set of credentials.
+    scheduler = OpsRequestScheduler()
 
-    # TODO: Enable throttling and caching.
-    ops = epo_ops.Client(
+    ops = OpsClient(
         key=key, secret=secret,
-        accept_type='json', middlewares=[]
+        accept_type='json', middlewares=[scheduler],
+        max_concurrency=max_concurrency, http_pool_size=http_pool_size, http_keep_alive=http_keep_alive,
     )
+    ops.scheduler = scheduler
 
     # Attach metrics manager object to ops client instance.
     registry = get_current_registry()
@@ -110,3 +146,99 @@ def ops_client_factory(key, secret):
         ops.metrics_manager = mock.Mock()
 
     return ops
+
+
+class OpsClient(epo_ops.Client):
+    """
+    EPO/OPS client which can be shared across threads.
+
+    - The content type to accept is tracked per thread, use the ``accept``
+      context manager to choose it for a specific call.
+    - Requests are submitted through a ``requests.Session`` with a
+      connection pool of configurable size, optionally keeping
+      connections alive.
+    - The number of requests in flight is limited by ``max_concurrency``.
+    """
+
+    def __init__(self, key, secret, accept_type='json', middlewares=None,
+                 max_concurrency=OPS_MAX_CONCURRENCY, http_pool_size=OPS_HTTP_POOL_SIZE, http_keep_alive=True):
+        self.local = threading.local()
+        self.default_accept_type = 'application/{0}'.format(accept_type)
+        super(OpsClient, self).__init__(key, secret, accept_type=accept_type, middlewares=middlewares)
+
+        # Limit the number of concurrent requests per set of credentials.
+        self.max_concurrency = max_concurrency
+        self.request_slots = threading.BoundedSemaphore(max_concurrency)
+
+        # Use a session with a connection pool for all requests.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=http_pool_size, pool_maxsize=http_pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not http_keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self.request = OpsRequest(self.middlewares, self.session, self.request_slots)
+
+        self.token_lock = threading.Lock()
+
+    @property
+    def accept_type(self):
+        return getattr(self.local, 'accept_type', self.default_accept_type)
+
+    @accept_type.setter
+    def accept_type(self, value):
+        self.local.accept_type = value
+
+    @contextmanager
+    def accept(self, accept_type):
+        """
+        Use a different content type for all requests
+        submitted by the current thread within this context.
+        """
+        previous = self.accept_type
+        self.accept_type = accept_type
+        try:
+            yield self
+        finally:
+            self.accept_type = previous
+
+    @property
+    def access_token(self):
+        # Prevent concurrent threads from acquiring multiple access tokens.
+        with self.token_lock:
+            return super(OpsClient, self).access_token
+
+
+class OpsRequest(Request):
+    """
+    Submit requests through a ``requests.Session``, keeping the
+    middleware environment local to each request.
+    """
+
+    def __init__(self, middlewares, session, slots):
+        super(OpsRequest, self).__init__(middlewares)
+        self.session = session
+        self.slots = slots
+
+    def post(self, url, data=None, **kwargs):
+        return self._request(self.session.post, url, data, **kwargs)
+
+    def get(self, url, data=None, **kwargs):
+        return self._request(lambda url, data, **kwargs: self.session.get(url, **kwargs), url, data, **kwargs)
+
+    def _request(self, callback, url, data=None, **kwargs):
+        env = self.default_env
+
+        for mw in self.middlewares:
+            url, data, kwargs = mw.process_request(env, url, data, **kwargs)
+
+        # Either get response from middleware environment or request from upstream.
+        response = env["response"]
+        if response is None:
+            with self.slots:
+                response = callback(url, data, **kwargs)
+
+        for mw in reversed(self.middlewares):
+            response = mw.process_response(env, response)
+
+        return response
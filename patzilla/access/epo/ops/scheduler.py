@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Meter outbound requests to EPO/OPS according to the service state and the
+request allowances announced by the ``X-Throttling-Control`` response header.
+
+Example header::
+
+    X-Throttling-Control: idle (images=green:200, inpadoc=green:60, other=green:1000, retrieval=green:200, search=green:30)
+
+The number after each service color is the amount of requests per minute
+OPS is willing to serve for this service. When a service is "black", OPS
+also sends a ``Retry-After`` header carrying a duration in milliseconds.
+
+See also OPS documentation section 2.2.3 "Fair use policy and throttling".
+"""
+import logging
+import re
+import threading
+import time
+
+from epo_ops.middlewares.middleware import Middleware
+from epo_ops.middlewares.throttle.utils import service_for_url
+
+logger = logging.getLogger(__name__)
+
+
+OPS_SERVICES = ('images', 'inpadoc', 'other', 'retrieval', 'search')
+
+# How long to pause a blocked service when OPS does not send a ``Retry-After`` header, in seconds.
+OPS_RETRY_AFTER_DEFAULT = 60
+
+
+def parse_throttling_control(header):
+    """
+    Decode the value of the ``X-Throttling-Control`` header into
+    the system state and a dictionary of ``(color, limit)`` tuples
+    keyed by service name.
+
+    >>> state, services = parse_throttling_control('busy (images=green:100, search=yellow:15)')
+    >>> state
+    'busy'
+    >>> sorted(services.items())
+    [('images', ('green', 100)), ('search', ('yellow', 15))]
+    """
+    state = None
+    match = re.match(r'^\s*(\w+)', header)
+    if match:
+        state = match.group(1).lower()
+    services = {}
+    for service, color, limit in re.findall(r'(\w+)=(\w+):(\d+)', header):
+        services[service.lower()] = (color.lower(), int(limit))
+    return state, services
+
+
+class TokenBucket(object):
+    """
+    A token bucket metering requests to a single OPS service.
+
+    It is refilled at a rate of ``limit`` tokens per minute and holds
+    enough tokens to cover a burst of ``burst`` seconds. Before having
+    seen any allowance from OPS, the bucket will not impose any delay.
+    """
+
+    def __init__(self, burst, clock):
+        self.burst = burst
+        self.clock = clock
+        self.rate = None
+        self.capacity = None
+        self.tokens = None
+        self.color = None
+        self.blocked_until = 0
+        self.updated = clock()
+
+    def configure(self, color, limit, retry_after=None):
+        self.refill()
+        self.color = color
+        self.rate = limit / 60.0
+        capacity = max(1.0, self.rate * self.burst)
+        if self.tokens is None:
+            self.tokens = capacity
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+        # When OPS blocks the service, stop sending requests until it has recovered.
+        if color == 'black' or limit == 0:
+            self.tokens = 0
+            retry_after = retry_after or OPS_RETRY_AFTER_DEFAULT
+            self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+
+    def refill(self):
+        now = self.clock()
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """
+        Take a token from the bucket. Return the number of seconds to wait
+        before trying again, or zero when the request may be sent right away.
+        """
+        self.refill()
+        now = self.clock()
+
+        if self.blocked_until > now:
+            return self.blocked_until - now
+
+        if self.rate is None:
+            return 0
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        # OPS did not grant any requests, but the blocking period is over.
+        # Let a single probe request pass, its response will carry a new allowance.
+        if not self.rate:
+            self.blocked_until = now + 1.0
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+class OpsRequestScheduler(Middleware):
+    """
+    Request scheduler for ``python-epo-ops-client``, to be used as middleware.
+
+    It maintains a token bucket per OPS service and delays outbound
+    requests only when the budget of the respective service is exhausted.
+    One instance is used per set of credentials, it is thread-safe.
+    """
+
+    def __init__(self, burst=10, clock=None, sleep=None):
+        self.clock = clock or time.time
+        self.sleep = sleep or time.sleep
+        self.lock = threading.Lock()
+        self.state = None
+        self.buckets = {}
+        for service in OPS_SERVICES:
+            self.buckets[service] = TokenBucket(burst=burst, clock=self.clock)
+
+    def process_request(self, env, url, data, **kwargs):
+        self.acquire(service_for_url(url))
+        return url, data, kwargs
+
+    def process_response(self, env, response):
+        self.update(response.headers)
+        return response
+
+    def acquire(self, service):
+        """
+        Block until a request to the designated service may be sent.
+        Return the total amount of seconds spent waiting.
+        """
+        bucket = self.buckets.get(service) or self.buckets['other']
+        waited = 0
+        while True:
+            with self.lock:
+                delay = bucket.take()
+            if not delay:
+                break
+            logger.info('OPS service "{}" is {}, delaying request by {:.2f} seconds'.format(
+                service, bucket.color, delay))
+            self.sleep(delay)
+            waited += delay
+        return waited
+
+    def update(self, headers):
+        """
+        Update the token buckets from the headers of an OPS response.
+        """
+        header = headers.get('X-Throttling-Control')
+        if not header:
+            return
+
+        state, services = parse_throttling_control(header)
+
+        retry_after = None
+        if headers.get('Retry-After', '').isdigit():
+            retry_after = int(headers['Retry-After']) / 1000.0
+
+        with self.lock:
+            if state != self.state:
+                logger.info('OPS system state changed to "{}"'.format(state))
+            self.state = state
+            for service, (color, limit) in services.items():
+                if service in self.buckets:
+                    self.buckets[service].configure(color, limit, retry_after=retry_after)
+
+    def status(self):
+        """
+        Report about the current state of all services.
+        """
+        with self.lock:
+            data = {'state': self.state, 'services': {}}
+            for service, bucket in self.buckets.items():
+                bucket.refill()
+                data['services'][service] = {
+                    'color': bucket.color,
+                    'limit': int(round(bucket.rate * 60)) if bucket.rate is not None else None,
+                    'tokens': bucket.tokens,
+                }
+            return data
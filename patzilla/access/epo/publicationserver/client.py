@@ -3,7 +3,8 @@
 import logging
 import requests
 
-from beaker.cache import cache_region
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.cache.blobstore import blob_cache
 from patzilla.util.numbers.normalize import normalize_patent
 from patzilla.util.network.browser import regular_user_agent
 from pyramid.httpexceptions import HTTPNotFound
@@ -11,6 +12,7 @@ from pyramid.httpexceptions import HTTPNotFound
 logger = logging.getLogger(__name__)
 
 
+@blob_cache('pdf-epo-publication-server', content_type='application/pdf')
 @cache_region('static')
 def fetch_pdf(document_number):
     """
@@ -1,22 +1,77 @@
 # -*- coding: utf-8 -*-
 # (c) 2013-2022 The PatZilla Developers
 import logging
-from io import StringIO
-from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+from itertools import islice
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
 
 import attr
 from pyramid.httpexceptions import HTTPError
+from patzilla.util.cache.blobstore import Blob, iter_chunks
 from patzilla.util.numbers.common import decode_patent_number
 from patzilla.util.python import exception_traceback
-from patzilla.access.epo.ops.api import pdf_document_build as ops_build_pdf
+from patzilla.util.python.concurrency import with_threadlocals
+from patzilla.access.epo.ops.api import PdfBuildCancelled, pdf_build_cancellation, \
+    pdf_document_build as ops_build_pdf
 from patzilla.access.epo.publicationserver.client import fetch_pdf as publicationserver_fetch_pdf
 from patzilla.access.uspto.pdf import document_viewer_url as uspto_pdfview_url, fetch_pdf as uspto_fetch_pdf
 
 log = logging.getLogger(__name__)
 
 
+# The maximum number of concurrent requests to each PDF data source.
+PDF_CONCURRENCY_DEFAULT = OrderedDict([
+    ('epo-publication-server', 4),
+    ('uspto', 2),
+    ('epo-ops', 2),
+])
+
+# The concurrency limits in use, and semaphores enforcing them.
+pdf_source_limits = {}
+pdf_source_slots = {}
+
+
+def configure_pdf_concurrency(limits=None):
+    """
+    Set the maximum number of concurrent requests per PDF data source.
+    """
+    limits = OrderedDict(PDF_CONCURRENCY_DEFAULT, **(limits or {}))
+    for source, limit in limits.items():
+        pdf_source_limits[source] = max(int(limit), 1)
+        pdf_source_slots[source] = threading.BoundedSemaphore(pdf_source_limits[source])
+    return pdf_source_limits
+
+
+configure_pdf_concurrency()
+
+# Start assembling PDF documents from OPS after this number of seconds,
+# when the direct data sources did not deliver yet. ``None`` disables hedging.
+pdf_hedge_delay = None
+
+# The executor running the attempts in hedged mode, shared by all requests.
+pdf_hedge_executor = None
+
+
+def configure_pdf_hedging(delay=None):
+    """
+    Set the delay for starting the OPS attempt in hedged mode, or disable it.
+    """
+    global pdf_hedge_delay, pdf_hedge_executor
+    pdf_hedge_delay = None if delay in (None, '') else float(delay)
+    if pdf_hedge_delay is not None and pdf_hedge_executor is None:
+        # Attempts are bounded by the concurrency limits of the data sources anyway.
+        pdf_hedge_executor = ThreadPoolExecutor(
+            max_workers=sum(pdf_source_limits.values()), thread_name_prefix='pdf-hedge')
+    return pdf_hedge_delay
+
+
 @attr.s
 class PDFResponse(object):
+    # Either the payload or a ``Blob`` within the blob store.
     pdf = attr.ib(default=None)
     datasource = attr.ib(default=None)
     meta = attr.ib(default=attr.Factory(dict))
@@ -58,29 +113,17 @@ def pdf_universal_real(patent, response):
                   'a decoded document number for "{}"'.format(patent))
         raise ValueError('Unable to decode document number {}'.format(patent))
 
+    # In hedged mode, data sources are requested concurrently.
+    if pdf_hedge_delay is not None:
+        return pdf_universal_hedged(patent, document, response, pdf_hedge_delay)
+
     # 1. If it's an EP document, try European publication server first.
     if response.pdf is None and document.country == 'EP':
-
-        try:
-            response.pdf = publicationserver_fetch_pdf(patent)
-            response.datasource = 'epo-publication-server'
-
-        except Exception as ex:
-            log.warning('PDF {}: Not available from EPO. {}'.format(patent, ex))
-            if not isinstance(ex, HTTPError):
-                log.error(exception_traceback())
+        pdf_attempt(response, 'epo-publication-server', patent)
 
     # 2. Next, try USPTO servers if it's a US document.
     if response.pdf is None and document.country == 'US':
-
-        try:
-            response.pdf = uspto_fetch_pdf(patent)
-            response.datasource = 'uspto'
-
-        except Exception as ex:
-            log.warning('PDF {}: Not available from USPTO. {}'.format(patent, ex))
-            if not isinstance(ex, HTTPError):
-                log.error(exception_traceback())
+        pdf_attempt(response, 'uspto', patent)
 
     # 3. Next, try DPMA servers.
     """
@@ -119,14 +162,7 @@ def pdf_universal_real(patent, response):
         # if document.country == 'CA':
         #    patent = document.country + document.number
 
-        try:
-            response.pdf = ops_build_pdf(patent)
-            response.datasource = 'epo-ops'
-
-        except Exception as ex:
-            log.warning('PDF {}: Not available from OPS. {}'.format(patent, ex))
-            if not isinstance(ex, HTTPError):
-                log.error(exception_traceback())
+        pdf_attempt(response, 'epo-ops', patent)
 
     # 5. Last but not least, try to redirect to USPTO server.
     # TODO: Move elsewhere as deactivated on 2019-02-19.
@@ -153,41 +189,224 @@ def pdf_universal_real(patent, response):
     return True
 
 
+def pdf_fetch(source, patent, cancelled=None):
+    """
+    Fetch a PDF document from a data source, within its concurrency limit.
+    Returns ``None`` when the document is not available.
+
+    When ``cancelled``, a ``threading.Event``, gets set, assembling
+    the document from OPS will stop before fetching further pages.
+    """
+    fetchers = {
+        'epo-publication-server': ('EPO', publicationserver_fetch_pdf),
+        'uspto': ('USPTO', uspto_fetch_pdf),
+        'epo-ops': ('OPS', ops_build_pdf),
+    }
+    label, fetch = fetchers[source]
+    try:
+        with pdf_source_slots[source]:
+            if cancelled is not None and cancelled.is_set():
+                return None
+            with pdf_build_cancellation(cancelled):
+                return fetch(patent)
+
+    except PdfBuildCancelled as ex:
+        log.info(ex)
+
+    except Exception as ex:
+        log.warning('PDF {}: Not available from {}. {}'.format(patent, label, ex))
+        if not isinstance(ex, HTTPError):
+            log.error(exception_traceback())
+
+
+def pdf_attempt(response, source, patent):
+    response.pdf = pdf_fetch(source, patent)
+    if response.pdf is not None:
+        response.datasource = source
+
+
+def pdf_universal_hedged(patent, document, response, delay):
+    """
+    Request the direct data sources for a document first, and start
+    assembling it from OPS after ``delay`` seconds, or as soon as they
+    failed. The first PDF document delivered wins.
+
+    Attempts which have not been started yet will be cancelled. A running
+    OPS attempt will stop before fetching further pages. Running attempts
+    at the direct data sources can not be interrupted, they will finish in
+    the background and populate the cache.
+    """
+    sources = []
+    if document.country == 'EP':
+        sources.append('epo-publication-server')
+    if document.country == 'US':
+        sources.append('uspto')
+
+    # Attempts may outlive the request, so they get a detached copy of it.
+    fetch = with_threadlocals(pdf_fetch, detach=True)
+    executor = pdf_hedge_executor
+    cancelled = threading.Event()
+    attempts = {executor.submit(fetch, source, patent, cancelled): source for source in sources}
+    pending = set(attempts)
+    deadline = time.monotonic() + delay
+    hedged = False
+
+    try:
+        while True:
+            if not hedged and (not pending or time.monotonic() >= deadline):
+                log.info('PDF {}: Starting attempt at OPS'.format(patent))
+                future = executor.submit(fetch, 'epo-ops', patent, cancelled)
+                attempts[future] = 'epo-ops'
+                pending.add(future)
+                hedged = True
+
+            if not pending:
+                break
+
+            timeout = None if hedged else max(deadline - time.monotonic(), 0)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result():
+                    response.pdf = future.result()
+                    response.datasource = attempts[future]
+                    return True
+
+    finally:
+        cancelled.set()
+        for future in pending:
+            future.cancel()
+
+    return True
+
+
+def pdf_universal_many(patents, max_workers=None, read_ahead=None):
+    """
+    Acquire PDF documents concurrently, yielding ``(patent, response)``
+    tuples in the order of ``patents``.
+
+    Requests to each data source are bounded by ``pdf_source_slots``.
+    ``max_workers`` defaults to the sum of those limits. To bound memory
+    usage, at most ``read_ahead`` documents, defaulting to ``max_workers``,
+    are acquired ahead of the consumer.
+    """
+    if max_workers is None:
+        max_workers = sum(pdf_source_limits.values())
+    if read_ahead is None:
+        read_ahead = max_workers
+
+    patents = iter(patents)
+    worker = with_threadlocals(pdf_universal)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+
+    def submit(count):
+        for patent in islice(patents, count):
+            log.info('PDF request for document {document}'.format(document=patent))
+            pending.append((patent, executor.submit(worker, patent)))
+
+    try:
+        submit(max(read_ahead, 1))
+        while pending:
+            patent, future = pending.popleft()
+            submit(1)
+            try:
+                response = future.result()
+            except Exception as ex:
+                log.error('PDF acquisition for "{}" failed: {}'.format(patent, ex))
+                if not isinstance(ex, HTTPError):
+                    log.error(exception_traceback())
+                response = PDFResponse()
+            yield patent, response
+
+    finally:
+        for patent, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class ZipStream(object):
+    """
+    Unseekable file-like object collecting the output of a ``ZipFile``,
+    to be drained progressively by the consumer.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
 def pdf_ziparchive(patents):
-    buffer = StringIO()
-    with ZipFile(buffer, 'w', ZIP_DEFLATED) as archive:
-        pdf_ziparchive_add(archive, patents)
-    buffer.seek(0)
-    payload = buffer.read()
-    return {'zip': payload}
+    """
+    Generate a ZIP archive of PDF documents, yielding its content in chunks
+    while the documents are being acquired.
+
+    The archive is written one chunk at a time, but documents are acquired
+    ahead of it, see ``pdf_universal_many``. Without a blob store, up to that
+    number of complete documents will be held in memory, regardless of the
+    number of documents within the archive.
+    """
+    stream = ZipStream()
+    with ZipFile(stream, 'w', ZIP_STORED) as archive:
+        for _ in pdf_ziparchive_write(archive, patents):
+            chunk = stream.drain()
+            if chunk:
+                yield chunk
+    yield stream.drain()
 
 
 def pdf_ziparchive_add(zipfile, numbers, path=''):
+    for _ in pdf_ziparchive_write(zipfile, numbers, path=path):
+        pass
+
+
+def pdf_ziparchive_write(zipfile, numbers, path=''):
+    """
+    Write PDF documents to a ZIP archive, followed by a report about
+    delivered and missing documents. PDF documents are compressed
+    already, so they are stored without compression.
+
+    This is a generator, yielding after each chunk written to the archive.
+    """
 
     delivered = []
     missing = []
 
-    for patent in numbers:
+    # Skip empty numbers
+    numbers = [patent for patent in numbers if patent]
 
-        # Skip empty numbers
-        if not patent:
-            continue
+    for patent, data in pdf_universal_many(numbers):
 
-        log.info('PDF request for document {document}'.format(document=patent))
-        try:
-            data = pdf_universal(patent)
-            if data.pdf is not None:
-                inode = ZipInfo('{path}/{document}.pdf'.format(path=path, document=patent))
-                zipfile.writestr(inode, data.pdf)
-                delivered.append(patent)
-            else:
-                log.warning('No PDF for "{patent}" in context of a bulk request'.format(patent=patent))
-                missing.append(patent)
-
-        except HTTPError as ex:
-            log.error('Problem fetching PDF for "{patent}" in context of a bulk request. error={ex}'.format(
-                patent=patent, ex=ex))
+        if data.pdf is None:
+            log.warning('No PDF for "{patent}" in context of a bulk request'.format(patent=patent))
             missing.append(patent)
+            continue
+
+        zinfo = ZipInfo(pdf_ziparchive_name(path, patent + '.pdf'), date_time=time.localtime()[:6])
+        zinfo.compress_type = ZIP_STORED
+        zinfo.external_attr = 0o644 << 16
+        if isinstance(data.pdf, Blob):
+            zinfo.file_size = data.pdf.size
+            source = data.pdf.open()
+        else:
+            zinfo.file_size = len(data.pdf)
+            source = BytesIO(data.pdf)
+
+        with source, zipfile.open(zinfo, 'w') as target:
+            for chunk in iter_chunks(source):
+                target.write(chunk)
+                yield
+
+        delivered.append(patent)
 
     # TODO: Format more professionally incl. generator description
     # TODO: Unify with "Dossier.to_zip"
@@ -195,4 +414,17 @@ def pdf_ziparchive_add(zipfile, numbers, path=''):
         'Delivered files ({0}):\n'.format(len(delivered)) + '\n'.join(delivered) + \
         '\n\n' + \
         'Missing files ({0}):\n'.format(len(missing)) + '\n'.join(missing)
-    zipfile.writestr('{path}/@report.txt'.format(path=path), report)
+    zipfile.writestr(pdf_ziparchive_name(path, '@report.txt'), report)
+    yield
+
+
+def pdf_ziparchive_name(path, filename):
+    return '/'.join([path, filename]).lstrip('/')
+
+
+def includeme(config):
+    settings = config.registry.settings
+    prefix = 'pdf.concurrency.'
+    configure_pdf_concurrency(
+        {key[len(prefix):]: value for key, value in settings.items() if key.startswith(prefix)})
+    configure_pdf_hedging(settings.get('pdf.hedge_delay'))
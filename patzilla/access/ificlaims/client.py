@@ -10,8 +10,9 @@ import timeit
 import logging
 import requests
 from pprint import pprint
-from beaker.cache import cache_region
 from requests.exceptions import RequestException
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.cache.keys import canonical_cache_region
 from patzilla.util.image.convert import to_png
 from patzilla.access.generic.exceptions import NoResultsException, GenericAdapterException, SearchException
 from patzilla.access.generic.search import GenericSearchResponse, GenericSearchClient
@@ -575,7 +576,7 @@ def ificlaims_fetch(resource, format, options=None):
         raise IFIClaimsFormatException(msg)
 
 
-@cache_region('search')
+@canonical_cache_region('search')
 def ificlaims_search(query, options=None):
 
     options = options or SmartMunch()
@@ -593,7 +594,7 @@ def ificlaims_search(query, options=None):
         raise
 
 
-@cache_region('search')
+@canonical_cache_region('search')
 def ificlaims_crawl(constituents, query, chunksize, options=None):
     client = ificlaims_client(options=options)
     try:
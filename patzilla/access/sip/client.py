@@ -4,11 +4,11 @@ import timeit
 import logging
 import requests
 from lxml import etree
-from beaker.cache import cache_region
 from requests.exceptions import ConnectionError, ConnectTimeout
 from patzilla.access.generic.exceptions import NoResultsException, GenericAdapterException
 from patzilla.access.generic.search import GenericSearchResponse, GenericSearchClient
 from patzilla.access.sip import get_sip_client
+from patzilla.util.cache.keys import canonical_cache_region
 from patzilla.util.data.container import SmartMunch
 
 """
@@ -356,7 +356,7 @@ class SipSearchResponse(GenericSearchResponse):
         return document['famid']
 
 
-@cache_region('search', 'sip_search')
+@canonical_cache_region('search', 'sip_search')
 def sip_published_data_search(query, options):
 
     # <applicant type="inpadoc">grohe</applicant>
@@ -382,7 +382,7 @@ def sip_published_data_search(query, options):
         raise
 
 
-@cache_region('search')
+@canonical_cache_region('search')
 def sip_published_data_crawl(constituents, query, chunksize):
     sip = get_sip_client()
     try:
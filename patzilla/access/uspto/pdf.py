@@ -58,10 +58,11 @@ import sys
 from collections import OrderedDict
 
 import requests
-from beaker.cache import cache_region
 from pyramid.httpexceptions import HTTPNotFound
 from repoze.lru import lru_cache
 
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.cache.blobstore import blob_cache
 from patzilla.util.config import to_list
 from patzilla.util.image.convert import pdf_join, to_pdf
 from patzilla.util.network.browser import regular_user_agent
@@ -394,6 +395,7 @@ def png_url(document_number, section=UsptoPdfSection.DRAWINGS):
         return url
 
 
+@blob_cache('pdf-uspto', content_type='application/pdf')
 def fetch_pdf(document_number, section=UsptoPdfSection.FULL):
     """
     Retrieve PDF document from the USPTO document servers.
@@ -9,6 +9,12 @@ import platformdirs
 from beaker.cache import CacheManager
 from beaker.util import parse_cache_config_options
 
+from patzilla.util.cache.compression import configure_compression
+from patzilla.util.cache.local import configure_local_cache
+from patzilla.util.cache.memory import configure_memory_backend
+from patzilla.util.cache.serializer import configure_serializer
+from patzilla.util.database.beaker_mongodb import register_backend
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,59 +28,138 @@ def get_cache_directory(testing=False):
     return cache_directory
 
 
-def configure_cache_backend(kind="memory", cache_directory=None, clear_cache=False):
+# Cache regions and their default options.
+CACHE_REGIONS = {
+    'search': {'expire': 604800, 'soft_expire': 86400},     # 1 week, stale after 1 day
+    'medium': {'expire': 86400, 'soft_expire': 21600},      # 1 day, stale after 6 hours
+    'longer': {'expire': 604800},                           # 1 week
+    'static': {'expire': 2592000},                          # 1 month
+    'negative': {'expire': 600},                            # 10 minutes
+}
+
+# Regions holding large binary payloads like PDF documents and drawings.
+BLOB_REGIONS = ['static', 'longer']
+
+# Route regions to different backends, by cache backend kind.
+# Large binary payloads should not be stored within MongoDB documents.
+CACHE_ROUTING = {
+    'mongodb': {region: 'filesystem' for region in BLOB_REGIONS},
+}
+
+
+def configure_cache_backend(kind="memory", cache_directory=None, clear_cache=False, routing=None,
+                            memory_max_bytes=None, compression=None, serializer=None,
+                            local_max_entries=None):
     """
     Configure and bootstrap the Beaker cache backend adapter.
 
-    Currently, it supports "memory", "filesystem" and "mongodb".
-    """
+    Currently, it supports "memory", "filesystem" and "mongodb". All cache
+    regions use the backend of the designated kind, unless ``routing``, a
+    dictionary mapping region names to backend kinds, designates otherwise.
+    By default, the "mongodb" kind stores large binary payloads on the filesystem.
 
-    cache_location = None
+    The "memory" kind keeps all regions within a global byte budget,
+    which can be adjusted using ``memory_max_bytes``.
 
-    # Cache backend: memory.
-    if kind == "memory":
-        cache_opts = {
-            'cache.type': 'memory',
-        }
+    Persisted regions can be compressed using the designated ``compression``
+    codec. Those not holding large binary payloads can use the designated
+    ``serializer`` instead of pickling, and can be fronted by an in-process
+    cache, by setting its size using ``local_max_entries``.
+    """
 
-    # Cache backend: filesystem.
-    elif kind == "filesystem":
+    if routing is None:
+        routing = CACHE_ROUTING.get(kind, {})
+
+    kinds = set([kind] + list(routing.values()))
+    for name in kinds:
+        if name not in ["memory", "filesystem", "mongodb"]:
+            raise TypeError("Unknown cache backend: {}".format(name))
 
+    cache_location = None
+    if "filesystem" in kinds:
         if cache_directory is None:
             cache_directory = get_cache_directory()
-
         if clear_cache:
             shutil.rmtree(cache_directory)
+        cache_location = cache_directory
+
+    if "mongodb" in kinds:
+        register_backend()
+
+    # Set general options.
+    cache_opts = {
+        'cache.regions': ','.join(CACHE_REGIONS),
+        'cache.key_length': 512,
+    }
+
+    # Set options per region.
+    for region, options in CACHE_REGIONS.items():
+        region_kind = routing.get(region, kind)
+        options = dict(options)
+        options.update(backend_options(region_kind, cache_directory))
+        options.update(performance_options(
+            region, region_kind, compression=compression, serializer=serializer,
+            local_max_entries=local_max_entries))
+        for key, value in options.items():
+            cache_opts['cache.{}.{}'.format(region, key)] = value
+
+    # Configure the caching subsystem at runtime.
+    logger.info("Configuring object cache. kind={}, routing={}, location={}".format(kind, routing, cache_location))
+    CacheManager(**parse_cache_config_options(cache_opts))
+    configure_memory_backend(max_bytes=memory_max_bytes)
+    configure_compression()
+    configure_serializer()
+    configure_local_cache()
+
+
+def backend_options(kind, cache_directory=None):
+    """
+    Options for the Beaker backend of the designated kind.
+    """
 
-        cache_data_dir = os.path.join(cache_directory, "data")
-        cache_lock_dir = os.path.join(cache_directory, "lock")
-        cache_opts = {
-            'cache.type': 'file',
-            'cache.data_dir': cache_data_dir,
-            'cache.lock_dir': cache_lock_dir,
+    # Cache backend: memory, bounded by a global byte budget.
+    if kind == "memory":
+        return {
+            'type': 'bounded_memory',
         }
 
-        cache_location = cache_directory
+    # Cache backend: filesystem.
+    elif kind == "filesystem":
+        return {
+            'type': 'file',
+            'data_dir': os.path.join(cache_directory, "data"),
+            'lock_dir': os.path.join(cache_directory, "lock"),
+        }
 
+    # Cache backend: MongoDB.
     elif kind == "mongodb":
-        cache_opts = {
-            'cache.type': 'ext:mongodb',
-            'cache.url': 'mongodb://localhost:27017/beaker.cache',
-            'cache.sparse_collection': True,
+        return {
+            'type': 'mongodb',
+            'url': 'mongodb://localhost:27017/beaker.cache',
+            'sparse_collection': True,
         }
 
-    else:
-        raise TypeError("Unknown cache backend: {}".format(kind))
 
-    # Set general options.
-    cache_opts.update({
-        'cache.regions': 'static,search,medium',
-        'cache.static.expire': 2592000,  # 1 month
-        'cache.search.expire': 604800,   # 1 week
-        'cache.medium.expire': 86400,    # 1 day
-        'cache.key_length': 512,
-    })
+def performance_options(region, kind, compression=None, serializer=None, local_max_entries=None):
+    """
+    Options for compressing, serializing and caching entries in-process,
+    when they are persisted.
+    """
+    if kind == "memory" or region == "negative":
+        return {}
 
-    # Configure the caching subsystem at runtime.
-    logger.info("Configuring object cache. kind={}, location={}".format(kind, cache_location))
-    CacheManager(**parse_cache_config_options(cache_opts))
+    options = {}
+
+    # Compress payloads.
+    if compression:
+        options['compression'] = compression
+
+    # Serialize JSON-like payloads without pickling them.
+    if serializer and region not in BLOB_REGIONS:
+        options['serializer'] = serializer
+
+    # Serve frequently requested entries from an in-process cache.
+    if local_max_entries and region not in BLOB_REGIONS:
+        options['local_max_entries'] = local_max_entries
+
+    return options
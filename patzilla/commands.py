@@ -8,6 +8,7 @@ import logging
 import click
 from docopt import docopt
 
+from patzilla.access.commands import cache_cli
 from patzilla.access.epo.ops.commands import ops_cli
 from patzilla.access.ificlaims.commands import ificlaims_cli
 from patzilla.boot.cache import configure_cache_backend
@@ -73,6 +74,7 @@ def make_config(ctx, kind, flavor):
 cli.add_command(cmd=make_config)
 cli.add_command(cmd=ops_cli)
 cli.add_command(cmd=ificlaims_cli)
+cli.add_command(cmd=cache_cli)
 
 
 def usercmd():
@@ -57,6 +57,14 @@ api_consumer_secret = {ops_api_consumer_secret}
 fulltext_enabled = true
 fulltext_countries = EP, WO, AT, BE, BG, CA, CH, CY, CZ, DK, EE, ES, FR, GB, GR, HR, IE, IT, LT, LU, MC, MD, ME, NO, PL, PT, RO, RS, SE, SK
 
+# How many requests to OPS may be in flight at the same time, per set of credentials.
+# This is used when assembling PDF documents out of single pages, for example.
+#max_concurrency = 4
+
+# Size of the HTTP connection pool and whether to keep connections alive, per set of credentials.
+#http_pool_size = 10
+#http_keep_alive = true
+
 
 [datasource:depatisconnect]
 
@@ -191,10 +199,11 @@ mongodb.patzilla.uri = mongodb://localhost:27017/patzilla
 
 # Cache settings
 cache.url = mongodb://localhost:27017/beaker.cache
-cache.regions = search, medium, longer, static
+cache.regions = search, medium, longer, static, negative
 cache.key_length = 512
 
-cache.search.type = ext:mongodb
+# The "mongodb" cache type expires entries on the server side, using a TTL index.
+cache.search.type = mongodb
 cache.search.sparse_collection = true
 
 cache.medium.type = mongodb_gridfs
@@ -203,6 +212,40 @@ cache.longer.type = mongodb_gridfs
 cache.longer.sparse_collection = true
 cache.static.type = mongodb_gridfs
 cache.static.sparse_collection = true
+cache.negative.type = mongodb
+cache.negative.sparse_collection = true
+
+# Large binary payloads like PDF documents and drawings are better
+# stored on the filesystem than within MongoDB, route them there.
+#cache.static.type = file
+#cache.static.data_dir = /var/cache/patzilla/data
+#cache.static.lock_dir = /var/cache/patzilla/lock
+#cache.longer.type = file
+#cache.longer.data_dir = /var/cache/patzilla/data
+#cache.longer.lock_dir = /var/cache/patzilla/lock
+
+# Compress cached payloads larger than the threshold (in bytes) using "zlib", "bz2" or "lzma".
+# Payloads which are already compressed, like PDF documents or PNG images, are stored as they are.
+#cache.search.compression = zlib
+#cache.medium.compression = zlib
+#cache.static.compression = zlib
+#cache.static.compression_threshold = 1024
+
+# Serialize JSON-like payloads using "json" or "msgpack" instead of pickling them.
+#cache.search.serializer = json
+#cache.medium.serializer = json
+
+# Serve frequently requested entries from an in-process LRU cache, bounded by
+# the number of entries and their size in bytes, keeping them for a short time (in seconds).
+#cache.search.local_max_entries = 1000
+#cache.search.local_max_bytes = 16777216
+#cache.search.local_expire = 60
+#cache.medium.local_max_entries = 1000
+
+# Keep cache regions in memory, bounded by a global budget and quotas per region, in bytes.
+#cache.memory_max_bytes = 268435456
+#cache.search.type = bounded_memory
+#cache.search.memory_quota = 67108864
 
 # 1 hour
 #cache.search.expire = 3600
@@ -211,8 +254,12 @@ cache.search.expire = 7200
 # 6 hours
 #cache.search.expire = 21600
 
-# medium: 1 day
+# Serve stale entries of the "search" region after 1 hour, while refreshing them in the background.
+cache.search.soft_expire = 3600
+
+# medium: 1 day, stale after 6 hours
 cache.medium.expire = 86400
+cache.medium.soft_expire = 21600
 
 # longer: 1 week
 cache.longer.expire = 604800
@@ -220,6 +267,28 @@ cache.longer.expire = 604800
 # static: 1 month
 cache.static.expire = 2592000
 
+# negative: 10 minutes
+# Remembers lookups of documents, drawings or search results which do not exist.
+cache.negative.expire = 600
+
+# Keep PDF documents and drawings as files within a content-addressed blob store,
+# for delivering them without loading them into memory. When running behind nginx,
+# let it deliver the files, by using an internal location pointing to the blob store directory.
+#blobstore.directory = /var/cache/patzilla/blobs
+#blobstore.expire = 2592000
+#blobstore.accel_redirect = /_blobs
+
+# Convert drawings within a pool of worker processes, instead of on the request thread.
+#image.workers = 4
+
+# Maximum number of concurrent requests per PDF data source, when acquiring multiple documents.
+#pdf.concurrency.epo-publication-server = 4
+#pdf.concurrency.uspto = 2
+#pdf.concurrency.epo-ops = 2
+
+# Request the direct PDF data sources and OPS concurrently, starting OPS after this number of seconds.
+#pdf.hedge_delay = 5
+
 
 
 ###
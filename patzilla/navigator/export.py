@@ -23,7 +23,7 @@ from cornice.util import _JSONError
 from xlsxwriter.worksheet import Worksheet
 from pyramid.httpexceptions import HTTPError
 from patzilla.access.generic.pdf import pdf_ziparchive_add
-from patzilla.access.epo.ops.api import ops_description, get_ops_biblio_data, ops_register, ops_claims, ops_family_inpadoc
+from patzilla.access.epo.ops.api import ops_description, get_ops_biblio_data, get_ops_biblio_data_many, ops_register, ops_claims, ops_family_inpadoc
 from patzilla.access.generic.exceptions import ignored
 from patzilla.util.date import humanize_date_english
 from patzilla.util.numbers.common import decode_patent_number, encode_epodoc_number
@@ -258,6 +258,17 @@ class Dossier(object):
             # via https://register.epo.org/application?number=EP08835045
             # TODO: Add equivalents, e.g. http://ops.epo.org/3.1/rest-services/published-data/publication/epodoc/EP1000000/equivalents/biblio
             status = OrderedDict()
+
+            # Acquire XML "bibliographic" data for all documents at once.
+            biblio_payloads = {}
+            if options.media.biblio:
+                try:
+                    biblio_documents = [document for document in documents if document and document.strip()]
+                    biblio_payloads = get_ops_biblio_data_many('publication', biblio_documents, xml=True)
+                except Exception as ex:
+                    log.warning('Bulk acquisition of bibliographic data failed: {}'.format(ex))
+                self.clear_request_errors(request)
+
             for document in documents:
 
                 if not document or not document.strip():
@@ -271,7 +282,7 @@ class Dossier(object):
                 # Add XML "bibliographic" data (full-cycle)
                 if options.media.biblio:
                     try:
-                        biblio_payload = get_ops_biblio_data('publication', document, xml=True)
+                        biblio_payload = biblio_payloads.get(document) or get_ops_biblio_data('publication', document, xml=True)
                         zipfile.writestr('media/xml/{document}.biblio.xml'.format(document=document), biblio_payload)
                         status[document]['biblio'] = True
 
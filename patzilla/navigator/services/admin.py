@@ -6,6 +6,9 @@ from cornice.service import Service
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.response import Response
 from patzilla.access.epo.ops.api import ops_service_usage
+from patzilla.util.cache.instrumentation import cache_statistics, reset_cache_statistics
+from patzilla.util.cache.local import local_cache_stats
+from patzilla.util.cache.memory import memory_usage
 from patzilla.util.date import week_range, month_range, year_range
 from patzilla.util.web.identity.store import User
 
@@ -91,3 +94,27 @@ def ops_usage_handler(request):
 
     response = ops_service_usage(date_begin, date_end)
     return response
+
+
+cache_stats_service = Service(
+    name='cache-stats',
+    path='/api/admin/cache/stats',
+    renderer='prettyjson',
+    description="Cache statistics interface")
+
+@cache_stats_service.get()
+def cache_stats_handler(request):
+    """
+    Respond with hits, misses, errors, bytes stored and time spent reading and
+    computing, per cache region and namespace, and with the usage of in-process caches.
+    """
+    return {
+        'regions': cache_statistics(),
+        'local': local_cache_stats(),
+        'memory': memory_usage(),
+    }
+
+@cache_stats_service.delete()
+def cache_stats_reset_handler(request):
+    reset_cache_statistics()
+    return {'status': 'ok'}
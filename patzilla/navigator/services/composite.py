@@ -2,10 +2,12 @@
 # (c) 2013-2015 Andreas Motl, Elmyra UG
 import logging
 from cornice.service import Service
-from pyramid.httpexceptions import HTTPNotFound, HTTPTemporaryRedirect
-from patzilla.access.drawing import get_drawing_png
+from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound, HTTPTemporaryRedirect
+from patzilla.access.drawing import DRAWING_FORMATS, drawing_width, get_drawing_png, get_drawing_variant
 from patzilla.access.generic.pdf import pdf_universal, pdf_ziparchive
 from patzilla.util.date import datetime_iso_filename, now
+from patzilla.util.image.convert import IMAGE_FORMATS
+from patzilla.util.python.concurrency import iterate_with_threadlocals
 
 log = logging.getLogger(__name__)
 
@@ -20,16 +22,31 @@ pdf_service = Service(
     description="Retrieve patent document PDF files")
 
 
-@drawing_service.get(renderer='png')
+@drawing_service.get(renderer='null')
 def drawing_handler(request):
-    """request drawing, convert from tiff to png"""
+    """
+    request drawing, convert from tiff to png
 
-    # TODO: respond with proper 4xx codes if something fails
+    Optionally, derive a smaller image using the ``width`` parameter,
+    or another image format using the ``format`` parameter,
+    which is one of "png", "webp" or "jpeg" (grayscale).
+    """
 
     patent = request.matchdict['patent']
-    page = int(request.params.get('page', 1))
-    png = get_drawing_png(patent, page, 'FullDocumentDrawing')
-    return png
+    try:
+        page = int(request.params.get('page', 1))
+        width = request.params.get('width') and drawing_width(int(request.params['width']))
+    except ValueError:
+        raise HTTPBadRequest('Parameters "page" and "width" must be integers')
+
+    format = request.params.get('format', 'png').lower()
+    if format not in DRAWING_FORMATS:
+        raise HTTPBadRequest('Parameter "format" must be one of {}'.format(', '.join(DRAWING_FORMATS)))
+
+    request.response.content_type = IMAGE_FORMATS[format][1]
+    if not width and format == 'png':
+        return get_drawing_png(patent, page, 'FullDocumentDrawing')
+    return get_drawing_variant(patent, page, 'FullDocumentDrawing', width, format)
 
 
 @pdf_service.get(renderer='null')
@@ -72,11 +89,12 @@ def pdf_serve_multi(request):
     patents = patents_raw.split(',')
     patents = [patent.strip() for patent in patents]
 
-    data = pdf_ziparchive(patents)
     zipfilename = 'ip-navigator-collection-pdf_{0}.zip'.format(datetime_iso_filename(now()))
 
     # http://tools.ietf.org/html/rfc6266#section-4.2
     request.response.content_type = 'application/zip'
     request.response.charset = None
     request.response.headers['Content-Disposition'] = 'attachment; filename={0}'.format(zipfilename)
-    return data['zip']
+
+    # Stream the archive while acquiring the documents.
+    return iterate_with_threadlocals(pdf_ziparchive(patents))
@@ -5,9 +5,9 @@ import logging
 import re
 from cornice.service import Service
 from pyramid.httpexceptions import HTTPNotFound, HTTPBadRequest
-from beaker.cache import cache_region
 from patzilla.access.dpma import dpmaregister
 from patzilla.access.generic.exceptions import NoResultsException
+from patzilla.util.cache.keys import canonical_cache_region
 from patzilla.util.config import asbool
 from patzilla.util.expression.keywords import clean_keyword, keywords_to_response
 from patzilla.util.python import _exception_traceback, exception_traceback
@@ -172,7 +172,7 @@ def depatisnet_published_data_crawl_handler(request):
         request.errors.add('depatisnet-search', 'crawl', message)
 
 
-@cache_region('search', 'dpma_search')
+@canonical_cache_region('search', 'dpma_search')
 def dpma_published_data_search(query, options):
     return dpma_published_data_search_real(query, options)
 
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 # (c) 2013-2015 Andreas Motl, Elmyra UG
 import logging
-from beaker.cache import cache_region
 from cornice.service import Service
+from patzilla.util.cache.instrumentation import cache_region
 from patzilla.access.google.search import GooglePatentsAccess
 
 log = logging.getLogger(__name__)
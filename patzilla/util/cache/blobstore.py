@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Content-addressed blob store for large binary payloads.
+
+PDF documents and drawings can be several megabytes large. Pickling them
+into cache backends means to load them into memory completely on each
+cache hit, just to pass them through to the client.
+
+The blob store keeps those payloads as files on disk. Payloads are
+stored by the SHA-256 digest of their content, so identical payloads are
+stored only once. References from document numbers and variants to
+payloads are kept in small JSON files. Both are written atomically to a
+sharded directory tree::
+
+    <directory>/objects/3f/a2/3fa2...
+    <directory>/refs/pdf-ops/9c/1e/EP666666B1.json
+
+Files are served by the web server directly, either through the WSGI
+server's ``wsgi.file_wrapper``, or by nginx, using ``X-Accel-Redirect``.
+
+The blob store is configured within the ``[app:main]`` section::
+
+    blobstore.directory = /var/cache/patzilla/blobs
+    blobstore.expire = 2592000
+    blobstore.accel_redirect = /_blobs
+"""
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from functools import wraps
+
+from beaker.cache import cache_regions
+
+logger = logging.getLogger(__name__)
+
+
+BLOBSTORE_EXPIRE_DEFAULT = 2592000
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Blob(object):
+    """
+    A payload within the blob store.
+    """
+
+    def __init__(self, store, digest, size, content_type=None):
+        self.store = store
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+
+    @property
+    def path(self):
+        return self.store.object_path(self.digest)
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<Blob {} size={}>'.format(self.digest, self.size)
+
+
+class BlobStore(object):
+    """
+    Content-addressed store for binary payloads, keyed by variant and document number.
+    """
+
+    def __init__(self, directory, expire=BLOBSTORE_EXPIRE_DEFAULT, accel_redirect=None, clock=None):
+        self.directory = directory
+        self.expire = expire and int(expire) or None
+        self.accel_redirect = accel_redirect and accel_redirect.rstrip('/') or None
+        self.clock = clock or time.time
+        self.tmp_directory = os.path.join(directory, 'tmp')
+        makedirs(self.tmp_directory)
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest[2:4], digest)
+
+    def ref_path(self, variant, document):
+        shard = hashlib.sha1(document.encode('utf-8')).hexdigest()
+        filename = safe_name(document) + '.json'
+        return os.path.join(self.directory, 'refs', safe_name(variant), shard[:2], shard[2:4], filename)
+
+    def get(self, variant, document, expire=None):
+        """
+        Get the blob stored for a document and variant.
+        Raise ``KeyError`` when there is no such blob or when it has expired.
+
+        ``expire`` overrides the expiration time of the blob store, in seconds.
+        """
+        try:
+            with open(self.ref_path(variant, document), 'r') as f:
+                ref = json.load(f)
+        except (IOError, OSError, ValueError):
+            raise KeyError((variant, document))
+
+        if self.expired(ref, expire=expire):
+            raise KeyError((variant, document))
+
+        blob = Blob(self, ref['digest'], ref['size'], content_type=ref.get('content_type'))
+        if not os.path.exists(blob.path):
+            raise KeyError((variant, document))
+
+        return blob
+
+    def put(self, variant, document, payload, content_type=None, expire=None):
+        """
+        Store a payload for a document and variant. The payload is either
+        a bytes object or a file-like object, which will be read in chunks.
+
+        ``expire`` overrides the expiration time of the blob store, in seconds.
+        It is recorded along with the blob, for pruning expired blobs.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter_chunks(payload):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+
+            # Identical payloads are stored only once.
+            path = self.object_path(digest)
+            if os.path.exists(path):
+                os.unlink(tmp_path)
+            else:
+                os.chmod(tmp_path, 0o644)
+                makedirs(os.path.dirname(path))
+                os.replace(tmp_path, path)
+
+        except:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        ref = {'digest': digest, 'size': size, 'stored': self.clock(), 'content_type': content_type}
+        if expire:
+            ref['expire'] = int(expire)
+        self.write_atomic(self.ref_path(variant, document), json.dumps(ref).encode('utf-8'))
+
+        return Blob(self, digest, size, content_type=content_type)
+
+    def remove(self, variant, document):
+        try:
+            os.unlink(self.ref_path(variant, document))
+        except OSError:
+            pass
+
+    def prune(self):
+        """
+        Remove expired references and payloads which are not referenced any longer.
+        """
+        referenced = set()
+        for path in walk_files(os.path.join(self.directory, 'refs')):
+            try:
+                with open(path, 'r') as f:
+                    ref = json.load(f)
+                if self.expired(ref):
+                    os.unlink(path)
+                    continue
+                referenced.add(ref['digest'])
+            except (IOError, OSError, ValueError):
+                continue
+
+        for path in walk_files(os.path.join(self.directory, 'objects')):
+            if os.path.basename(path) not in referenced:
+                os.unlink(path)
+
+    def expired(self, ref, expire=None):
+        expire = expire and int(expire) or ref.get('expire') or self.expire
+        return bool(expire) and ref['stored'] + expire <= self.clock()
+
+    def accel_redirect_location(self, blob):
+        """
+        The internal location of a blob for nginx's ``X-Accel-Redirect``.
+        """
+        path = os.path.relpath(blob.path, self.directory).replace(os.sep, '/')
+        return '{}/{}'.format(self.accel_redirect, path)
+
+    def write_atomic(self, path, data):
+        makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+
+
+def walk_files(directory):
+    for root, dirs, files in os.walk(directory):
+        for filename in files:
+            yield os.path.join(root, filename)
+
+
+def iter_chunks(payload):
+    if isinstance(payload, (bytes, bytearray)):
+        yield bytes(payload)
+        return
+    while True:
+        chunk = payload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+# The blob store in use, if configured.
+blob_store = None
+
+
+def configure_blob_store(directory, expire=BLOBSTORE_EXPIRE_DEFAULT, accel_redirect=None):
+    global blob_store
+    if directory:
+        logger.info('Configuring blob store at "{}". expire={}, accel_redirect={}'.format(
+            directory, expire, accel_redirect))
+        blob_store = BlobStore(directory, expire=expire, accel_redirect=accel_redirect)
+    else:
+        blob_store = None
+    return blob_store
+
+
+def get_blob_store():
+    return blob_store
+
+
+def blob_payload(value):
+    """
+    Read the payload of a blob into memory. Other values are returned as they are.
+    """
+    if isinstance(value, Blob):
+        return value.read()
+    return value
+
+
+def blob_cache(variant, content_type=None):
+    """
+    Decorator for keeping binary payloads returned by ``func(document, *args, **kwargs)``
+    within the blob store, keyed by document number and variant. Additional
+    arguments will become part of the variant.
+
+    It should be applied on top of the ``cache_region`` decorator. When the
+    blob store is configured, the decorated function will return a ``Blob``
+    and bypass the cache region, while obeying its expiration time.
+    Otherwise, it will be invoked as usual.
+    """
+
+    def decorate(func):
+        uncached = getattr(func, '__wrapped__', func)
+        signature = inspect.signature(uncached)
+        region = getattr(func, '_arg_region', None)
+
+        @wraps(func)
+        def cached(document, *args, **kwargs):
+            store = get_blob_store()
+            if store is None:
+                return func(document, *args, **kwargs)
+
+            # Arguments passed by keyword will be keyed like positional ones.
+            bound = signature.bind(document, *args, **kwargs)
+            name = '-'.join(
+                [variant] + [str(arg) for arg in bound.args[1:]] +
+                ['{}={}'.format(key, value) for key, value in sorted(bound.kwargs.items())])
+
+            expire = cache_regions.get(region, {}).get('expire')
+            try:
+                return store.get(name, document, expire=expire)
+            except KeyError:
+                pass
+
+            payload = uncached(document, *args, **kwargs)
+            if payload is None:
+                return payload
+            return store.put(name, document, payload, content_type=content_type, expire=expire)
+
+        return cached
+
+    return decorate
+
+
+def includeme(config):
+    settings = config.registry.settings
+    configure_blob_store(
+        settings.get('blobstore.directory'),
+        expire=settings.get('blobstore.expire', BLOBSTORE_EXPIRE_DEFAULT),
+        accel_redirect=settings.get('blobstore.accel_redirect'))
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Transparent compression of cached payloads.
+
+A cache region is compressed by configuring a codec, optionally along
+with the minimum size of payloads to compress, in bytes::
+
+    cache.search.compression = zlib
+    cache.search.compression_threshold = 1024
+
+The region's backend will then be wrapped by ``CompressingNamespaceManager``,
+which compresses payloads before they reach the backend and decompresses
+them on the way back. Payloads which are already compressed, like PDF
+documents or PNG images, are stored as they are. Entries written before
+compression has been enabled remain readable.
+"""
+import bz2
+import logging
+import lzma
+import pickle
+import zlib
+
+from beaker.cache import cache_regions, clsmap
+
+logger = logging.getLogger(__name__)
+
+
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+COMPRESSION_THRESHOLD_DEFAULT = 1024
+
+# Signatures of binary formats which are already compressed.
+COMPRESSED_SIGNATURES = (
+    b'%PDF',                # PDF
+    b'\x89PNG',             # PNG
+    b'\xff\xd8\xff',        # JPEG
+    b'GIF8',                # GIF
+    b'II*\x00',             # TIFF, little endian
+    b'MM\x00*',             # TIFF, big endian
+    b'PK\x03\x04',          # ZIP
+    b'\x1f\x8b',            # gzip
+)
+
+
+class CompressedPayload(object):
+    """
+    Container for a compressed and pickled payload.
+    """
+
+    def __init__(self, codec, data):
+        self.codec = codec
+        self.data = data
+
+
+def is_compressed_format(value):
+    """
+    Whether the value is a binary payload in an already compressed format.
+
+    >>> is_compressed_format(b'%PDF-1.4')
+    True
+    >>> is_compressed_format(b'<?xml version="1.0"?>')
+    False
+    """
+    return isinstance(value, bytes) and value.startswith(COMPRESSED_SIGNATURES)
+
+
+def compress_value(value, codec='zlib', threshold=COMPRESSION_THRESHOLD_DEFAULT):
+    """
+    Compress a value when it is large enough and when compression pays off.
+    Otherwise, return the value as it is.
+    """
+    if value is None or isinstance(value, CompressedPayload) or is_compressed_format(value):
+        return value
+    payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if len(payload) < threshold:
+        return value
+    compress, _ = CODECS[codec]
+    data = compress(payload)
+    if len(data) >= len(payload):
+        return value
+    return CompressedPayload(codec, data)
+
+
+def decompress_value(value):
+    """
+    Decompress a value when it has been compressed by ``compress_value``.
+    """
+    if not isinstance(value, CompressedPayload):
+        return value
+    _, decompress = CODECS[value.codec]
+    return pickle.loads(decompress(value.data))
+
+
+class CompressingNamespaceManager(object):
+    """
+    Beaker namespace manager compressing the payloads
+    stored by another namespace manager.
+
+    Beaker stores entries as ``(storedtime, expiretime, value)`` tuples,
+    only their values are compressed.
+    """
+
+    def __init__(self, namespace, backend_type, compression='zlib',
+                 compression_threshold=COMPRESSION_THRESHOLD_DEFAULT, **nsargs):
+        if compression not in CODECS:
+            raise ValueError('Unknown cache compression codec: {}'.format(compression))
+        self.backend = clsmap[backend_type](namespace, **nsargs)
+        self.codec = compression
+        self.threshold = int(compression_threshold)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def compress(self, entry):
+        if isinstance(entry, tuple) and len(entry) == 3:
+            storedtime, expiretime, value = entry
+            return storedtime, expiretime, compress_value(value, codec=self.codec, threshold=self.threshold)
+        return entry
+
+    def decompress(self, entry):
+        if isinstance(entry, tuple) and len(entry) == 3:
+            storedtime, expiretime, value = entry
+            return storedtime, expiretime, decompress_value(value)
+        return entry
+
+    def set_value(self, key, value, expiretime=None):
+        self.backend.set_value(key, self.compress(value), expiretime=expiretime)
+
+    def __setitem__(self, key, value):
+        self.backend[key] = self.compress(value)
+
+    def __getitem__(self, key):
+        return self.decompress(self.backend[key])
+
+    def __contains__(self, key):
+        return key in self.backend
+
+    def __delitem__(self, key):
+        del self.backend[key]
+
+
+def configure_compression(regions=None):
+    """
+    Wrap the backends of all cache regions which have a compression codec configured.
+    """
+    if regions is None:
+        regions = cache_regions
+    for name, settings in regions.items():
+        compression = settings.get('compression')
+        if not compression or compression == 'none' or settings.get('backend_type'):
+            continue
+        if compression not in CODECS:
+            raise ValueError('Unknown compression codec "{}" for cache region "{}"'.format(compression, name))
+        logger.info('Compressing cache region "{}" using {}'.format(name, compression))
+        settings['backend_type'] = settings.get('type', 'memory')
+        settings['type'] = 'compressed'
+
+
+def includeme(config):
+    configure_compression()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Instrumentation of cached functions.
+
+The ``cache_region`` decorator is a drop-in replacement for Beaker's
+decorator of the same name. It computes the same namespaces and cache
+keys, and additionally records, per cache region and namespace:
+
+- the number of hits, misses and errors,
+- the number of bytes stored, as estimated by ``estimate_size``,
+- the time spent reading from the cache and computing values.
+
+Use ``cache_statistics`` to inspect the numbers.
+"""
+import inspect
+import threading
+import time
+from functools import wraps
+from hashlib import sha1
+from itertools import chain
+
+from beaker import util
+from beaker.cache import Cache, cache_regions
+from beaker.exceptions import BeakerException
+
+from patzilla.util.cache.memory import estimate_size
+
+
+class CacheStatistics(object):
+    """
+    Counters for the entries of a cache namespace within a region.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_stored = 0
+        self.read_time = 0.0
+        self.compute_time = 0.0
+
+    def record(self, read_time, compute_time=None, size=None, error=False):
+        with self.lock:
+            self.read_time += read_time
+            if compute_time is None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.compute_time += compute_time
+            if size:
+                self.bytes_stored += size
+            if error:
+                self.errors += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'bytes_stored': self.bytes_stored,
+                'read_time': round(self.read_time, 6),
+                'compute_time': round(self.compute_time, 6),
+            }
+
+
+# Statistics, keyed by cache region name and namespace.
+statistics = {}
+statistics_lock = threading.Lock()
+
+
+def get_statistics(region, namespace):
+    with statistics_lock:
+        key = (region, namespace)
+        if key not in statistics:
+            statistics[key] = CacheStatistics()
+        return statistics[key]
+
+
+def cache_statistics():
+    """
+    Report the statistics of all cache regions and their namespaces.
+    """
+    with statistics_lock:
+        items = sorted(statistics.items())
+    report = {}
+    for (region, namespace), stats in items:
+        report.setdefault(region, {})[namespace] = stats.as_dict()
+    return report
+
+
+def reset_cache_statistics():
+    with statistics_lock:
+        statistics.clear()
+
+
+def value_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return estimate_size(value)
+
+
+# The cache entry most recently served from the cache to the current thread.
+served = threading.local()
+
+
+def served_entry_stored(namespace, key):
+    """
+    Return the time the entry ``key`` of ``namespace`` was stored, if it
+    has been the cache entry most recently served to the current thread.
+    Otherwise, return ``None``.
+    """
+    entry = getattr(served, 'entry', None)
+    if entry is not None and entry[:2] == (namespace, key):
+        return entry[2]
+
+
+def read_entry(value):
+    """
+    Read the payload of a cache entry along with the time it was stored.
+    Raise ``KeyError`` when there is no such entry or when it has expired.
+    """
+    value.namespace.acquire_read_lock()
+    try:
+        stored, expired, payload = value._get_value()
+    finally:
+        value.namespace.release_read_lock()
+    if value._is_expired(stored, expired):
+        raise KeyError(value.key)
+    return stored, payload
+
+
+def get_value_instrumented(region, namespace, cache, key, createfunc):
+    """
+    Get a value from the cache, creating it using ``createfunc`` on a miss,
+    and record the outcome within the statistics of the cache namespace.
+
+    Like Beaker's ``Value.get_value``, creating values is serialized by the
+    creation lock of the cache key, checking for the entry again after
+    acquiring it. In contrast, hits are served by reading the entry once.
+    """
+    stats = get_statistics(region, namespace)
+    start = time.perf_counter()
+    value = cache._get_value(key, createfunc=createfunc)
+
+    try:
+        stored, payload = read_entry(value)
+        served.entry = (namespace, key, stored)
+        stats.record(time.perf_counter() - start)
+        return payload
+    except KeyError:
+        pass
+
+    creation_lock = value.namespace.get_creation_lock(value.key)
+    creation_lock.acquire()
+    try:
+
+        # The value might have been created while waiting for the lock.
+        try:
+            stored, payload = read_entry(value)
+            served.entry = (namespace, key, stored)
+            stats.record(time.perf_counter() - start)
+            return payload
+        except KeyError:
+            pass
+
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            payload = createfunc()
+        except Exception:
+            stats.record(read_time, compute_time=time.perf_counter() - start, error=True)
+            raise
+        compute_time = time.perf_counter() - start
+        value.set_value(payload)
+        stats.record(read_time, compute_time=compute_time, size=value_size(payload))
+        return payload
+
+    finally:
+        creation_lock.release()
+
+
+def cache_region(region, *deco_args):
+    """
+    Like Beaker's ``cache_region`` decorator, but records cache statistics.
+    """
+
+    def decorate(func):
+        namespace = util.func_namespace(func)
+        skip_self = util.has_self_arg(func)
+        signature = inspect.signature(func)
+
+        def cache_key(args, kwargs):
+            key_kwargs = []
+            if kwargs:
+                bound = signature.bind(*args, **kwargs)
+                args, kwargs = bound.args, bound.kwargs
+                key_kwargs = [':'.join((str(key), str(value))) for key, value in kwargs.items()]
+            if skip_self:
+                args = args[1:]
+            key = " ".join(map(str, chain(deco_args, args, key_kwargs)))
+            key_length = cache_regions[region].get('key_length', util.DEFAULT_CACHE_KEY_LENGTH)
+            if len(key) + len(namespace) > int(key_length):
+                key = sha1(key.encode('utf-8')).hexdigest()
+            return key
+
+        @wraps(func)
+        def cached(*args, **kwargs):
+            if region not in cache_regions:
+                raise BeakerException('Cache region not configured: %s' % region)
+            if not cache_regions[region].get('enabled', True):
+                return func(*args, **kwargs)
+            cache = Cache._get_cache(namespace, cache_regions[region])
+            return get_value_instrumented(
+                region, namespace, cache, cache_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        cached._arg_namespace = namespace
+        cached._arg_region = region
+        cached._arg_key = cache_key
+        return cached
+
+    return decorate
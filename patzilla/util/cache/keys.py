@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Canonical cache keys for search functions.
+
+Beaker's ``cache_region`` decorator builds cache keys from the string
+representation of the function arguments. For search functions, this has
+some drawbacks:
+
+- Long query expressions yield long keys.
+- Expressions which only differ in whitespace or in the case of
+  boolean operators will not share cache entries.
+- The string representation of option dictionaries depends on the
+  order their items have been added.
+
+The ``canonical_cache_region`` decorator canonicalizes the query expression
+through the CQL parser, normalizes option dictionaries and hashes the
+outcome into a key of fixed length.
+"""
+import inspect
+import json
+from collections.abc import Mapping
+from functools import lru_cache, wraps
+from hashlib import sha1
+
+from beaker import util
+from beaker.cache import Cache, cache_regions
+from beaker.exceptions import BeakerException
+
+from patzilla.util.cache.instrumentation import get_value_instrumented
+from patzilla.util.cql.pyparsing import CQL
+
+
+@lru_cache(maxsize=1024)
+def canonical_expression(expression):
+    """
+    Canonicalize a query expression by parsing and serializing it through
+    the CQL parser. Expressions in other syntaxes will only get their
+    whitespace normalized.
+
+    >>> canonical_expression('pa=siemens  AND  ti=(foo OR bar)')
+    'pa=siemens and ti=(foo or bar)'
+    >>> canonical_expression('<applicant type="inpadoc">grohe</applicant>\\n')
+    '<applicant type="inpadoc">grohe</applicant>'
+    """
+    expression = ' '.join(expression.split())
+    if not expression:
+        return expression
+    try:
+        return CQL(expression, logging=False).dumps() or expression
+    except Exception:
+        return expression
+
+
+def canonical_query(query):
+    """
+    Canonicalize a query, which is either an expression or
+    a dictionary carrying the expression in its ``expression`` item.
+    """
+    if isinstance(query, str):
+        return canonical_expression(query)
+    if isinstance(query, Mapping) and isinstance(query.get('expression'), str):
+        query = dict(query)
+        query['expression'] = canonical_expression(query['expression'])
+    return canonical_value(query)
+
+
+def canonical_value(value):
+    """
+    Normalize a value into a form which can be serialized
+    to JSON independently of the order of dictionary items.
+    """
+    if isinstance(value, Mapping):
+        return {str(key): canonical_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(item) for item in value]
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    return value
+
+
+def canonical_cache_region(region, *deco_args, expression='query'):
+    """
+    Like the ``cache_region`` decorator, but computes canonical cache keys.
+
+    The ``expression`` option designates the function argument
+    carrying the query expression, it defaults to ``query``.
+    """
+
+    def decorate(func):
+        namespace = util.func_namespace(func)
+        signature = inspect.signature(func)
+
+        def cache_key(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            parts = list(deco_args)
+            for name, value in bound.arguments.items():
+                if name == expression:
+                    value = canonical_query(value)
+                else:
+                    value = canonical_value(value)
+                parts.append([name, value])
+            canonical = json.dumps(parts, sort_keys=True, default=str)
+            return sha1(canonical.encode('utf-8')).hexdigest()
+
+        @wraps(func)
+        def cached(*args, **kwargs):
+            if region not in cache_regions:
+                raise BeakerException('Cache region not configured: %s' % region)
+            if not cache_regions[region].get('enabled', True):
+                return func(*args, **kwargs)
+            cache = Cache._get_cache(namespace, cache_regions[region])
+            return get_value_instrumented(
+                region, namespace, cache, cache_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        cached._arg_namespace = namespace
+        cached._arg_region = region
+        cached._arg_key = cache_key
+        return cached
+
+    return decorate
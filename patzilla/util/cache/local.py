@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+In-process cache in front of shared cache backends.
+
+Each hit against a MongoDB or filesystem cache region costs a round trip
+or a file read, plus unpickling the payload. For small values which are
+requested often, like the metadata of drawings or kindcodes of documents,
+this overhead dominates rendering result lists.
+
+A cache region can be configured with an in-process LRU cache, bounded
+by the number of entries and by the size of their payloads in bytes.
+Entries are kept for a short time only, so that changes made by other
+processes will be picked up::
+
+    cache.search.local_max_entries = 1000
+    cache.search.local_max_bytes = 16777216
+    cache.search.local_expire = 60
+
+The region's backend will then be wrapped by ``LocalCacheNamespaceManager``,
+which serves entries from the in-process cache and falls back to the backend.
+
+Like with Beaker's ``memory`` backend, entries are kept as they are and
+served without copying them, so callers must not modify cached values in place.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from beaker.cache import cache_regions, clsmap
+
+from patzilla.util.cache.memory import estimate_size
+
+logger = logging.getLogger(__name__)
+
+
+LOCAL_MAX_BYTES_DEFAULT = 16 * 1024 * 1024
+LOCAL_EXPIRE_DEFAULT = 60
+
+
+class LocalCache(object):
+    """
+    Thread-safe LRU cache bounded by the number of entries and by
+    their total size in bytes, with a time to live for each entry.
+    """
+
+    def __init__(self, max_entries, max_bytes=LOCAL_MAX_BYTES_DEFAULT, expire=LOCAL_EXPIRE_DEFAULT, clock=None):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.expire = float(expire)
+        self.clock = clock or time.time
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, count=True):
+        """
+        Get an entry, raise ``KeyError`` when there is no such entry or when it has expired.
+        """
+        with self.lock:
+            try:
+                value, size, expires = self.entries[key]
+                if expires <= self.clock():
+                    self._remove(key)
+                    raise KeyError(key)
+            except KeyError:
+                if count:
+                    self.misses += 1
+                raise
+            self.entries.move_to_end(key)
+            if count:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store an entry, evicting the least recently used entries when running out of space.
+        Entries larger than the whole cache will not be stored.
+        """
+        size = estimate_size(value)
+        with self.lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size, self.clock() + self.expire)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def discard_namespace(self, namespace):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == namespace]:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# In-process caches, keyed by cache region name.
+local_caches = {}
+local_caches_lock = threading.Lock()
+
+
+def get_local_cache(region, max_entries, max_bytes=LOCAL_MAX_BYTES_DEFAULT, expire=LOCAL_EXPIRE_DEFAULT):
+    with local_caches_lock:
+        if region not in local_caches:
+            local_caches[region] = LocalCache(max_entries, max_bytes=max_bytes, expire=expire)
+        return local_caches[region]
+
+
+def local_cache_stats():
+    """
+    Report the number of entries, their size and the hit and miss counters of all in-process caches.
+    """
+    with local_caches_lock:
+        caches = dict(local_caches)
+    return {region: cache.stats() for region, cache in caches.items()}
+
+
+class LocalCacheNamespaceManager(object):
+    """
+    Beaker namespace manager serving entries from an in-process
+    cache in front of another namespace manager.
+
+    Reading entries from the in-process cache does not need to acquire
+    the backend's read lock, which, for the filesystem backend, would
+    already read the whole entry from disk.
+
+    Hits and misses are counted when reading entries. When Beaker checks
+    for the presence of an entry before reading it, the entry is fetched
+    right away.
+    """
+
+    def __init__(self, namespace, local_backend_type, local_region, local_max_entries,
+                 local_max_bytes=LOCAL_MAX_BYTES_DEFAULT, local_expire=LOCAL_EXPIRE_DEFAULT, **nsargs):
+        self.backend = clsmap[local_backend_type](namespace, **nsargs)
+        self.namespace = namespace
+        self.local = get_local_cache(
+            local_region, max_entries=local_max_entries, max_bytes=local_max_bytes, expire=local_expire)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def acquire_read_lock(self):
+        pass
+
+    def release_read_lock(self):
+        pass
+
+    def __contains__(self, key):
+        try:
+            self.local.get((self.namespace, key), count=False)
+            return True
+        except KeyError:
+            pass
+
+        self.backend.acquire_read_lock()
+        try:
+            if key not in self.backend:
+                return False
+            entry = self.backend[key]
+        except KeyError:
+            return False
+        finally:
+            self.backend.release_read_lock()
+        self.local.put((self.namespace, key), entry)
+        return True
+
+    def __getitem__(self, key):
+        try:
+            return self.local.get((self.namespace, key))
+        except KeyError:
+            pass
+        self.backend.acquire_read_lock()
+        try:
+            entry = self.backend[key]
+        finally:
+            self.backend.release_read_lock()
+        self.local.put((self.namespace, key), entry)
+        return entry
+
+    def set_value(self, key, value, expiretime=None):
+        self.backend.set_value(key, value, expiretime=expiretime)
+        self.local.put((self.namespace, key), value)
+
+    def __setitem__(self, key, value):
+        self.backend[key] = value
+        self.local.put((self.namespace, key), value)
+
+    def __delitem__(self, key):
+        self.local.discard((self.namespace, key))
+        del self.backend[key]
+
+    def remove(self):
+        self.local.discard_namespace(self.namespace)
+        self.backend.remove()
+
+
+def configure_local_cache(regions=None):
+    """
+    Put an in-process cache in front of the backends of all
+    cache regions which have ``local_max_entries`` configured.
+    """
+    if regions is None:
+        regions = cache_regions
+    for name, settings in regions.items():
+        if not int(settings.get('local_max_entries') or 0) or settings.get('local_backend_type'):
+            continue
+        logger.info('Using in-process cache for cache region "{}". max_entries={}, max_bytes={}, expire={}'.format(
+            name, settings['local_max_entries'],
+            settings.get('local_max_bytes', LOCAL_MAX_BYTES_DEFAULT), settings.get('local_expire', LOCAL_EXPIRE_DEFAULT)))
+        settings['local_backend_type'] = settings.get('type', 'memory')
+        settings['local_region'] = name
+        settings['type'] = 'local'
+
+
+def includeme(config):
+    configure_local_cache()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+In-memory cache backend with bounded memory usage.
+
+Beaker's ``memory`` backend keeps all entries until the process ends.
+Within long-running workers, which also cache PDF documents and drawings,
+it grows without limits.
+
+The ``bounded_memory`` backend keeps the entries of all cache regions
+within a global byte budget. Optionally, each region can be assigned a
+quota of its own. When running out of space, the least recently used
+entries are evicted. The size of entries is estimated by walking their
+values, see ``estimate_size``::
+
+    cache.memory_max_bytes = 268435456
+    cache.search.type = bounded_memory
+    cache.search.memory_quota = 67108864
+
+Use ``memory_usage`` to inspect the current usage of the budget.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+
+from beaker.cache import cache_regions
+from beaker.container import AbstractDictionaryNSManager
+
+from patzilla.util.cache.region import region_backend_type
+
+logger = logging.getLogger(__name__)
+
+
+MEMORY_MAX_BYTES_DEFAULT = 256 * 1024 * 1024
+
+# Limit the recursion when estimating the size of nested values.
+ESTIMATE_MAX_DEPTH = 16
+
+
+def estimate_size(value, depth=0):
+    """
+    Approximate the memory footprint of a value in bytes,
+    including the items of containers and the attributes of objects.
+
+    >>> estimate_size(b'x' * 1000) > 1000
+    True
+    >>> estimate_size({'foo': [b'x' * 1000, b'y' * 1000]}) > 2000
+    True
+    """
+    size = sys.getsizeof(value)
+    if depth >= ESTIMATE_MAX_DEPTH or isinstance(value, (str, bytes, bytearray, int, float)):
+        return size
+    depth += 1
+    if isinstance(value, Mapping):
+        size += sum(estimate_size(key, depth) + estimate_size(item, depth) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, depth) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += estimate_size(vars(value), depth)
+    return size
+
+
+class RegionUsage(object):
+    """
+    Entries of a cache region in least recently used order, with their accounted size.
+    """
+
+    def __init__(self, quota=None):
+        self.quota = quota and int(quota) or None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def oldest(self):
+        key = next(iter(self.entries))
+        return key, self.entries[key]
+
+
+class MemoryBudget(object):
+    """
+    Thread-safe storage for the entries of all cache regions using the
+    ``bounded_memory`` backend, bounded by a global byte budget and by
+    optional quotas per region.
+
+    Each entry is tagged with a global access counter, so that the least
+    recently used entry across all regions can be found by comparing the
+    oldest entries of each region.
+    """
+
+    def __init__(self, max_bytes=MEMORY_MAX_BYTES_DEFAULT):
+        self.max_bytes = int(max_bytes)
+        self.regions = {}
+        self.size = 0
+        self.tick = 0
+        self.lock = threading.RLock()
+
+    def region(self, name, quota=None):
+        with self.lock:
+            if name not in self.regions:
+                self.regions[name] = RegionUsage(quota=quota)
+            elif quota is not None:
+                self.regions[name].quota = quota and int(quota) or None
+            return self.regions[name]
+
+    def get(self, region, key):
+        """
+        Get an entry, raise ``KeyError`` when there is no such entry.
+        """
+        with self.lock:
+            usage = self.regions[region]
+            value, size, _ = usage.entries[key]
+            self.tick += 1
+            usage.entries[key] = (value, size, self.tick)
+            usage.entries.move_to_end(key)
+            return value
+
+    def contains(self, region, key):
+        with self.lock:
+            return key in self.regions[region].entries
+
+    def put(self, region, key, value):
+        """
+        Store an entry, evicting the least recently used entries when running out of space.
+        Entries larger than the quota of their region or the whole budget will not be stored.
+        """
+        size = estimate_size(value)
+        with self.lock:
+            usage = self.region(region)
+            self._remove(usage, key)
+            if size > self.max_bytes or (usage.quota and size > usage.quota):
+                logger.debug('Not caching entry {} of region "{}" with {} bytes'.format(key, region, size))
+                return
+            self.tick += 1
+            usage.entries[key] = (value, size, self.tick)
+            usage.size += size
+            self.size += size
+            while usage.quota and usage.size > usage.quota:
+                self._evict(usage)
+            self.shrink()
+
+    def shrink(self):
+        """
+        Evict the least recently used entries across all regions until the budget is met.
+        """
+        with self.lock:
+            while self.size > self.max_bytes:
+                self._evict(min(
+                    (usage for usage in self.regions.values() if usage.entries),
+                    key=lambda usage: usage.oldest()[1][2]))
+
+    def discard(self, region, key):
+        with self.lock:
+            self._remove(self.regions[region], key)
+
+    def keys(self, region, namespace):
+        with self.lock:
+            return [key for key in self.regions[region].entries if key[0] == namespace]
+
+    def _evict(self, usage):
+        key, _ = usage.oldest()
+        self._remove(usage, key)
+        usage.evictions += 1
+
+    def _remove(self, usage, key):
+        entry = usage.entries.pop(key, None)
+        if entry is not None:
+            usage.size -= entry[1]
+            self.size -= entry[1]
+
+    def usage(self):
+        with self.lock:
+            return {
+                'max_bytes': self.max_bytes,
+                'bytes': self.size,
+                'regions': {
+                    name: {
+                        'entries': len(usage.entries),
+                        'bytes': usage.size,
+                        'quota': usage.quota,
+                        'evictions': usage.evictions,
+                    } for name, usage in self.regions.items()
+                },
+            }
+
+
+# The memory budget shared by all cache regions using the "bounded_memory" backend.
+memory_budget = MemoryBudget()
+
+
+def configure_memory_budget(max_bytes=MEMORY_MAX_BYTES_DEFAULT):
+    """
+    Set the global byte budget, evicting entries when it has been reduced.
+    """
+    memory_budget.max_bytes = int(max_bytes)
+    memory_budget.shrink()
+    return memory_budget
+
+
+def memory_usage():
+    """
+    Report the global byte budget, the number of bytes in use,
+    and the number of entries, their size and evictions per region.
+    """
+    return memory_budget.usage()
+
+
+class BoundedDictionary(MutableMapping):
+    """
+    Dictionary view on the entries of a cache namespace within the memory budget.
+    """
+
+    def __init__(self, region, namespace):
+        self.region = region
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        return memory_budget.get(self.region, (self.namespace, key))
+
+    def __contains__(self, key):
+        return memory_budget.contains(self.region, (self.namespace, key))
+
+    def __setitem__(self, key, value):
+        memory_budget.put(self.region, (self.namespace, key), value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        memory_budget.discard(self.region, (self.namespace, key))
+
+    def __iter__(self):
+        return iter([key for _, key in memory_budget.keys(self.region, self.namespace)])
+
+    def __len__(self):
+        return len(memory_budget.keys(self.region, self.namespace))
+
+    def clear(self):
+        for key in memory_budget.keys(self.region, self.namespace):
+            memory_budget.discard(self.region, key)
+
+
+class BoundedMemoryNamespaceManager(AbstractDictionaryNSManager):
+    """
+    Beaker namespace manager storing entries within the global memory budget.
+    """
+
+    def __init__(self, namespace, memory_region, memory_quota=None, **kwargs):
+        AbstractDictionaryNSManager.__init__(self, namespace)
+        memory_budget.region(memory_region, quota=memory_quota)
+        self.dictionary = BoundedDictionary(memory_region, namespace)
+
+
+def configure_memory_backend(regions=None, max_bytes=None):
+    """
+    Assign the region names to all cache regions using the "bounded_memory"
+    backend, and optionally set the global byte budget.
+    """
+    if regions is None:
+        regions = cache_regions
+    if max_bytes is not None:
+        configure_memory_budget(max_bytes)
+    for name, settings in regions.items():
+        if region_backend_type(settings) != 'bounded_memory' or settings.get('memory_region'):
+            continue
+        logger.info('Using bounded memory for cache region "{}". quota={}, max_bytes={}'.format(
+            name, settings.get('memory_quota'), memory_budget.max_bytes))
+        settings['memory_region'] = name
+
+
+def includeme(config):
+    settings = config.registry.settings
+    configure_memory_backend(max_bytes=settings.get('cache.memory_max_bytes'))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Negative caching: remember "known absent" answers of upstream lookups.
+
+Beaker's ``cache_region`` decorator only caches return values. Functions
+signalling that a resource does not exist by raising an exception would
+hit the upstream service over and over again. The ``negative_cache``
+decorator records such exceptions within the ``negative`` cache region,
+which should have a short expiration time, and replays them on
+subsequent invocations with the same arguments.
+"""
+import logging
+import pickle
+from functools import wraps
+
+from beaker import util
+from beaker.cache import Cache, cache_regions
+from pyramid.httpexceptions import HTTPException
+
+from patzilla.util.cache.region import region_enabled, region_key
+
+logger = logging.getLogger(__name__)
+
+
+NEGATIVE_CACHE_REGION = 'negative'
+
+
+def negative_cache(*exceptions):
+    """
+    Decorator for remembering exceptions of the given classes,
+    signalling that the requested resource does not exist.
+
+    HTTP errors are only remembered when they signal "404 Not Found".
+    When the ``negative`` cache region is not configured, the
+    decorated function will be invoked as usual.
+    """
+
+    def decorate(func):
+        namespace = util.func_namespace(func)
+
+        @wraps(func)
+        def cached(*args, **kwargs):
+            if not region_enabled(NEGATIVE_CACHE_REGION):
+                return func(*args, **kwargs)
+
+            cache = Cache._get_cache(namespace, cache_regions[NEGATIVE_CACHE_REGION])
+            key = region_key(namespace, NEGATIVE_CACHE_REGION, args, kwargs, func=func)
+
+            # Replay exception when the resource is known to be absent.
+            try:
+                payload = cache.get(key)
+            except KeyError:
+                pass
+            else:
+                logger.debug('Negative cache hit for {}({})'.format(func.__name__, key))
+                raise pickle.loads(payload)
+
+            try:
+                return func(*args, **kwargs)
+            except exceptions as ex:
+                if is_absent(ex):
+                    remember(cache, key, ex)
+                raise
+
+        return cached
+
+    return decorate
+
+
+def is_absent(ex):
+    """
+    Whether an exception signals that the requested resource does not exist.
+    """
+    if isinstance(ex, HTTPException):
+        return ex.status_code == 404
+    return True
+
+
+def remember(cache, key, ex):
+    try:
+        payload = pickle.dumps(ex)
+    except Exception as pex:
+        logger.warning('Unable to record {} within negative cache: {}'.format(ex.__class__.__name__, pex))
+        return
+    cache.put(key, payload)
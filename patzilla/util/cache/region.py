@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Access the cache of functions decorated with Beaker's ``cache_region``.
+"""
+import inspect
+from hashlib import sha1
+from itertools import chain
+
+from beaker import util
+from beaker.cache import Cache, cache_regions
+
+
+def region_enabled(region):
+    """
+    Whether the designated cache region is configured and enabled.
+    """
+    settings = cache_regions.get(region)
+    return bool(settings) and settings.get('enabled', True)
+
+
+# Settings naming the backend type wrapped by the respective namespace manager type.
+WRAPPED_BACKEND_TYPES = {
+    'local': 'local_backend_type',
+    'serialized': 'serializer_backend_type',
+    'compressed': 'backend_type',
+}
+
+
+def region_backend_type(settings):
+    """
+    Resolve the type of the backend eventually storing the entries of a cache region,
+    skipping namespace managers which wrap other backends.
+    """
+    backend_type = settings.get('type', 'memory')
+    while backend_type in WRAPPED_BACKEND_TYPES:
+        backend_type = settings[WRAPPED_BACKEND_TYPES[backend_type]]
+    return backend_type
+
+
+def region_key(namespace, region, args, kwargs=None, func=None):
+    """
+    Compute the cache key for invoking a function with ``args``
+    and ``kwargs``, like Beaker's ``cache_region`` decorator does.
+    Functions decorated with ``canonical_cache_region`` bring their own key function.
+    """
+    key_function = getattr(func, '_arg_key', None)
+    if key_function is not None:
+        return key_function(args, kwargs or {})
+
+    key_kwargs = []
+    if kwargs:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        args, kwargs = bound.args, bound.kwargs
+        key_kwargs = [':'.join((str(key), str(value))) for key, value in kwargs.items()]
+    key = " ".join(map(str, chain(args, key_kwargs)))
+    key_length = int(cache_regions[region].get('key_length', util.DEFAULT_CACHE_KEY_LENGTH))
+    if len(key) + len(namespace) > key_length:
+        key = sha1(key.encode('utf-8')).hexdigest()
+    return key
+
+
+def region_get(func, args, kwargs=None):
+    """
+    Get the value cached for invoking the ``cache_region``
+    decorated function ``func`` with ``args`` and ``kwargs``.
+    Raise ``KeyError`` when there is no such value.
+    """
+    if not region_enabled(func._arg_region):
+        raise KeyError(args)
+    cache = Cache._get_cache(func._arg_namespace, cache_regions[func._arg_region])
+    return cache.get(region_key(func._arg_namespace, func._arg_region, args, kwargs, func=func))
+
+
+def region_put(func, args, value, kwargs=None):
+    """
+    Store the value for invoking the ``cache_region``
+    decorated function ``func`` with ``args`` and ``kwargs``.
+    """
+    if not region_enabled(func._arg_region):
+        return
+    cache = Cache._get_cache(func._arg_namespace, cache_regions[func._arg_region])
+    cache.put(region_key(func._arg_namespace, func._arg_region, args, kwargs, func=func), value)
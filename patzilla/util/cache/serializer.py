@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Serialization of cached payloads.
+
+Beaker backends pickle cached values. Most values cached by PatZilla are
+JSON-like dictionaries or ``SmartMunch`` trees, for which pickling is slow
+and brittle across upgrades of the respective libraries.
+
+A cache region can be configured with a serializer::
+
+    cache.search.serializer = json
+
+The region's backend will then be wrapped by ``SerializingNamespaceManager``,
+which serializes JSON-like values using the configured codec, ``json`` or
+``msgpack``, before they reach the backend. All other values are pickled.
+Serialized payloads carry a version tag, entries with an unknown version
+are treated as cache misses. Entries written before the serializer has
+been enabled remain readable.
+"""
+import json
+import logging
+import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from beaker.cache import cache_regions, clsmap
+
+from patzilla.util.data.container import SmartMunch
+
+logger = logging.getLogger(__name__)
+
+
+SERIALIZER_MAGIC = b'PZS'
+SERIALIZER_VERSION = 1
+
+# Type tags of serialized payloads.
+TAG_PICKLE = b'p'
+TAG_DICT = b'd'
+TAG_MUNCH = b'm'
+
+JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+class StaleFormat(KeyError):
+    """
+    The payload has been serialized in a format which is not supported any longer.
+    """
+
+
+def is_json_like(value, mapping_type):
+    """
+    Whether a value consists of lists, scalars and mappings of
+    exactly the designated type with string keys only, so that it
+    will survive a round trip through the serializer unchanged.
+
+    >>> is_json_like({'foo': [1, 2.0, 'bar', None]}, dict)
+    True
+    >>> is_json_like({'foo': (1, 2)}, dict)
+    False
+    >>> is_json_like({1: 'foo'}, dict)
+    False
+    >>> is_json_like({'foo': type('Text', (str,), {})('bar')}, dict)
+    False
+    """
+    if type(value) in JSON_SCALARS:
+        return True
+    if isinstance(value, list):
+        return all(is_json_like(item, mapping_type) for item in value)
+    if type(value) is mapping_type:
+        return all(type(key) is str and is_json_like(item, mapping_type) for key, item in value.items())
+    return False
+
+
+def json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_loads(data, object_hook=None):
+    return json.loads(data.decode('utf-8'), object_hook=object_hook)
+
+
+def msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def msgpack_loads(data, object_hook=None):
+    return msgpack.unpackb(data, raw=False, object_hook=object_hook)
+
+
+CODECS = {
+    'json': (b'j', json_dumps, json_loads),
+    'msgpack': (b'k', msgpack_dumps, msgpack_loads),
+}
+
+DECODERS = {marker: loads for marker, _, loads in CODECS.values()}
+
+
+def serialize_value(value, codec='json'):
+    """
+    Serialize a value into a tagged payload.
+    """
+    if value is None:
+        return value
+    marker, dumps, _ = CODECS[codec]
+    if type(value) in (dict, list) and is_json_like(value, dict):
+        tag, data = TAG_DICT, dumps(value)
+    elif type(value) is SmartMunch and is_json_like(value, SmartMunch):
+        tag, data = TAG_MUNCH, dumps(value)
+    else:
+        marker, tag, data = b'p', TAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return SERIALIZER_MAGIC + bytes([SERIALIZER_VERSION]) + marker + tag + data
+
+
+def deserialize_value(value):
+    """
+    Deserialize a payload which has been serialized by ``serialize_value``.
+    Raise ``StaleFormat`` when it can not be decoded.
+    """
+    if not isinstance(value, bytes) or not value.startswith(SERIALIZER_MAGIC):
+        return value
+
+    header = len(SERIALIZER_MAGIC)
+    version, marker, tag, data = value[header], value[header + 1:header + 2], value[header + 2:header + 3], value[header + 3:]
+    if version != SERIALIZER_VERSION:
+        raise StaleFormat('Unknown serializer version {}'.format(version))
+
+    try:
+        if tag == TAG_PICKLE:
+            return pickle.loads(data)
+        loads = DECODERS[marker]
+        if tag == TAG_MUNCH:
+            return loads(data, object_hook=SmartMunch)
+        return loads(data)
+    except Exception as ex:
+        raise StaleFormat('Unable to decode cached payload: {}'.format(ex))
+
+
+class SerializingNamespaceManager(object):
+    """
+    Beaker namespace manager serializing the payloads
+    stored by another namespace manager.
+
+    Beaker stores entries as ``(storedtime, expiretime, value)`` tuples,
+    only their values are serialized.
+    """
+
+    def __init__(self, namespace, serializer_backend_type, serializer='json', **nsargs):
+        check_codec(serializer)
+        self.backend = clsmap[serializer_backend_type](namespace, **nsargs)
+        self.codec = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def serialize(self, entry):
+        if isinstance(entry, tuple) and len(entry) == 3:
+            storedtime, expiretime, value = entry
+            return storedtime, expiretime, serialize_value(value, codec=self.codec)
+        return entry
+
+    def deserialize(self, entry):
+        if isinstance(entry, tuple) and len(entry) == 3:
+            storedtime, expiretime, value = entry
+            return storedtime, expiretime, deserialize_value(value)
+        return entry
+
+    def set_value(self, key, value, expiretime=None):
+        self.backend.set_value(key, self.serialize(value), expiretime=expiretime)
+
+    def __setitem__(self, key, value):
+        self.backend[key] = self.serialize(value)
+
+    def __getitem__(self, key):
+        try:
+            return self.deserialize(self.backend[key])
+        except StaleFormat as ex:
+            logger.info('Ignoring cache entry {}: {}'.format(key, ex))
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.backend
+
+    def __delitem__(self, key):
+        del self.backend[key]
+
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError('Unknown cache serializer: {}'.format(codec))
+    if codec == 'msgpack' and msgpack is None:
+        raise ValueError('Cache serializer "msgpack" requires the "msgpack" package')
+
+
+def configure_serializer(regions=None):
+    """
+    Wrap the backends of all cache regions which have a serializer configured.
+    """
+    if regions is None:
+        regions = cache_regions
+    for name, settings in regions.items():
+        serializer = settings.get('serializer')
+        if not serializer or serializer == 'pickle' or settings.get('serializer_backend_type'):
+            continue
+        check_codec(serializer)
+        logger.info('Serializing cache region "{}" using {}'.format(name, serializer))
+        settings['serializer_backend_type'] = settings.get('type', 'memory')
+        settings['type'] = 'serialized'
+
+
+def includeme(config):
+    configure_serializer()
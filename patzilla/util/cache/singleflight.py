@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Single-flight request coalescing.
+
+When many clients ask for the same resource at the same time, for example
+when a team opens a shared result list, identical invocations of upstream
+access functions would all miss the cache at once and go upstream.
+
+The ``single_flight`` decorator makes concurrent invocations with the same
+arguments wait for a single computation, sharing its result or exception.
+This is accomplished by an in-memory registry of computations in flight.
+Across processes, concurrent cache misses are already serialized by the
+creation lock Beaker takes for each cache key.
+
+Each waiting invocation receives a deep copy of the result, so callers
+modifying their result in place will not interfere with each other.
+"""
+import copy
+import logging
+import threading
+from functools import wraps
+
+from beaker import util
+
+from patzilla.util.cache.region import region_enabled, region_key
+
+logger = logging.getLogger(__name__)
+
+
+class Flight(object):
+    """
+    A computation in flight.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.waiters = 0
+
+
+flights = {}
+flights_lock = threading.Lock()
+
+
+def single_flight(func):
+    """
+    Decorator for coalescing concurrent invocations with the same arguments.
+
+    It should be applied on top of the ``cache_region`` decorator, so that
+    the leader's computation will populate the cache for the others.
+    """
+
+    namespace = util.func_namespace(func)
+    region = getattr(func, '_arg_region', None)
+
+    @wraps(func)
+    def coalesced(*args, **kwargs):
+        key = flight_key(namespace, region, args, kwargs, func)
+
+        with flights_lock:
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = Flight()
+            else:
+                flight.waiters += 1
+
+        # Wait for the computation of another thread.
+        if not leader:
+            logger.debug('Waiting for computation in flight: {}'.format(key))
+            flight.done.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return copy.deepcopy(flight.result)
+
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as ex:
+            flight.exception = ex
+            raise
+        finally:
+            with flights_lock:
+                del flights[key]
+
+            # Keep a pristine copy for the waiters, before the leader's caller can modify the result.
+            if flight.waiters and flight.exception is None:
+                flight.result = copy.deepcopy(result)
+            flight.done.set()
+
+    return coalesced
+
+
+def flight_key(namespace, region, args, kwargs, func):
+    if region_enabled(region):
+        key = region_key(namespace, region, args, kwargs, func=func)
+    else:
+        key = repr((args, sorted((kwargs or {}).items())))
+    return '{}/{}'.format(namespace, key)
+
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+"""
+Stale-while-revalidate caching.
+
+Beaker's cache regions only know a single expiration time. Once an entry
+has expired, the next client will have to wait for the upstream service.
+
+When a cache region is configured with a ``soft_expire`` time, the
+``stale_while_revalidate`` decorator will serve entries older than that
+right away, while refreshing them in the background. The region's
+``expire`` time is still obeyed as a hard limit, entries older than
+that will not be served at all.
+
+Example::
+
+    cache.search.expire = 604800
+    cache.search.soft_expire = 86400
+"""
+import inspect
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from beaker.cache import Cache, cache_regions
+
+from patzilla.util.cache.instrumentation import served, served_entry_stored
+from patzilla.util.cache.region import region_enabled, region_key
+from patzilla.util.python.concurrency import with_threadlocals
+
+logger = logging.getLogger(__name__)
+
+
+# Refresh stale cache entries on a small pool of background threads.
+refresh_executor = ThreadPoolExecutor(max_workers=2)
+
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+
+def stale_while_revalidate(func):
+    """
+    Decorator for serving stale cache entries while refreshing them in the background.
+
+    It should be applied on top of the instrumented ``cache_region`` or
+    ``canonical_cache_region`` decorators, which report the time the entry
+    served has been stored. When the region is not configured with a
+    ``soft_expire`` time, the decorated function will be invoked as usual.
+    """
+
+    namespace = func._arg_namespace
+    region = func._arg_region
+    original = inspect.unwrap(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not region_enabled(region) or not cache_regions[region].get('soft_expire'):
+            return func(*args, **kwargs)
+
+        settings = cache_regions[region]
+        key = region_key(namespace, region, args, kwargs, func=func)
+
+        # The instrumented cache access records the time the entry has been stored on hits.
+        served.entry = None
+        payload = func(*args, **kwargs)
+        stored = served_entry_stored(namespace, key)
+
+        if stored is not None and time.time() - stored >= int(settings['soft_expire']):
+            refresh(Cache._get_cache(namespace, settings), key, original, args, kwargs)
+
+        return payload
+
+    return wrapper
+
+
+def refresh(cache, key, func, args, kwargs):
+    """
+    Recompute a cache entry in the background, at most once at a time.
+    """
+    identifier = (cache.namespace_name, key)
+    with refreshing_lock:
+        if identifier in refreshing:
+            return
+        refreshing.add(identifier)
+
+    def task():
+        try:
+            logger.info('Refreshing stale cache entry {}: {}'.format(cache.namespace_name, key))
+            cache.put(key, func(*args, **kwargs))
+        except Exception as ex:
+            logger.warning('Refreshing stale cache entry {}: {} failed: {}'.format(cache.namespace_name, key, ex))
+        finally:
+            with refreshing_lock:
+                refreshing.discard(identifier)
+
+    refresh_executor.submit(with_threadlocals(task, detach=True))
@@ -64,9 +64,10 @@ class CQL(object):
             ex.explanation = '%s\n%s\n%s' % (ex.pstr, ' ' * ex.loc + '^\n', ex)
             #if self.logging:
             #    log.error('\n%s', ex.explanation)
-            log.warning('Query expression "{query}" is invalid. ' \
-                        'Reason: {reason}\n{location}'.format(
-                query=self.cql, reason=str(ex), location=ex.explanation))
+            if self.logging:
+                log.warning('Query expression "{query}" is invalid. ' \
+                            'Reason: {reason}\n{location}'.format(
+                    query=self.cql, reason=str(ex), location=ex.explanation))
             raise
 
         return tokens
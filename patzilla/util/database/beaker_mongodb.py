@@ -95,8 +95,10 @@ use.  Specifying mongodb will (if the module is properly installed) tell
 Beaker to cache via mongodb.  Note that if Beaker cannot load the extension,
 it will tell you that mongodb is an invalid backend.
 
-Expiration is standard beaker syntax, although not supported at the moment in
-this backend.
+Expiration is standard beaker syntax. Each entry carries its expiration time,
+MongoDB will remove expired entries on its own by using a TTL index. Entries
+written by previous versions can get their expiration time converted by
+invoking ``patzilla cache migrate``.
 
 Finally, you need to define a URL to connect to MongoDB.  This follows the standardized
 MongoDB URI Format[3]_. Currently the only options supported is 'slaveOK'.
@@ -189,7 +191,10 @@ A part of this code is a copy of https://raw.githubusercontent.com/bbangert/beak
 
 
 import datetime
+import logging
+from collections import OrderedDict
 import os
+import re
 import threading
 import time
 import pickle
@@ -202,11 +207,17 @@ except ImportError:
     pymongo = None
     bson = None
 
+from beaker.cache import cache_regions, clsmap
 from beaker.container import NamespaceManager
+from beaker.exceptions import InvalidCacheBackendError
 from beaker.synchronization import SynchronizerImpl
 from beaker.util import SyncDict, machine_identifier
 from beaker.crypto.util import sha1
-from beaker._compat import string_type, PY2
+from six import PY2, string_types
+
+from patzilla.util.cache.region import region_backend_type
+
+log = logging.getLogger(__name__)
 
 
 class MongoNamespaceManager(NamespaceManager):
@@ -218,6 +229,10 @@ class MongoNamespaceManager(NamespaceManager):
     The data will be stored into ``beaker_cache`` collection of the
     *default database*, so make sure your connection string or
     MongoClient point to a default database.
+
+    Each entry carries its expiration time within the ``expires_at`` field,
+    so MongoDB will remove expired entries on its own, using a TTL index.
+    Entries which have expired but have not been removed yet are not served.
     """
     MAX_KEY_LENGTH = 1024
 
@@ -230,11 +245,12 @@ class MongoNamespaceManager(NamespaceManager):
         if pymongo is None:
             raise RuntimeError('pymongo3 is not available')
 
-        if isinstance(url, string_type):
+        if isinstance(url, string_types):
             self.client = MongoNamespaceManager.clients.get(url, pymongo.MongoClient, url)
         else:
             self.client = url
         self.db = self.client.get_default_database()
+        ensure_indexes(self.db)
 
     def _format_key(self, key):
         if not isinstance(key, str):
@@ -245,56 +261,156 @@ class MongoNamespaceManager(NamespaceManager):
             key = sha1(key).hexdigest()
         return '%s:%s' % (self.namespace, key)
 
+    def _find_entry(self, key, projection=None):
+        entry = self.db.backer_cache.find_one({'_id': self._format_key(key)}, projection)
+        if entry is None or _is_expired(entry):
+            return None
+        return entry
+
     def get_creation_lock(self, key):
         return MongoSynchronizer(self._format_key(key), self.client)
 
     def __getitem__(self, key):
-        self._clear_expired()
-        entry = self.db.backer_cache.find_one({'_id': self._format_key(key)})
+        entry = self._find_entry(key)
         if entry is None:
             raise KeyError(key)
         return pickle.loads(entry['value'])
 
     def __contains__(self, key):
-        self._clear_expired()
-        entry = self.db.backer_cache.find_one({'_id': self._format_key(key)})
-        return entry is not None
+        return self._find_entry(key, projection={'value': False}) is not None
 
     def has_key(self, key):
         return key in self
 
     def set_value(self, key, value, expiretime=None):
-        self._clear_expired()
-
-        expiration = None
-        if expiretime is not None:
-            expiration = time.time() + expiretime
-
         value = pickle.dumps(value)
-        self.db.backer_cache.update_one({'_id': self._format_key(key)},
-                                        {'$set': {'value': bson.Binary(value),
-                                                  'expiration': expiration}},
-                                        upsert=True)
+        update = {'$set': {'value': bson.Binary(value)}}
+        if expiretime is not None:
+            update['$set']['expires_at'] = datetime.datetime.utcnow() + datetime.timedelta(seconds=expiretime)
+        else:
+            update['$unset'] = {'expires_at': True}
+        self.db.backer_cache.update_one({'_id': self._format_key(key)}, update, upsert=True)
 
     def __setitem__(self, key, value):
         self.set_value(key, value)
 
     def __delitem__(self, key):
-        self._clear_expired()
         self.db.backer_cache.delete_many({'_id': self._format_key(key)})
 
     def do_remove(self):
-        self.db.backer_cache.delete_many({'_id': {'$regex': '^%s' % self.namespace}})
+        self.db.backer_cache.delete_many({'_id': {'$regex': '^%s:' % re.escape(self.namespace)}})
 
     def keys(self):
-        return [e['key'].split(':', 1)[-1] for e in self.db.backer_cache.find_all(
-            {'_id': {'$regex': '^%s' % self.namespace}}
+        return [e['_id'].split(':', 1)[-1] for e in self.db.backer_cache.find(
+            {'_id': {'$regex': '^%s:' % re.escape(self.namespace)}}, {'_id': True}
         )]
 
-    def _clear_expired(self):
-        now = time.time()
-        self.db.backer_cache.delete_many({'_id': {'$regex': '^%s' % self.namespace},
-                                          'expiration': {'$ne': None, '$lte': now}})
+
+# Alias for the name this backend is known by in the original documentation.
+MongoDBNamespaceManager = MongoNamespaceManager
+
+
+def includeme(config):
+    if any(region_backend_type(settings) == 'mongodb' for settings in cache_regions.values()):
+        register_backend()
+
+
+def register_backend():
+    """
+    Make sure this backend is available as cache type "mongodb".
+    It is registered through the ``beaker.backends`` entry point, see ``setup.py``.
+    """
+    try:
+        clsmap['mongodb']
+    except KeyError:
+        raise InvalidCacheBackendError(
+            'Cache type "mongodb" is not registered, please reinstall the package to register its entry points')
+
+
+def _is_expired(entry):
+    expires_at = entry.get('expires_at')
+    if expires_at is not None:
+        return expires_at <= datetime.datetime.utcnow()
+
+    # Entries written by previous versions carry a UNIX timestamp.
+    expiration = entry.get('expiration')
+    return expiration is not None and expiration <= time.time()
+
+
+indexed_databases = set()
+indexed_databases_lock = threading.Lock()
+
+
+def ensure_indexes(db):
+    """
+    Create the indexes needed by the cache and lock collections, once per database.
+
+    - The TTL index on ``beaker_cache.expires_at`` lets MongoDB remove expired entries.
+    - The TTL index on ``beaker_locks.timestamp`` lets MongoDB remove locks
+      which have not been released, for example after a process crashed.
+
+    Lookups by key use the index on ``_id``, which is always present.
+    """
+    identifier = (id(db.client), db.name)
+    with indexed_databases_lock:
+        if identifier in indexed_databases:
+            return
+        log.info('Creating indexes for MongoDB cache database "{}"'.format(db.name))
+        db.backer_cache.create_index('expires_at', name='expires_at_ttl', expireAfterSeconds=0)
+        db.beaker_locks.create_index(
+            'timestamp', name='timestamp_ttl', expireAfterSeconds=MongoSynchronizer.LOCK_EXPIRATION)
+        indexed_databases.add(identifier)
+
+
+def migrate_expiration(db, batch_size=1000):
+    """
+    Entries written by previous versions carry their expiration time as UNIX timestamp
+    within the ``expiration`` field, which is not covered by the TTL index. Convert it
+    into the ``expires_at`` field, so MongoDB will remove those entries as well.
+
+    This scans the whole collection, so it is not invoked when serving requests,
+    but by the ``patzilla cache migrate`` command, see ``migrate_regions``.
+
+    Return the number of converted entries.
+    """
+    legacy = db.backer_cache.find(
+        {'expires_at': {'$exists': False}, 'expiration': {'$ne': None}}, {'expiration': True})
+    migrated = 0
+    updates = []
+    for entry in legacy:
+        expires_at = datetime.datetime.utcfromtimestamp(entry['expiration'])
+        updates.append(pymongo.UpdateOne(
+            {'_id': entry['_id']}, {'$set': {'expires_at': expires_at}, '$unset': {'expiration': True}}))
+        if len(updates) >= batch_size:
+            db.backer_cache.bulk_write(updates, ordered=False)
+            migrated += len(updates)
+            updates = []
+    if updates:
+        db.backer_cache.bulk_write(updates, ordered=False)
+        migrated += len(updates)
+    return migrated
+
+
+def migrate_regions(regions=None):
+    """
+    Convert the expiration time of legacy entries within the databases
+    of all cache regions stored within MongoDB.
+
+    Return the number of converted entries per database.
+    """
+    if regions is None:
+        regions = cache_regions
+    report = OrderedDict()
+    for settings in regions.values():
+        if region_backend_type(settings) != 'mongodb':
+            continue
+        url = settings['url']
+        client = MongoNamespaceManager.clients.get(url, pymongo.MongoClient, url)
+        db = client.get_default_database()
+        if db.name not in report:
+            log.info('Converting expiration time of legacy entries in MongoDB cache database "{}"'.format(db.name))
+            report[db.name] = migrate_expiration(db)
+    return report
 
 
 class MongoSynchronizer(SynchronizerImpl):
@@ -318,7 +434,7 @@ class MongoSynchronizer(SynchronizerImpl):
     def __init__(self, identifier, url):
         super(MongoSynchronizer, self).__init__()
         self.identifier = identifier
-        if isinstance(url, string_type):
+        if isinstance(url, string_types):
             self.client = MongoNamespaceManager.clients.get(url, pymongo.MongoClient, url)
         else:
             self.client = url
@@ -9,11 +9,19 @@ import requests
 import where
 import logging
 import datetime
-import io
+import multiprocessing
 import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from six import BytesIO
 from tempfile import NamedTemporaryFile
 from cornice.util import to_list
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
 from patzilla.util.python.decorators import memoize
 from patzilla.util.python.system import run_command, find_program_candidate
 
@@ -24,7 +32,7 @@ def to_png(tiff, width=None, height=None):
     """
     Convert image to PNG format with optional resizing.
 
-    :param tiff: A stream buffer object like BytesIO
+    :param tiff: A stream buffer object like BytesIO, or the image payload
     :param width: The width of the image in pixels (optional)
     :param height: The height of the image in pixels (optional)
     :return: A BytesIO object instance containing image data
@@ -39,34 +47,20 @@ def to_png(tiff, width=None, height=None):
 
     Nowadays, this should be supported by Pillow on recent platforms:
     https://pillow.readthedocs.io/en/latest/releasenotes/5.0.0.html#compressed-tiff-images
+
+    The conversion is CPU-bound, so it will be offloaded to the
+    image conversion process pool when configured, see ``configure_image_pool``.
     """
+    payload = tiff.read() if hasattr(tiff, "read") else tiff
     try:
-        from PIL import Image
-
-        # Read image
-        image = Image.open(tiff)
-
-        if width and height:
-
-            # Convert image to grayscale
-            image = image.convert('L')
-
-            # Resize image
-            image.thumbnail((width, height), Image.LANCZOS)
-
-        # Save image into a stream buffer
-        png = BytesIO()
-        image.save(png, 'PNG')
+        png = run_pillow(payload, 'png', width=width, height=height)
 
         # Readers should start reading at the beginning of the stream
-        png.seek(0)
-
-        return png
+        return BytesIO(png)
 
     except Exception as ex:
         logger.warning('Image conversion using "Pillow" failed: {}'.format(ex))
 
-
     """
     However, if the conversion using "Pillow" fails for some reason,
     let's try to use the "convert" utility from ImageMagick.
@@ -91,7 +85,128 @@ def to_png(tiff, width=None, height=None):
         make -j6 && make install
 
     """
-    return run_convert(tiff, "png", width=width, height=height)
+    return run_convert(BytesIO(payload), "png", width=width, height=height)
+
+
+# Image formats for drawings, mapped to their Pillow format names and content types.
+IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+def to_image(payload, format='png', width=None, height=None):
+    """
+    Convert an image payload to one of ``IMAGE_FORMATS`` with optional resizing.
+    JPEG images are always converted to grayscale.
+
+    :return: The image payload
+    """
+    if format == 'png':
+        return to_png(payload, width=width, height=height).read()
+    try:
+        return run_pillow(payload, format, width=width, height=height)
+    except Exception as ex:
+        logger.warning('Image conversion using "Pillow" failed: {}'.format(ex))
+    return run_convert(BytesIO(payload), format, width=width, height=height).read()
+
+
+def run_pillow(payload, format, width=None, height=None):
+    """
+    Convert an image using Pillow, within the image conversion process pool when configured.
+    """
+    pool = get_image_pool()
+    if pool is not None:
+        return pool.submit(pillow_convert, payload, format, width, height).result()
+    return pillow_convert(payload, format, width, height)
+
+
+def pillow_convert(payload, format='png', width=None, height=None):
+    """
+    Convert an image payload using Pillow, resizing it in the same step.
+    Bilevel images, like the CCITT G4 compressed TIFF drawings delivered by the
+    patent offices, are converted to grayscale when resizing, to retain details.
+    """
+    from PIL import Image
+
+    pillow_format, _ = IMAGE_FORMATS[format]
+    options = {}
+
+    # Read image
+    image = Image.open(BytesIO(payload))
+
+    if width or height:
+
+        # Let the decoder reduce the image already while loading it, where supported.
+        size = (int(width or image.size[0]), int(height or image.size[1]))
+        image.draft(image.mode, size)
+
+        # Convert image to grayscale
+        if image.mode in ('1', 'P'):
+            image = image.convert('L')
+
+        # Resize image, retaining its aspect ratio
+        image.thumbnail(size, Image.LANCZOS)
+
+    # Lossy formats need grayscale or RGB images.
+    if format == 'jpeg':
+        image = image.convert('L')
+        options = {'quality': 85, 'optimize': True}
+    elif format == 'webp':
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('L')
+        options = {'quality': 85}
+
+    # Save image into a buffer
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+# The number of processes for converting images, if configured.
+image_workers = 0
+
+# The process pools for converting images, by id of the process using them.
+image_pools = {}
+image_pools_lock = threading.Lock()
+
+
+def configure_image_pool(workers=None):
+    """
+    Offload image conversions to a pool of ``workers`` processes.
+    Without workers, images will be converted on the calling thread.
+
+    The pool is created on first use, see ``get_image_pool``.
+    """
+    global image_workers
+    with image_pools_lock:
+        pool = image_pools.pop(os.getpid(), None)
+        if pool is not None:
+            pool.shutdown()
+        # Pools inherited from a parent process are not usable here.
+        image_pools.clear()
+        image_workers = int(workers or 0)
+    if image_workers > 0:
+        logger.info('Converting images using a pool of {} processes'.format(image_workers))
+
+
+def get_image_pool():
+    """
+    Get the process pool for converting images, if configured.
+
+    Each process gets its own pool, created on first use. Otherwise, web server
+    processes forked after configuring the pool would share its pipes.
+    """
+    if image_workers <= 0:
+        return None
+    pid = os.getpid()
+    with image_pools_lock:
+        if pid not in image_pools:
+            # Don't fork the threads of the web server into the worker processes.
+            image_pools[pid] = ProcessPoolExecutor(
+                max_workers=image_workers, mp_context=multiprocessing.get_context('spawn'))
+        return image_pools[pid]
 
 
 def run_convert(resource, target_format, width=None, height=None):
@@ -194,38 +309,73 @@ def run_imagemagick(command, input=None):
 
 
 def png_resize(png_payload, width):
+    """
+    Resize a PNG image to the designated width, retaining its aspect ratio.
+    """
+    return run_pillow(png_payload, 'png', width=width)
 
-    image = Image.open(io.StringIO(png_payload)).convert('RGB')
 
-    image_width = image.size[0]
-    image_height = image.size[1]
+def pdf_join(pages, use_filenames=False):
+    """
+    Join PDF documents, given as payloads or file names.
 
-    #aspect = float(image_width) / float(image_height)
-    #print "aspect:", aspect
+    The documents are joined in-process when ``pypdf`` is installed,
+    otherwise, or when it fails, using ``pdftk``.
+    """
+    if pypdf is not None:
+        try:
+            return pdf_build(pages)
+        except Exception as ex:
+            if not find_pdftk():
+                raise
+            logger.warning('Joining PDF documents in-process failed, falling back to pdftk: {}'.format(ex))
+    return pdf_join_pdftk(pages, use_filenames=use_filenames)
 
-    scale_factor = float(image_width) / float(width)
-    #print "scale_factor:", scale_factor
 
-    #size = (int(width), int(image_height * aspect))
-    size = (int(width), int(image_height / scale_factor))
-    #print "size:", size
-    print("Resizing image from %s to %s" % (image.size, size))
+def pdf_build(pages, info=None, bookmarks=None):
+    """
+    Join PDF documents, given as payloads or file names, set the document
+    information dictionary and add bookmarks, in a single pass, in-process.
 
-    image.thumbnail(size, Image.ANTIALIAS)
-    #image.resize(size, Image.ANTIALIAS)
-    #print "thumbnail done"
+    ``bookmarks`` is a list of ``(title, page number)`` tuples, page numbers start at 1.
+    """
+    writer = pypdf.PdfWriter()
+    for page in pages:
+        if isinstance(page, (bytes, bytearray)):
+            page = BytesIO(page)
+        writer.append(page, import_outline=False)
 
-    png = io.StringIO()
-    image.save(png, 'PNG')
-    #print "image saved to memory"
+    if info:
+        writer.add_metadata(info)
 
-    png_payload_resized = png.getvalue()
-    #print "got payload"
+    for title, page_number in bookmarks or []:
+        writer.add_outline_item(title, int(page_number) - 1)
 
-    return png_payload_resized
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
 
 
-def pdf_join(pages, use_filenames=False):
+def pdf_assemble(pages, title, producer, page_sections=None):
+    """
+    Join the pages of a document, set its title and producer
+    and add bookmarks for its sections, see ``pdf_make_metadata``.
+    """
+    if pypdf is not None:
+        info = {'/Title': title, '/Producer': producer, '/CreationDate': pdf_now()}
+        try:
+            return pdf_build(pages, info=info, bookmarks=pdf_bookmarks(page_sections))
+        except Exception as ex:
+            if not find_pdftk():
+                raise
+            logger.warning('Assembling PDF document in-process failed, falling back to pdftk: {}'.format(ex))
+
+    document = pdf_join_pdftk(pages)
+    metadata = pdf_make_metadata(title, producer, len(pages), page_sections)
+    return pdf_set_metadata(document, metadata)
+
+
+def pdf_join_pdftk(pages, use_filenames=False):
     # pdftk in1.pdf in2.pdf cat output out1.pdf
     # pdftk in.pdf dump_data output report.txt
     # pdftk in.pdf update_info in.info output out.pdf
@@ -383,18 +533,27 @@ BookmarkLevel: {level}
 BookmarkPageNumber: {start_page}
 """
 
-    for page_section in page_sections:
+    for title, start_page in pdf_bookmarks(page_sections):
+        level = 1
+        metadata += bookmark_tpl.format(**locals())
+
+    return metadata
+
+
+def pdf_bookmarks(page_sections=None):
+    """
+    Compute bookmarks from the ``ops:document-section`` items of the OPS image inquiry,
+    as ``(title, page number)`` tuples.
+    """
+    bookmarks = []
+    for page_section in page_sections and to_list(page_sections) or []:
         name = page_section['@name']
-        start_page = page_section['@start-page']
         if name == 'SEARCH_REPORT':
             title = 'Search-report'
         else:
             title = name.title()
-        level = 1
-
-        metadata += bookmark_tpl.format(**locals())
-
-    return metadata
+        bookmarks.append((title, int(page_section['@start-page'])))
+    return bookmarks
 
 
 def pdf_now():
@@ -519,3 +678,7 @@ def find_pdftk():
 @memoize
 def find_pdfimages():
     return find_program_candidate(where.where('pdfimages'))
+
+
+def includeme(config):
+    configure_image_pool(config.registry.settings.get('image.workers'))
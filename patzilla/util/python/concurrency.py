@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import copy
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from pyramid.threadlocal import manager
+
+logger = logging.getLogger(__name__)
+
+
+def with_threadlocals(func, detach=False):
+    """
+    Wrap ``func`` so it will see the Pyramid thread locals (request and registry)
+    of the calling thread when being invoked on a worker thread.
+
+    Most of the data source adapters acquire their upstream client objects
+    through ``get_current_request()``, so this is needed to use them
+    from within a thread pool.
+
+    When ``detach`` is true, the worker will see a shallow copy of the request
+    with its own error store, so it can outlive the calling request without
+    interfering with its response.
+    """
+    state = manager.get()
+    if detach:
+        state = dict(state)
+        request = state.get('request')
+        if request is not None:
+            request = copy.copy(request)
+            if hasattr(request, 'errors'):
+                request.errors = type(request.errors)()
+            state['request'] = request
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        manager.push(state)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            manager.pop()
+
+    return wrapper
+
+
+def iterate_with_threadlocals(iterable):
+    """
+    Iterate ``iterable`` with the Pyramid thread locals of the calling thread.
+
+    This is needed for generating response bodies using the data source
+    adapters, because the WSGI server consumes the ``app_iter`` of a
+    response after the thread locals of the request have been popped.
+    """
+    state = manager.get()
+    iterator = iter(iterable)
+
+    def generate():
+        try:
+            while True:
+                manager.push(state)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    manager.pop()
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    return generate()
+
+
+def concurrent_map(func, items, max_workers=4):
+    """
+    Apply ``func`` to all ``items`` using a bounded pool of worker threads.
+
+    Results are returned in the order of the input items. When one of the
+    invocations fails, pending work items are cancelled and the first
+    exception in input order is raised to the caller.
+
+    When ``max_workers`` is less than two, or there is only a single item,
+    all invocations will happen sequentially on the calling thread.
+    """
+    items = list(items)
+
+    if max_workers is None or max_workers < 2 or len(items) < 2:
+        return [func(item) for item in items]
+
+    worker = with_threadlocals(func)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(worker, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except:
+            for future in futures:
+                future.cancel()
+            raise
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 # (c) 2013-2016 Andreas Motl, Elmyra UG
 import simplejson as json
+from pyramid.response import FileIter
+
+from patzilla.util.cache.blobstore import Blob, get_blob_store
+
 
 def json_pretty_renderer(helper):
     return _JsonPrettyRenderer()
@@ -34,6 +38,21 @@ class XmlRenderer(object):
             response.content_type = 'text/xml'
         return data
 
+def render_blob(request, blob):
+    """
+    Let the web server deliver the payload of a blob from disk, without
+    loading it into memory. Either hand it over to nginx using
+    ``X-Accel-Redirect``, or use the WSGI server's ``wsgi.file_wrapper``.
+    """
+    response = request.response
+    store = get_blob_store()
+    if store is not None and store.accel_redirect:
+        response.headers['X-Accel-Redirect'] = store.accel_redirect_location(blob)
+        return b''
+    response.content_length = blob.size
+    file_wrapper = request.environ.get('wsgi.file_wrapper', FileIter)
+    return file_wrapper(blob.open(), 64 * 1024)
+
 class PngRenderer(object):
 
     def __init__(self, info):
@@ -44,6 +63,8 @@ class PngRenderer(object):
         if request is not None:
             response = request.response
             response.content_type = 'image/png'
+            if isinstance(data, Blob):
+                return render_blob(request, data)
         return data
 
 class PdfRenderer(object):
@@ -56,6 +77,8 @@ class PdfRenderer(object):
         if request is not None:
             response = request.response
             response.content_type = 'application/pdf'
+            if isinstance(data, Blob):
+                return render_blob(request, data)
         return data
 
 class NullRenderer(object):
@@ -65,4 +88,6 @@ class NullRenderer(object):
 
     def __call__(self, data, context):
         request = context.get('request')
+        if request is not None and isinstance(data, Blob):
+            return render_blob(request, data)
         return data
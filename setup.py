@@ -109,6 +109,7 @@ requires = [
 
     # Data conversion
     'Pillow>=6,<7',             # 9.1.0
+    'pypdf>=3,<4',
 
     # Does not work from within virtualenv?
     # 'unoconv==0.8.2',          # 0.9.0
@@ -222,10 +223,15 @@ setup(name='patzilla',
             'minimal = patzilla:minimal',
         ],
 
-        # This is now a Beaker builtin as per "ext:mongodb"
-        #'beaker.backends': [
-        #    'mongodb = patzilla.util.database.beaker_mongodb:MongoDBNamespaceManager',
-        #    ],
+        # Beaker's builtin variant is available as "ext:mongodb".
+        # PatZilla's variant supports server-side expiry.
+        'beaker.backends': [
+            'mongodb = patzilla.util.database.beaker_mongodb:MongoNamespaceManager',
+            'compressed = patzilla.util.cache.compression:CompressingNamespaceManager',
+            'serialized = patzilla.util.cache.serializer:SerializingNamespaceManager',
+            'bounded_memory = patzilla.util.cache.memory:BoundedMemoryNamespaceManager',
+            'local = patzilla.util.cache.local:LocalCacheNamespaceManager',
+            ],
 
         'console_scripts': [
             'patzilla      = patzilla.commands:cli',
@@ -12,8 +12,10 @@ from patzilla.access.epo.ops.api import ops_published_data_search, get_ops_clien
     ops_biblio_documents, ops_document_kindcodes, ops_family_members, ops_published_data_search_swap_family, \
     ops_published_data_crawl, image_representative, get_ops_image, ops_description, ops_claims, get_ops_image_pdf, \
     ops_service_usage, _result_list_compact, ops_family_publication_docdb_xml, ops_register, \
-    _flatten_ops_json_list, inquire_images
+    _flatten_ops_json_list, inquire_images, ops_family_members_by_family_id, get_ops_biblio_data_many, \
+    ops_document_kindcodes_many
 from patzilla.access.epo.ops.client import OpsCredentialsGetter
+from patzilla.util.cache.region import region_get
 from patzilla.util.data.container import jpath
 
 
@@ -154,6 +156,15 @@ def test_crawl(app_request):
     assert total_result_count == 2
 
 
+def test_crawl_limit(app_request):
+    """
+    Test that the search crawler stops after acquiring ``limit`` publication numbers.
+    """
+    results = ops_published_data_crawl(constituents="pub-number", query="pn=(EP666666 or EP666667)", chunksize=25, limit=1)
+    total_result_count = int(jpath('/ops:world-patent-data/ops:biblio-search/@total-result-count', results))
+    assert total_result_count == 1
+
+
 def test_crawl_no_results(app_request):
     """
     Test that the search crawler works as expected.
@@ -229,6 +240,31 @@ def test_document_kindcodes_success(app_request):
     assert kindcodes == ["A2", "A3", "B1"]
 
 
+def test_biblio_data_many_success(app_request):
+    """
+    Proof getting bibliographic data for multiple documents at once works.
+    """
+    results = get_ops_biblio_data_many("publication", ["EP0666666", "EP1000000A1"], xml=True)
+    assert list(results.keys()) == ["EP0666666", "EP1000000A1"]
+    assert b'doc-number="0666666"' in results["EP0666666"]
+    assert b'doc-number="1000000"' in results["EP1000000A1"]
+
+    # Cache entries are shared with ``get_ops_biblio_data``.
+    assert get_ops_biblio_data("publication", "EP1000000A1", xml=True) == results["EP1000000A1"]
+
+
+def test_document_kindcodes_many_success(app_request):
+    """
+    Validate acquiring document kind codes for multiple documents at once.
+    """
+    kindcodes = ops_document_kindcodes_many(["EP0666666", "EP1000000"])
+    assert kindcodes["EP0666666"] == ["A2", "A3", "B1"]
+    assert "A1" in kindcodes["EP1000000"]
+
+    # Cache entries are shared with ``ops_document_kindcodes``.
+    assert region_get(ops_document_kindcodes, ("EP0666666",)) == ["A2", "A3", "B1"]
+
+
 def test_document_kindcodes_failure(app_request):
     """
     Validate acquiring document kind codes.
@@ -509,6 +545,19 @@ def test_family_members_success(app_request):
     assert jp_members == ["JPH07231328A", "JP2613027B2"]
 
 
+def test_family_members_by_family_id_success(app_request):
+    """
+    Proof that family information is remembered by family id, in order
+    to reuse it for other documents of the same family.
+    """
+    family_members = ops_family_members_by_family_id("test-family-0666666", "EP0666666A2")
+    jp_members = family_members.publications_by_country(countries=["JP"])
+    assert jp_members == ["JPH07231328A", "JP2613027B2"]
+
+    family_members = ops_family_members_by_family_id("test-family-0666666", "JPH07231328A")
+    assert family_members.publications_by_country(countries=["JP"]) == jp_members
+
+
 def test_family_members_invalid_number_failure(app_request):
     with pytest.raises(MissingRequiredValue) as ex:
         ops_family_members("EP0")
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+from patzilla.access.epo.ops.api import _biblio_assemble, _biblio_split, get_ops_biblio_data, get_ops_biblio_data_many
+from patzilla.util.cache.region import region_put
+
+BIBLIO_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<ops:world-patent-data xmlns="http://www.epo.org/exchange" xmlns:ops="http://ops.epo.org">
+  <exchange-documents>
+    <exchange-document system="ops.epo.org" family-id="1" country="EP" doc-number="0666666" kind="A2"/>
+    <exchange-document system="ops.epo.org" family-id="1" country="EP" doc-number="0666666" kind="B1"/>
+    <exchange-document system="ops.epo.org" family-id="2" country="EP" doc-number="1000000" kind="A1"/>
+  </exchange-documents>
+</ops:world-patent-data>
+"""
+
+BIBLIO_JSON = {
+    'ops:world-patent-data': {
+        'exchange-documents': [
+            {'exchange-document': [
+                {'@country': 'EP', '@doc-number': '0666666', '@kind': 'A2'},
+                {'@country': 'EP', '@doc-number': '0666666', '@kind': 'B1'},
+            ]},
+            {'exchange-document': {'@country': 'EP', '@doc-number': '1000000', '@kind': 'A1'}},
+        ]
+    }
+}
+
+
+def test_biblio_split_xml():
+    envelope, documents = _biblio_split(BIBLIO_XML, xml=True)
+    assert [docref for docref, document in documents] == [
+        ('EP', '0666666', 'A2'), ('EP', '0666666', 'B1'), ('EP', '1000000', 'A1')]
+
+
+def test_biblio_split_json():
+    envelope, documents = _biblio_split(BIBLIO_JSON, xml=False)
+    assert [docref for docref, document in documents] == [
+        ('EP', '0666666', 'A2'), ('EP', '0666666', 'B1'), ('EP', '1000000', 'A1')]
+
+
+def test_biblio_assemble_xml():
+    envelope, documents = _biblio_split(BIBLIO_XML, xml=True)
+    payload = _biblio_assemble(envelope, [documents[2][1]], xml=True)
+    assert payload.startswith(b"<?xml version='1.0' encoding='UTF-8'?>")
+    assert b'doc-number="1000000"' in payload
+    assert b'doc-number="0666666"' not in payload
+    assert [docref for docref, document in _biblio_split(payload, xml=True)[1]] == [('EP', '1000000', 'A1')]
+
+    # The envelope is not modified.
+    assert len(list(envelope.iter('{http://www.epo.org/exchange}exchange-document'))) == 3
+
+
+def test_biblio_assemble_json():
+    envelope, documents = _biblio_split(BIBLIO_JSON, xml=False)
+    payload = _biblio_assemble(envelope, [documents[0][1], documents[1][1]], xml=False)
+    assert payload['ops:world-patent-data']['exchange-documents'] == {'exchange-document': [
+        {'@country': 'EP', '@doc-number': '0666666', '@kind': 'A2'},
+        {'@country': 'EP', '@doc-number': '0666666', '@kind': 'B1'},
+    ]}
+
+    # The original payload is not modified.
+    assert len(BIBLIO_JSON['ops:world-patent-data']['exchange-documents']) == 2
+
+
+def test_biblio_data_many_from_cache():
+    region_put(get_ops_biblio_data, ('publication', 'XX1234567A1'), {'foo': 'bar'})
+    region_put(get_ops_biblio_data, ('publication', 'XX1234567B1', True), b'<foo/>')
+
+    # Cached documents are served without requesting OPS.
+    assert get_ops_biblio_data_many('publication', ['XX1234567A1']) == {'XX1234567A1': {'foo': 'bar'}}
+    assert get_ops_biblio_data_many('publication', ['XX1234567B1'], xml=True) == {'XX1234567B1': b'<foo/>'}
+
+    # The cache entries are shared with ``get_ops_biblio_data``.
+    assert get_ops_biblio_data('publication', 'XX1234567A1') == {'foo': 'bar'}
+    assert get_ops_biblio_data('publication', 'XX1234567B1', xml=True) == b'<foo/>'
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import threading
+
+from patzilla.access.epo.ops.client import OpsClient
+
+
+def test_client_accept_type_default():
+    ops = OpsClient(key='foo', secret='bar', accept_type='json')
+    assert ops.accept_type == 'application/json'
+
+
+def test_client_accept_type_context():
+    ops = OpsClient(key='foo', secret='bar', accept_type='json')
+    with ops.accept('application/xml'):
+        assert ops.accept_type == 'application/xml'
+    assert ops.accept_type == 'application/json'
+
+
+def test_client_accept_type_per_thread():
+    ops = OpsClient(key='foo', secret='bar', accept_type='json')
+    seen = []
+
+    def worker():
+        seen.append(ops.accept_type)
+
+    with ops.accept('application/xml'):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    # Other threads are not affected by the content type chosen by this thread.
+    assert seen == ['application/json']
+
+
+def test_client_http_keep_alive():
+    ops = OpsClient(key='foo', secret='bar')
+    assert ops.session.headers['Connection'] == 'keep-alive'
+
+    ops = OpsClient(key='foo', secret='bar', http_keep_alive=False)
+    assert ops.session.headers['Connection'] == 'close'
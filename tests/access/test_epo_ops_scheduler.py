@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+from patzilla.access.epo.ops.scheduler import OpsRequestScheduler, parse_throttling_control
+
+
+HEADER_GREEN = 'idle (images=green:200, inpadoc=green:60, other=green:1000, retrieval=green:200, search=green:30)'
+HEADER_BLACK = 'overloaded (images=green:200, inpadoc=green:60, other=green:1000, retrieval=green:200, search=black:0)'
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler():
+    clock = FakeClock()
+    scheduler = OpsRequestScheduler(burst=10, clock=clock.time, sleep=clock.sleep)
+    return scheduler, clock
+
+
+def test_parse_throttling_control():
+    state, services = parse_throttling_control(HEADER_GREEN)
+    assert state == 'idle'
+    assert services['search'] == ('green', 30)
+    assert services['images'] == ('green', 200)
+    assert sorted(services.keys()) == ['images', 'inpadoc', 'other', 'retrieval', 'search']
+
+
+def test_scheduler_unknown_budget():
+    scheduler, clock = make_scheduler()
+    for _ in range(100):
+        assert scheduler.acquire('search') == 0
+    assert clock.sleeps == []
+
+
+def test_scheduler_green_no_delay():
+    scheduler, clock = make_scheduler()
+    scheduler.update({'X-Throttling-Control': HEADER_GREEN})
+
+    # 30 requests per minute with a burst of 10 seconds yield 5 tokens.
+    for _ in range(5):
+        assert scheduler.acquire('search') == 0
+    assert clock.sleeps == []
+
+    # Other services are metered independently.
+    assert scheduler.acquire('images') == 0
+
+
+def test_scheduler_budget_exhausted():
+    scheduler, clock = make_scheduler()
+    scheduler.update({'X-Throttling-Control': HEADER_GREEN})
+    for _ in range(5):
+        scheduler.acquire('search')
+
+    # The sixth request has to wait for a token, which is refilled every two seconds.
+    waited = scheduler.acquire('search')
+    assert round(waited, 2) == 2.0
+    assert len(clock.sleeps) == 1
+
+
+def test_scheduler_black_retry_after():
+    scheduler, clock = make_scheduler()
+    scheduler.update({'X-Throttling-Control': HEADER_BLACK, 'Retry-After': '15000'})
+
+    waited = scheduler.acquire('search')
+    assert round(waited, 2) == 15.0
+
+    # Other services are not affected.
+    assert scheduler.acquire('retrieval') == 0
+
+    status = scheduler.status()
+    assert status['state'] == 'overloaded'
+    assert status['services']['search']['color'] == 'black'
+    assert status['services']['search']['limit'] == 0
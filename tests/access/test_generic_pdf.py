@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import threading
+import time
+from io import BytesIO
+from zipfile import ZipFile, ZIP_STORED
+
+import mock
+from pyramid.httpexceptions import HTTPNotFound
+
+from patzilla.access.epo.ops import api
+from patzilla.access.generic import pdf
+from patzilla.access.generic.pdf import PDFResponse, configure_pdf_concurrency, configure_pdf_hedging, pdf_universal, \
+    pdf_universal_many, pdf_ziparchive
+
+
+def fake_pdf_universal(patent):
+    if patent == 'EP0666666A2':
+        raise HTTPNotFound()
+    if patent == 'EP0666666A3':
+        return PDFResponse()
+    return PDFResponse(pdf=b'%PDF-1.4 ' + patent.encode() * 20000, success=True)
+
+
+def test_pdf_ziparchive():
+    with mock.patch.object(pdf, 'pdf_universal', fake_pdf_universal):
+        chunks = list(pdf_ziparchive(['EP0666666B1', 'EP0666666A2', '', 'EP0666666A3', 'US5000000A']))
+
+    # The archive is generated progressively.
+    assert len(chunks) > 2
+
+    archive = ZipFile(BytesIO(b''.join(chunks)))
+    assert archive.namelist() == ['EP0666666B1.pdf', 'US5000000A.pdf', '@report.txt']
+    assert archive.getinfo('EP0666666B1.pdf').compress_type == ZIP_STORED
+    assert archive.read('US5000000A.pdf') == b'%PDF-1.4 ' + b'US5000000A' * 20000
+    assert archive.read('@report.txt') == \
+        b'Delivered files (2):\nEP0666666B1\nUS5000000A\n\nMissing files (2):\nEP0666666A2\nEP0666666A3'
+
+
+def test_pdf_universal_many_concurrency():
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def fetch(patent):
+        with lock:
+            active.append(patent)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(patent)
+        return b'%PDF-1.4 ' + patent.encode()
+
+    patents = ['EP{}B1'.format(number) for number in range(1000000, 1000012)]
+    try:
+        configure_pdf_concurrency({'epo-publication-server': 3})
+        with mock.patch.object(pdf, 'publicationserver_fetch_pdf', fetch):
+            results = list(pdf_universal_many(patents, max_workers=6))
+    finally:
+        configure_pdf_concurrency()
+
+    # Results are delivered in request order, requests are bounded per data source.
+    assert [patent for patent, response in results] == patents
+    assert all(response.pdf == b'%PDF-1.4 ' + patent.encode() for patent, response in results)
+    assert max(peak) == 3
+
+
+def test_pdf_universal_many_read_ahead():
+    calls = []
+
+    def fetch(patent):
+        calls.append(patent)
+        return b'%PDF-1.4 ' + patent.encode()
+
+    patents = ['EP{}B1'.format(number) for number in range(1000000, 1000012)]
+    with mock.patch.object(pdf, 'publicationserver_fetch_pdf', fetch):
+        results = pdf_universal_many(patents, max_workers=4, read_ahead=2)
+        patent, response = next(results)
+        time.sleep(0.1)
+        results.close()
+
+    # Documents are acquired ahead of the consumer, bounded by ``read_ahead``.
+    assert patent == 'EP1000000B1'
+    assert len(calls) <= 3
+
+
+def fetcher(payload, delay=0, calls=None):
+    def fetch(patent):
+        if calls is not None:
+            calls.append(patent)
+        time.sleep(delay)
+        return payload
+    return fetch
+
+
+def test_pdf_universal_hedged_slow_source():
+    try:
+        configure_pdf_hedging(0.05)
+        with mock.patch.object(pdf, 'publicationserver_fetch_pdf', fetcher(b'%PDF-EPO', delay=1)), \
+             mock.patch.object(pdf, 'ops_build_pdf', fetcher(b'%PDF-OPS')):
+            start = time.monotonic()
+            response = pdf_universal('EP0666666B1')
+            duration = time.monotonic() - start
+    finally:
+        configure_pdf_hedging(None)
+
+    assert response.success is True
+    assert response.pdf == b'%PDF-OPS'
+    assert response.datasource == 'epo-ops'
+    assert duration < 0.5
+
+
+def test_pdf_universal_hedged_fast_source():
+    calls = []
+    try:
+        configure_pdf_hedging(0.5)
+        with mock.patch.object(pdf, 'publicationserver_fetch_pdf', fetcher(b'%PDF-EPO')), \
+             mock.patch.object(pdf, 'ops_build_pdf', fetcher(b'%PDF-OPS', calls=calls)):
+            response = pdf_universal('EP0666666B1')
+    finally:
+        configure_pdf_hedging(None)
+
+    assert response.pdf == b'%PDF-EPO'
+    assert response.datasource == 'epo-publication-server'
+    assert calls == []
+
+
+def test_pdf_universal_hedged_failing_source():
+    try:
+        configure_pdf_hedging(10)
+        with mock.patch.object(pdf, 'uspto_fetch_pdf', mock.Mock(side_effect=HTTPNotFound())), \
+             mock.patch.object(pdf, 'ops_build_pdf', fetcher(b'%PDF-OPS')):
+            response = pdf_universal('US5000000A')
+    finally:
+        configure_pdf_hedging(None)
+
+    # The OPS attempt starts right away when the direct data sources failed.
+    assert response.pdf == b'%PDF-OPS'
+    assert response.datasource == 'epo-ops'
+
+
+def test_pdf_universal_hedged_cancel_ops():
+    pages = []
+
+    def fetch_page(patent, page_number):
+        pages.append(page_number)
+        time.sleep(0.05)
+        return b'%PDF-PAGE'
+
+    image_info = {'FullDocument': {'@number-of-pages': '20'}}
+    try:
+        configure_pdf_hedging(0.05)
+        with mock.patch.object(pdf, 'publicationserver_fetch_pdf', fetcher(b'%PDF-EPO', delay=0.3)), \
+             mock.patch.object(api, 'inquire_images', mock.Mock(return_value=image_info)), \
+             mock.patch.object(api, 'get_ops_image_pdf', fetch_page), \
+             mock.patch.object(api, 'get_ops_client') as get_ops_client:
+            get_ops_client.return_value.max_concurrency = 1
+            response = pdf_universal('EP0999999B1')
+            time.sleep(0.3)
+    finally:
+        configure_pdf_hedging(None)
+
+    assert response.pdf == b'%PDF-EPO'
+    assert response.datasource == 'epo-publication-server'
+
+    # The OPS attempt stops fetching pages when the direct data source delivered.
+    assert 0 < len(pages) < 20
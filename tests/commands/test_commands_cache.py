@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import mock
+
+from patzilla.access.commands import PREFETCHERS, read_numbers, read_queries, warm_cache
+
+
+def test_read_numbers():
+    assert read_numbers("EP666666B1, EP0666666\nfoobar\n\n") == ["EP0666666B1", "EP0666666"]
+
+
+def test_read_queries():
+    assert read_queries("pa=siemens\n\n# Wind energy\n  txt=wind  \n") == ["pa=siemens", "txt=wind"]
+
+
+def test_warm_cache():
+    calls = []
+
+    def prefetch(document):
+        calls.append(document)
+        if document == "EP666666A2":
+            raise KeyError(document)
+
+    progress = []
+    with mock.patch.dict(PREFETCHERS, {"claims": prefetch, "description": prefetch}):
+        report = warm_cache(
+            ["EP666666A2", "EP666666B1"], artifacts=["claims", "description"], max_workers=2,
+            progress=lambda document, artifact, success: progress.append((document, artifact, success)))
+
+    assert sorted(calls) == ["EP666666A2", "EP666666A2", "EP666666B1", "EP666666B1"]
+    assert report == {"claims": {"success": 1, "failed": 1}, "description": {"success": 1, "failed": 1}}
+    assert ("EP666666A2", "claims", False) in progress
+    assert len(progress) == 4
+
+
+def test_warm_cache_kindcodes_bulk():
+    with mock.patch("patzilla.access.commands.ops_document_kindcodes_many") as bulk, \
+            mock.patch.dict(PREFETCHERS, {"kindcodes": lambda document: None}):
+        report = warm_cache(["EP666666A2", "EP666666B1"], artifacts=["kindcodes"], max_workers=2)
+
+    # Kind codes are acquired in bulk before the individual requests.
+    bulk.assert_called_once_with(["EP666666A2", "EP666666B1"])
+    assert report == {"kindcodes": {"success": 2, "failed": 0}}
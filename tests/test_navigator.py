@@ -5,6 +5,7 @@ import pytest
 
 from pyramid import testing
 
+from patzilla.navigator.services.admin import cache_stats_handler
 from patzilla.navigator.views import navigator_standalone
 from patzilla.util.web.identity.service import identity_auth_handler, identity_pwhash_handler
 
@@ -87,6 +88,12 @@ class TestNavigatorStandalone:
         request.errors.add.assert_called_once_with('identity subsystem', 'authentication-failed', 'Incomplete credentials')
         assert response is None
 
+    def test_cache_stats(self):
+        request = testing.DummyRequest()
+        response = cache_stats_handler(request)
+        assert sorted(response.keys()) == ['local', 'memory', 'regions']
+        assert 'max_bytes' in response['memory']
+
 @pytest.mark.forked
 def test_navigator_app(app_environment):
     registry = app_environment["registry"]
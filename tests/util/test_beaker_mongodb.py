@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import datetime
+import time
+import uuid
+
+import pymongo
+import pytest
+from beaker.cache import Cache, clsmap
+
+from patzilla.util.database.beaker_mongodb import MongoNamespaceManager, register_backend, _is_expired, \
+    migrate_expiration, migrate_regions
+
+MONGODB_URL = 'mongodb://localhost:27017/beaker_testing.cache'
+
+
+@pytest.fixture(scope='module')
+def mongodb_url():
+    client = pymongo.MongoClient(MONGODB_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip('MongoDB is not available')
+    return MONGODB_URL
+
+
+def test_is_expired():
+    now = datetime.datetime.utcnow()
+    assert _is_expired({'expires_at': now - datetime.timedelta(seconds=1)})
+    assert not _is_expired({'expires_at': now + datetime.timedelta(seconds=60)})
+    assert not _is_expired({})
+
+
+def test_mongodb_set_get(mongodb_url):
+    manager = MongoNamespaceManager('test-{}'.format(uuid.uuid4().hex), url=mongodb_url)
+    manager.set_value('foo', 'bar', expiretime=60)
+    assert 'foo' in manager
+    assert manager['foo'] == 'bar'
+    assert manager.keys() == ['foo']
+
+    entry = manager.db.backer_cache.find_one({'_id': manager._format_key('foo')})
+    assert entry['expires_at'] > datetime.datetime.utcnow()
+
+    manager.do_remove()
+    assert 'foo' not in manager
+
+
+def test_mongodb_expired(mongodb_url):
+    manager = MongoNamespaceManager('test-{}'.format(uuid.uuid4().hex), url=mongodb_url)
+    manager.set_value('foo', 'bar', expiretime=-1)
+
+    # Expired entries are not served, even when MongoDB did not remove them yet.
+    assert 'foo' not in manager
+    with pytest.raises(KeyError):
+        manager['foo']
+
+
+def test_mongodb_indexes(mongodb_url):
+    manager = MongoNamespaceManager('test-{}'.format(uuid.uuid4().hex), url=mongodb_url)
+    assert manager.db.backer_cache.index_information()['expires_at_ttl']['expireAfterSeconds'] == 0
+    assert 'timestamp_ttl' in manager.db.beaker_locks.index_information()
+
+
+def test_mongodb_migrate_expiration(mongodb_url):
+    manager = MongoNamespaceManager('test-{}'.format(uuid.uuid4().hex), url=mongodb_url)
+    key = manager._format_key('legacy')
+    expiration = int(time.time()) + 60
+    manager.db.backer_cache.insert_one({'_id': key, 'expiration': expiration})
+
+    # Legacy entries get their expiration time converted, so the TTL index applies.
+    assert migrate_expiration(manager.db) >= 1
+    entry = manager.db.backer_cache.find_one({'_id': key})
+    assert entry['expires_at'] == datetime.datetime.utcfromtimestamp(expiration)
+    assert 'expiration' not in entry
+    manager.do_remove()
+
+
+def test_mongodb_migrate_regions(mongodb_url):
+    manager = MongoNamespaceManager('test-{}'.format(uuid.uuid4().hex), url=mongodb_url)
+    manager.db.backer_cache.insert_one({'_id': manager._format_key('legacy'), 'expiration': int(time.time()) + 60})
+
+    regions = {'search': {'type': 'compressed', 'backend_type': 'mongodb', 'url': mongodb_url}, 'static': {'type': 'file'}}
+    report = migrate_regions(regions)
+    assert list(report) == [manager.db.name]
+    assert report[manager.db.name] >= 1
+    manager.do_remove()
+
+
+def test_register_backend():
+    register_backend()
+    assert clsmap['mongodb'] is MongoNamespaceManager
+
+
+def test_mongodb_cache_type(mongodb_url):
+    register_backend()
+    cache = Cache('test-{}'.format(uuid.uuid4().hex), type='mongodb', url=mongodb_url, expire=60)
+    cache.put('foo', 'bar')
+    assert cache.get('foo') == 'bar'
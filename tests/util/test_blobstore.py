@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import os
+
+import pytest
+from beaker.cache import cache_regions
+from pyramid import testing
+
+from patzilla.util.cache import blobstore
+from patzilla.util.cache.blobstore import Blob, BlobStore, blob_cache, blob_payload, configure_blob_store
+from patzilla.util.cache.instrumentation import cache_region
+from patzilla.util.web.pyramid.renderer import PdfRenderer
+
+
+PDF = b'%PDF-1.4 foobar' * 1000
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def store(tmpdir):
+    previous = blobstore.blob_store
+    yield configure_blob_store(str(tmpdir))
+    blobstore.blob_store = previous
+
+
+def test_blobstore_put_get(tmpdir):
+    store = BlobStore(str(tmpdir))
+    blob = store.put('pdf-ops', 'EP666666B1', PDF, content_type='application/pdf')
+    assert blob.size == len(PDF)
+    assert blob.read() == PDF
+
+    blob = store.get('pdf-ops', 'EP666666B1')
+    assert blob.content_type == 'application/pdf'
+    assert blob.path.startswith(str(tmpdir.join('objects')))
+    assert blob.read() == PDF
+
+    with pytest.raises(KeyError):
+        store.get('pdf-ops', 'EP123456A1')
+    with pytest.raises(KeyError):
+        store.get('drawing', 'EP666666B1')
+
+    # No temporary files are left behind.
+    assert os.listdir(str(tmpdir.join('tmp'))) == []
+
+
+def test_blobstore_deduplicate(tmpdir):
+    store = BlobStore(str(tmpdir))
+    first = store.put('pdf-ops', 'EP666666A2', PDF)
+    second = store.put('pdf-ops', 'EP666666B1', PDF)
+    assert first.path == second.path
+    assert len(list(blobstore.walk_files(str(tmpdir.join('objects'))))) == 1
+
+
+def test_blobstore_expire(tmpdir):
+    clock = FakeClock()
+    store = BlobStore(str(tmpdir), expire=60, clock=clock.time)
+    store.put('pdf-ops', 'EP666666A2', PDF)
+    store.put('pdf-ops', 'EP666666B1', b'%PDF-1.4 other')
+    clock.now += 30
+    store.put('pdf-ops', 'EP666666A2', PDF)
+    clock.now += 30
+
+    # Expired references are treated as misses.
+    assert store.get('pdf-ops', 'EP666666A2').read() == PDF
+    with pytest.raises(KeyError):
+        store.get('pdf-ops', 'EP666666B1')
+
+    # Pruning removes expired references and payloads which are not referenced any longer.
+    store.prune()
+    assert len(list(blobstore.walk_files(str(tmpdir.join('objects'))))) == 1
+    assert len(list(blobstore.walk_files(str(tmpdir.join('refs'))))) == 1
+
+
+calls = []
+
+
+@blob_cache('drawing', content_type='image/png')
+def fetch_drawing(document, page):
+    calls.append((document, page))
+    return b'\x89PNG' + document.encode() + str(page).encode()
+
+
+def test_blob_cache_disabled():
+    del calls[:]
+    assert fetch_drawing('EP666666B1', 1) == b'\x89PNGEP666666B11'
+    assert fetch_drawing('EP666666B1', 1) == b'\x89PNGEP666666B11'
+    assert len(calls) == 2
+
+
+def test_blob_cache(store):
+    del calls[:]
+    blob = fetch_drawing('EP666666B1', 1)
+    assert isinstance(blob, Blob)
+    assert blob_payload(blob) == b'\x89PNGEP666666B11'
+
+    # Additional arguments are part of the variant.
+    assert blob_payload(fetch_drawing('EP666666B1', 2)) == b'\x89PNGEP666666B12'
+    assert blob_payload(fetch_drawing('EP666666B1', 1)) == b'\x89PNGEP666666B11'
+    assert calls == [('EP666666B1', 1), ('EP666666B1', 2)]
+
+    # Arguments passed by keyword share the blobs of positional ones.
+    assert blob_payload(fetch_drawing('EP666666B1', page=2)) == b'\x89PNGEP666666B12'
+    assert calls == [('EP666666B1', 1), ('EP666666B1', 2)]
+
+
+@blob_cache('pdf-test', content_type='application/pdf')
+@cache_region('blob-test')
+def fetch_pdf(document):
+    calls.append(document)
+    return PDF
+
+
+def test_blob_cache_region_expire(store):
+    cache_regions['blob-test'] = {'type': 'memory', 'expire': 60, 'enabled': True, 'key_length': 250}
+    clock = FakeClock()
+    store.clock = clock.time
+    del calls[:]
+    try:
+        assert blob_payload(fetch_pdf('EP666666B1')) == PDF
+        clock.now += 30
+        assert blob_payload(fetch_pdf('EP666666B1')) == PDF
+        assert calls == ['EP666666B1']
+
+        # Blobs expire along with the cache region of the decorated function.
+        clock.now += 30
+        assert blob_payload(fetch_pdf('EP666666B1')) == PDF
+        assert calls == ['EP666666B1', 'EP666666B1']
+    finally:
+        del cache_regions['blob-test']
+
+
+def test_render_blob(store):
+    blob = store.put('pdf-ops', 'EP666666B1', PDF)
+    request = testing.DummyRequest()
+    body = PdfRenderer(None)(blob, {'request': request})
+    assert request.response.content_type == 'application/pdf'
+    assert request.response.content_length == len(PDF)
+    assert b''.join(body) == PDF
+
+
+def test_render_blob_accel_redirect(store):
+    store.accel_redirect = '/_blobs'
+    blob = store.put('pdf-ops', 'EP666666B1', PDF)
+    request = testing.DummyRequest()
+    body = PdfRenderer(None)(blob, {'request': request})
+    assert body == b''
+    assert request.response.headers['X-Accel-Redirect'] == '/_blobs/objects/{}/{}/{}'.format(
+        blob.digest[:2], blob.digest[2:4], blob.digest)
@@ -0,0 +1,598 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import copy
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pytest
+from beaker.cache import Cache, cache_region, cache_regions
+from pyramid.httpexceptions import HTTPNotFound, HTTPBadGateway
+
+from patzilla.access.generic.exceptions import NoResultsException
+from patzilla.boot.cache import configure_cache_backend
+from patzilla.util.data.container import SmartMunch
+from patzilla.util.cache.instrumentation import cache_region as instrumented_cache_region, cache_statistics
+from patzilla.util.cache.compression import CompressedPayload, compress_value, configure_compression, \
+    decompress_value
+from patzilla.util.cache.keys import canonical_cache_region
+from patzilla.util.cache.local import LocalCache, configure_local_cache, local_cache_stats
+from patzilla.util.cache.memory import MemoryBudget, configure_memory_backend, estimate_size, memory_usage
+from patzilla.util.cache.negative import negative_cache
+from patzilla.util.cache.region import region_get, region_key, region_put
+from patzilla.util.cache.serializer import SERIALIZER_MAGIC, StaleFormat, configure_serializer, \
+    deserialize_value, serialize_value
+from patzilla.util.cache.singleflight import single_flight
+from patzilla.util.cache.stale import stale_while_revalidate, refreshing
+
+# The cache backend may persist across test runs, so use distinct arguments each time.
+RUN = uuid.uuid4().hex
+
+calls = []
+
+
+@negative_cache(NoResultsException, HTTPNotFound, HTTPBadGateway)
+@cache_region('medium')
+def lookup(name, kind='foo'):
+    calls.append(name)
+    if name.startswith('absent'):
+        raise NoResultsException('No results', data={'name': name})
+    if name.startswith('missing'):
+        raise HTTPNotFound('Not found: {}'.format(name))
+    if name.startswith('broken'):
+        raise HTTPBadGateway('Broken: {}'.format(name))
+    if name.startswith('failing'):
+        raise ValueError('Failing: {}'.format(name))
+    if name.startswith('copies'):
+        return {'name': [name]}
+    return name.upper()
+
+
+def lookup_count(name, *args, **kwargs):
+    del calls[:]
+    for _ in range(3):
+        try:
+            lookup(name, *args, **kwargs)
+        except Exception:
+            pass
+    return len(calls)
+
+
+def test_negative_cache_success():
+    assert lookup('hello-' + RUN) == 'HELLO-' + RUN.upper()
+    assert lookup_count('hello-' + RUN) == 0
+
+
+def test_negative_cache_absent():
+    with pytest.raises(NoResultsException) as ex:
+        lookup('absent-' + RUN)
+    assert ex.value.data == {'name': 'absent-' + RUN}
+
+    # The exception is replayed without invoking the function again.
+    assert lookup_count('absent-' + RUN) == 0
+    with pytest.raises(NoResultsException) as ex:
+        lookup('absent-' + RUN)
+    assert ex.value.data == {'name': 'absent-' + RUN}
+
+
+def test_negative_cache_not_found():
+    with pytest.raises(HTTPNotFound) as ex:
+        lookup('missing-' + RUN, kind='bar')
+    assert lookup_count('missing-' + RUN, kind='bar') == 0
+    assert ex.match('Not found: missing')
+
+    # Other arguments are not affected.
+    assert lookup_count('missing-' + RUN, kind='baz') == 1
+
+
+def test_negative_cache_other_errors():
+    # Only "404 Not Found" is remembered.
+    assert lookup_count('broken-' + RUN) == 3
+
+    # Exceptions not designated are not remembered.
+    assert lookup_count('failing-' + RUN) == 3
+
+
+def test_region_put_get():
+    region_put(lookup, ('other-' + RUN,), 'value')
+    assert region_get(lookup, ('other-' + RUN,)) == 'value'
+    assert lookup('other-' + RUN) == 'value'
+
+    region_put(lookup, ('other-' + RUN,), 'value-bar', kwargs={'kind': 'bar'})
+    assert lookup('other-' + RUN, kind='bar') == 'value-bar'
+
+    with pytest.raises(KeyError):
+        region_get(lookup, ('unknown-' + RUN,))
+
+
+flight_calls = []
+flight_started = threading.Event()
+flight_release = threading.Event()
+
+
+@single_flight
+@cache_region('medium')
+def slow_lookup(name):
+    flight_calls.append(name)
+    flight_started.set()
+    flight_release.wait(5)
+    if name.startswith('failing'):
+        raise ValueError('Failing: {}'.format(name))
+    if name.startswith('copies'):
+        return {'name': [name]}
+    return name.upper()
+
+
+def run_concurrently(name, count=5):
+    del flight_calls[:]
+    flight_started.clear()
+    flight_release.clear()
+    results = []
+
+    def worker():
+        try:
+            results.append(slow_lookup(name))
+        except Exception as ex:
+            results.append(ex)
+
+    threads = [threading.Thread(target=worker)]
+    threads[0].start()
+    flight_started.wait(5)
+    for _ in range(count - 1):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        threads.append(thread)
+
+    # Give the followers some time to join the computation in flight.
+    time.sleep(0.2)
+    flight_release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_success():
+    results = run_concurrently('flight-' + RUN)
+    assert flight_calls == ['flight-' + RUN]
+    assert results == ['FLIGHT-' + RUN.upper()] * 5
+
+
+def test_single_flight_failure():
+    results = run_concurrently('failing-' + RUN)
+    assert flight_calls == ['failing-' + RUN]
+    assert len(results) == 5
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_copies():
+    results = run_concurrently('copies-' + RUN)
+    assert flight_calls == ['copies-' + RUN]
+    assert all(result == {'name': ['copies-' + RUN]} for result in results)
+    results[0]['name'].append('modified')
+    assert all(result == {'name': ['copies-' + RUN]} for result in results[1:])
+    assert len(set(id(result['name']) for result in results)) == 5
+
+
+swr_calls = []
+
+
+@stale_while_revalidate
+@instrumented_cache_region('swr-test')
+def swr_lookup(name):
+    swr_calls.append(name)
+    return '{}-{}'.format(name, len(swr_calls))
+
+
+@pytest.fixture
+def swr_region():
+    cache_regions['swr-test'] = {
+        'type': 'memory', 'expire': 100, 'soft_expire': 10, 'enabled': True, 'key_length': 250}
+    del swr_calls[:]
+    yield Cache._get_cache(swr_lookup._arg_namespace, cache_regions['swr-test'])
+    del cache_regions['swr-test']
+
+
+def test_stale_while_revalidate_fresh(swr_region):
+    for _ in range(5):
+        assert swr_lookup('fresh') == 'fresh-1'
+    assert swr_calls == ['fresh']
+
+    # Hits are recorded within the cache statistics.
+    stats = cache_statistics()['swr-test'][swr_lookup._arg_namespace]
+    assert stats['hits'] == 4
+    assert stats['misses'] == 1
+
+
+def test_stale_while_revalidate_stale(swr_region):
+    swr_region._get_value('stale').set_value('stale-0', storedtime=time.time() - 50)
+
+    # The stale value is served right away, while being refreshed in the background.
+    assert swr_lookup('stale') == 'stale-0'
+    for _ in range(50):
+        if swr_region.get('stale') != 'stale-0' and not refreshing:
+            break
+        time.sleep(0.05)
+    assert swr_calls == ['stale']
+    assert swr_lookup('stale') == 'stale-1'
+
+
+def test_stale_while_revalidate_expired(swr_region):
+    swr_region._get_value('expired').set_value('expired-0', storedtime=time.time() - 200)
+
+    # Expired values are not served at all.
+    assert swr_lookup('expired') == 'expired-1'
+    assert swr_calls == ['expired']
+
+
+def test_compress_value():
+    value = {'text': 'foobar ' * 1000}
+    compressed = compress_value(value, codec='zlib', threshold=1024)
+    assert isinstance(compressed, CompressedPayload)
+    assert len(compressed.data) < 1024
+    assert decompress_value(compressed) == value
+
+    compressed = compress_value(value, codec='lzma', threshold=1024)
+    assert decompress_value(compressed) == value
+
+
+def test_compress_value_skip():
+    # Small payloads.
+    assert compress_value('foobar', threshold=1024) == 'foobar'
+
+    # Payloads already compressed.
+    pdf = b'%PDF-1.4' + b'\x00' * 4096
+    assert compress_value(pdf, threshold=1024) is pdf
+
+    # Values which have not been compressed are passed through.
+    assert decompress_value('foobar') == 'foobar'
+
+
+@cache_region('compression-test')
+def compressed_lookup(name):
+    return name * 1000
+
+
+def test_compression_region():
+    regions = {'compression-test': {
+        'type': 'memory', 'compression': 'zlib', 'compression_threshold': '100', 'enabled': True, 'key_length': 250}}
+    configure_compression(regions)
+    assert regions['compression-test']['type'] == 'compressed'
+    assert regions['compression-test']['backend_type'] == 'memory'
+
+    cache_regions.update(regions)
+    try:
+        assert compressed_lookup('foo-' + RUN) == ('foo-' + RUN) * 1000
+        cache = Cache._get_cache(compressed_lookup._arg_namespace, cache_regions['compression-test'])
+
+        # The payload is stored in compressed form.
+        storedtime, expiretime, value = cache.namespace.backend.dictionary[('foo-' + RUN).encode()]
+        assert isinstance(value, CompressedPayload)
+
+        assert cache.get('foo-' + RUN) == ('foo-' + RUN) * 1000
+        assert compressed_lookup('foo-' + RUN) == ('foo-' + RUN) * 1000
+    finally:
+        del cache_regions['compression-test']
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_local_cache_bounds():
+    cache = LocalCache(max_entries=2, max_bytes=1000)
+    cache.put('a', 'a')
+    cache.put('b', 'b')
+    assert cache.get('a') == 'a'
+
+    # The least recently used entry is evicted.
+    cache.put('c', 'c')
+    with pytest.raises(KeyError):
+        cache.get('b')
+    assert cache.get('a') == 'a'
+
+    # Entries larger than the whole cache are not stored, large entries evict others.
+    cache.put('large', 'x' * 2000)
+    with pytest.raises(KeyError):
+        cache.get('large')
+    cache.put('medium', 'x' * 940)
+    assert cache.get('medium') == 'x' * 940
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['bytes'] <= 1000
+
+
+def test_local_cache_expire():
+    clock = FakeClock()
+    cache = LocalCache(max_entries=10, expire=60, clock=clock.time)
+    cache.put('a', 'a')
+    clock.now += 30
+    assert cache.get('a') == 'a'
+    clock.now += 30
+    with pytest.raises(KeyError):
+        cache.get('a')
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_local_cache_entries():
+    # Like with Beaker's memory backend, entries are served as they are.
+    cache = LocalCache(max_entries=10)
+    value = {'name': ['foo']}
+    cache.put('a', value)
+    assert cache.get('a') is value
+
+
+local_calls = []
+
+
+@instrumented_cache_region('local-test')
+def local_lookup(name):
+    local_calls.append(name)
+    return name.upper()
+
+
+def test_local_cache_region():
+    regions = {'local-test': {
+        'type': 'memory', 'local_max_entries': '100', 'enabled': True, 'key_length': 250}}
+    configure_local_cache(regions)
+    assert regions['local-test']['type'] == 'local'
+    assert regions['local-test']['local_backend_type'] == 'memory'
+
+    cache_regions.update(regions)
+    name = 'foo-' + RUN
+    try:
+        assert local_lookup(name) == name.upper()
+        cache = Cache._get_cache(local_lookup._arg_namespace, cache_regions['local-test'])
+
+        # Entries are served from the in-process cache, even when the backend lost them.
+        cache.namespace.backend.dictionary.clear()
+        assert local_lookup(name) == name.upper()
+        assert local_calls == [name]
+        assert local_cache_stats()['local-test']['hits'] == 1
+
+        # Clearing the cache also clears the in-process cache.
+        cache.clear()
+        assert local_lookup(name) == name.upper()
+        assert local_calls == [name, name]
+    finally:
+        del cache_regions['local-test']
+
+
+search_calls = []
+
+
+@canonical_cache_region('search', 'canonical_test')
+def canonical_search(query, options=None):
+    search_calls.append(query)
+    return len(search_calls)
+
+
+def test_canonical_cache_region():
+    term = 'foo' + RUN
+    query = 'pa=siemens and ti=({} or bar)'.format(term)
+    result = canonical_search(query, {'limit': 50, 'offset': 0})
+
+    # Whitespace, case of boolean operators and the order of options do not matter.
+    assert canonical_search('pa=siemens  AND ti=({} OR bar) '.format(term), {'offset': 0, 'limit': 50}) == result
+    assert canonical_search(query=query, options={'limit': 50, 'offset': 0}) == result
+    assert search_calls == [query]
+
+    # Different queries or options do not share cache entries.
+    assert canonical_search(query, {'limit': 50, 'offset': 50}) != result
+    assert canonical_search(query + ' and pa=bosch', {'limit': 50, 'offset': 0}) != result
+
+    # Keys have a fixed length and are reproduced by the region helpers.
+    key = region_key(canonical_search._arg_namespace, 'search', (query * 100, None), func=canonical_search)
+    assert len(key) == 40
+    assert region_get(canonical_search, (query, {'limit': 50, 'offset': 0})) == result
+
+
+def test_serialize_value():
+    value = {'foo': [1, 2.5, 'bär', None, {'bar': True}]}
+    payload = serialize_value(value)
+    assert payload.startswith(SERIALIZER_MAGIC)
+    assert pickle.dumps(value) not in payload
+    assert deserialize_value(payload) == value
+
+    # SmartMunch trees are restored as such.
+    value = SmartMunch.munchify({'meta': {'count': 42}, 'numbers': ['EP666666B1']})
+    restored = deserialize_value(serialize_value(value))
+    assert isinstance(restored, SmartMunch)
+    assert restored.meta.count == 42
+
+    # Other values are pickled.
+    value = {'foo': (1, 2), 'bar': b'\x00'}
+    assert deserialize_value(serialize_value(value)) == value
+
+    # Values which would not survive a round trip through JSON unchanged are pickled.
+    for value in [{1: 'foo'}, {'foo': (1, 2)}, {'foo': OrderedDict(bar=1)}]:
+        assert repr(deserialize_value(serialize_value(value))) == repr(value)
+
+    # Values which have not been serialized are passed through.
+    assert deserialize_value('foobar') == 'foobar'
+
+
+def test_deserialize_stale_format():
+    payload = serialize_value({'foo': 'bar'})
+    version = len(SERIALIZER_MAGIC)
+    with pytest.raises(StaleFormat):
+        deserialize_value(payload[:version] + b'\xff' + payload[version + 1:])
+    with pytest.raises(StaleFormat):
+        deserialize_value(payload[:-3])
+
+
+serializer_calls = []
+
+
+@cache_region('serializer-test')
+def serialized_lookup(name):
+    serializer_calls.append(name)
+    return {'name': name, 'count': len(serializer_calls)}
+
+
+def test_serializer_region():
+    regions = {'serializer-test': {
+        'type': 'memory', 'serializer': 'json', 'enabled': True, 'key_length': 250}}
+    configure_serializer(regions)
+    assert regions['serializer-test']['type'] == 'serialized'
+    assert regions['serializer-test']['serializer_backend_type'] == 'memory'
+
+    cache_regions.update(regions)
+    name = 'foo-' + RUN
+    try:
+        assert serialized_lookup(name) == {'name': name, 'count': 1}
+        cache = Cache._get_cache(serialized_lookup._arg_namespace, cache_regions['serializer-test'])
+
+        # The payload is stored in serialized form.
+        storedtime, expiretime, value = cache.namespace.backend.dictionary[name.encode()]
+        assert value.startswith(SERIALIZER_MAGIC)
+        assert serialized_lookup(name) == {'name': name, 'count': 1}
+
+        # Entries in a format which is not supported any longer are treated as misses.
+        cache.namespace.backend.dictionary[name.encode()] = (storedtime, expiretime, SERIALIZER_MAGIC + b'\x00')
+        assert serialized_lookup(name) == {'name': name, 'count': 2}
+    finally:
+        del cache_regions['serializer-test']
+
+
+@pytest.fixture
+def restore_regions():
+    regions = copy.deepcopy(dict(cache_regions))
+    yield
+    cache_regions.clear()
+    cache_regions.update(regions)
+
+
+def test_cache_backend_routing(restore_regions, tmpdir):
+    configure_cache_backend("memory", cache_directory=str(tmpdir), routing={"static": "filesystem", "longer": "filesystem"})
+    assert sorted(cache_regions.keys()) == ['longer', 'medium', 'negative', 'search', 'static']
+
+    # Compression is disabled by default.
+    assert cache_regions['static']['type'] == 'file'
+
+    configure_cache_backend(
+        "memory", cache_directory=str(tmpdir), routing={"static": "filesystem", "longer": "filesystem"},
+        compression="zlib")
+
+    assert cache_regions['search']['type'] == 'bounded_memory'
+    assert cache_regions['search']['memory_region'] == 'search'
+    assert cache_regions['static']['type'] == 'compressed'
+    assert cache_regions['static']['backend_type'] == 'file'
+    assert cache_regions['longer']['data_dir'] == str(tmpdir.join('data'))
+    assert cache_regions['longer']['expire'] == 604800
+
+
+def test_memory_budget_quota():
+    budget = MemoryBudget(max_bytes=10000)
+    budget.region('search', quota=estimate_size(b'x' * 1000) * 2)
+    budget.put('search', 'a', b'x' * 1000)
+    budget.put('search', 'b', b'x' * 1000)
+    assert budget.get('search', 'a') == b'x' * 1000
+
+    # The least recently used entry of the region is evicted when it exceeds its quota.
+    budget.put('search', 'c', b'x' * 1000)
+    assert not budget.contains('search', 'b')
+    assert budget.contains('search', 'a')
+    assert budget.usage()['regions']['search']['entries'] == 2
+    assert budget.usage()['regions']['search']['evictions'] == 1
+
+    # Entries larger than the quota are not stored.
+    budget.put('search', 'large', b'x' * 5000)
+    assert not budget.contains('search', 'large')
+
+
+def test_memory_budget_global():
+    size = estimate_size(b'x' * 1000)
+    budget = MemoryBudget(max_bytes=size * 3)
+    budget.put('static', 'a', b'x' * 1000)
+    budget.put('search', 'b', b'x' * 1000)
+    budget.put('static', 'c', b'x' * 1000)
+    assert budget.get('static', 'a') == b'x' * 1000
+
+    # The least recently used entry across all regions is evicted.
+    budget.put('medium', 'd', b'x' * 1000)
+    assert not budget.contains('search', 'b')
+    assert budget.usage()['bytes'] == size * 3
+
+    # Reducing the budget evicts entries.
+    budget.max_bytes = size
+    budget.shrink()
+    assert budget.usage()['regions']['static']['entries'] == 0
+    assert budget.contains('medium', 'd')
+
+
+memory_calls = []
+
+
+@cache_region('memory-test')
+def memory_lookup(name):
+    memory_calls.append(name)
+    return name.upper()
+
+
+def test_bounded_memory_region():
+    regions = {'memory-test': {
+        'type': 'bounded_memory', 'memory_quota': '1000000', 'enabled': True, 'key_length': 250}}
+    configure_memory_backend(regions)
+    assert regions['memory-test']['memory_region'] == 'memory-test'
+
+    cache_regions.update(regions)
+    name = 'foo-' + RUN
+    try:
+        assert memory_lookup(name) == name.upper()
+        assert memory_lookup(name) == name.upper()
+        assert memory_calls == [name]
+        usage = memory_usage()['regions']['memory-test']
+        assert usage['entries'] == 1
+        assert usage['quota'] == 1000000
+        assert usage['bytes'] > 0
+
+        # Clearing the cache releases its entries.
+        Cache._get_cache(memory_lookup._arg_namespace, cache_regions['memory-test']).clear()
+        assert memory_usage()['regions']['memory-test']['bytes'] == 0
+        assert memory_lookup(name) == name.upper()
+        assert memory_calls == [name, name]
+    finally:
+        del cache_regions['memory-test']
+
+
+instrumented_calls = []
+
+
+@instrumented_cache_region('instrumentation-test', 'lookup')
+def instrumented_lookup(name, fail=False):
+    instrumented_calls.append(name)
+    if fail:
+        raise ValueError(name)
+    return name.upper()
+
+
+def test_cache_region_instrumentation():
+    cache_regions['instrumentation-test'] = {'type': 'memory', 'expire': 100, 'enabled': True, 'key_length': 250}
+    name = 'foo-' + RUN
+    try:
+        assert instrumented_lookup(name) == name.upper()
+        assert instrumented_lookup(name) == name.upper()
+        with pytest.raises(ValueError):
+            instrumented_lookup('bar-' + RUN, fail=True)
+        assert instrumented_calls == [name, 'bar-' + RUN]
+
+        stats = cache_statistics()['instrumentation-test'][instrumented_lookup._arg_namespace]
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+        assert stats['errors'] == 1
+        assert stats['bytes_stored'] > 0
+        assert stats['compute_time'] > 0
+
+        # Cache keys are compatible with Beaker's decorator.
+        assert instrumented_lookup._arg_key((name,), {}) == 'lookup ' + name
+        assert instrumented_lookup._arg_key((name,), {'fail': False}) == 'lookup ' + name + ' False'
+        assert region_get(instrumented_lookup, (name,)) == name.upper()
+    finally:
+        del cache_regions['instrumentation-test']
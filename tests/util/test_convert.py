@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# (c) 2022 Andreas Motl <andreas.motl@ip-tools.org>
+import os
+from io import BytesIO
+
+import pytest
+
+from PIL import Image
+
+from patzilla.util.image import convert
+from patzilla.util.image.convert import configure_image_pool, get_image_pool, pdf_assemble, pdf_bookmarks, pdf_join, \
+    png_resize, to_image, to_png
+
+pypdf = pytest.importorskip("pypdf")
+
+
+def make_pdf(width):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=width, height=842)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_pdf_join():
+    pages = [make_pdf(500), make_pdf(600)]
+    reader = pypdf.PdfReader(BytesIO(pdf_join(pages)))
+    assert [int(page.mediabox.width) for page in reader.pages] == [500, 600]
+
+
+def test_pdf_assemble():
+    pages = [make_pdf(500), make_pdf(600), make_pdf(700)]
+    sections = [
+        {'@name': 'BIBLIOGRAPHY', '@start-page': '1'},
+        {'@name': 'SEARCH_REPORT', '@start-page': '3'},
+    ]
+    reader = pypdf.PdfReader(BytesIO(pdf_assemble(pages, 'EP0666666B1', 'ip-navigator:digi42', sections)))
+    assert len(reader.pages) == 3
+    assert reader.metadata.title == 'EP0666666B1'
+    assert reader.metadata.producer == 'ip-navigator:digi42'
+    assert [(item.title, reader.get_destination_page_number(item)) for item in reader.outline] == \
+        [('Bibliography', 0), ('Search-report', 2)]
+
+
+def test_pdf_bookmarks():
+    assert pdf_bookmarks({'@name': 'DRAWINGS', '@start-page': '4'}) == [('Drawings', 4)]
+    assert pdf_bookmarks(None) == []
+
+
+def make_tiff():
+    image = Image.new('1', (1000, 1400), color=1)
+    image.paste(0, (100, 100, 900, 200))
+    buffer = BytesIO()
+    image.save(buffer, 'TIFF', compression='group4')
+    return buffer.getvalue()
+
+
+def test_to_png():
+    png = Image.open(to_png(BytesIO(make_tiff())))
+    assert png.format == 'PNG'
+    assert png.size == (1000, 1400)
+
+
+def test_to_png_resize():
+    png = Image.open(to_png(make_tiff(), width=300))
+    assert png.size == (300, 420)
+    assert png.mode == 'L'
+
+
+def test_to_png_pool():
+    try:
+        configure_image_pool(1)
+        assert convert.image_pools == {}
+        png = Image.open(to_png(make_tiff(), width=100, height=100))
+        assert png.size == (71, 100)
+
+        # The pool is created on first use, for the current process.
+        assert list(convert.image_pools) == [os.getpid()]
+        assert get_image_pool() is convert.image_pools[os.getpid()]
+    finally:
+        configure_image_pool(None)
+    assert convert.image_pools == {}
+    assert get_image_pool() is None
+
+
+# WebP has no grayscale mode, decoders will yield RGB images.
+@pytest.mark.parametrize("format,pillow_format,mode", [("png", "PNG", "L"), ("webp", "WEBP", "RGB"), ("jpeg", "JPEG", "L")])
+def test_to_image(format, pillow_format, mode):
+    image = Image.open(BytesIO(to_image(make_tiff(), format=format, width=150)))
+    assert image.format == pillow_format
+    assert image.size == (150, 210)
+    assert image.mode == mode
+
+
+def test_png_resize():
+    png = to_png(make_tiff()).read()
+    image = Image.open(BytesIO(png_resize(png, 500)))
+    assert image.size == (500, 700)
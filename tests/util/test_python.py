@@ -1,8 +1,14 @@
 import re
+import threading
+import time
 
 import pytest
+from cornice.errors import Errors
+from pyramid.request import Request
+from pyramid.threadlocal import get_current_request, manager
 
 from patzilla.util.python import exception_traceback
+from patzilla.util.python.concurrency import concurrent_map, iterate_with_threadlocals, with_threadlocals
 from patzilla.util.python.decorators import memoize
 from patzilla.util.python.system import run_command
 
@@ -50,3 +56,80 @@ def test_exception_traceback(capsys):
 
     assert "Traceback (most recent call last)" in output
     assert "NameError: name \'foobar\' is not defined" in output
+
+
+def test_concurrent_map_keeps_order():
+    def slow_square(number):
+        # Let earlier items finish last.
+        time.sleep(0.01 * (5 - number))
+        return number * number
+    assert concurrent_map(slow_square, range(5), max_workers=5) == [0, 1, 4, 9, 16]
+
+
+def test_concurrent_map_bounded():
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def work(item):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        return item
+
+    assert concurrent_map(work, range(10), max_workers=3) == list(range(10))
+    assert 1 < state["peak"] <= 3
+
+
+def test_concurrent_map_sequential():
+    threads = concurrent_map(lambda item: threading.current_thread(), range(3), max_workers=1)
+    assert threads == [threading.current_thread()] * 3
+
+
+def test_concurrent_map_propagates_threadlocals():
+    request = object()
+    manager.push({"request": request, "registry": None})
+    try:
+        results = concurrent_map(lambda item: get_current_request(), range(3), max_workers=3)
+    finally:
+        manager.pop()
+    assert results == [request] * 3
+
+
+def test_with_threadlocals_detach():
+    request = Request.blank("/")
+    request.errors = Errors()
+    request.errors.add("body", "foo", "bar")
+    manager.push({"request": request, "registry": None})
+    try:
+        func = with_threadlocals(get_current_request, detach=True)
+    finally:
+        manager.pop()
+    detached = concurrent_map(lambda item: func(), [1], max_workers=1)[0]
+    assert detached is not request
+    assert detached.environ is request.environ
+    assert len(detached.errors) == 0
+    assert len(request.errors) == 1
+
+
+def test_concurrent_map_failure():
+    def work(item):
+        if item == 2:
+            raise ValueError("Item {} failed".format(item))
+        return item
+    with pytest.raises(ValueError) as ex:
+        concurrent_map(work, range(5), max_workers=2)
+    assert ex.match("Item 2 failed")
+
+
+def test_iterate_with_threadlocals():
+    request = object()
+    manager.push({"request": request, "registry": None})
+    try:
+        iterator = iterate_with_threadlocals(get_current_request() for item in range(2))
+    finally:
+        manager.pop()
+    assert get_current_request() is None
+    assert list(iterator) == [request] * 2